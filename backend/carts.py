@@ -0,0 +1,109 @@
+import math
+import os
+from typing import List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+
+# New plannings derive their carts from total_quantity/batch_size instead of
+# pre-creating every CartLote row; a row is written only on checkout.
+LAZY_CART_GENERATION = os.getenv("LAZY_CART_GENERATION", "true").lower() in ("1", "true", "yes")
+
+
+class CartAlreadyCheckedOut(Exception):
+    """Another checkout created (and closed) the same lazy cart first."""
+
+
+def split_cart_quantities(total_qty: int, batch_size: int) -> List[int]:
+    """Pieces per cart (CartLote) for a planning: full carts, last one partial."""
+    num_lotes = math.ceil(total_qty / batch_size)
+    quantities = []
+    for i in range(num_lotes):
+        current_qty = batch_size
+        # If it's the last batch, check if it's partial
+        if (i + 1) * batch_size > total_qty:
+            current_qty = total_qty % batch_size
+            if current_qty == 0:
+                current_qty = batch_size
+        quantities.append(current_qty)
+    return quantities
+
+
+def planning_cart_quantities(planning: models.ProductionPlanning) -> List[int]:
+    """Cart sequence of a lazy planning, derived from its parameters."""
+    if not planning.batch_size or planning.batch_size <= 0 or not planning.total_quantity:
+        return []
+    return split_cart_quantities(planning.total_quantity, planning.batch_size)
+
+
+def list_planning_carts(db: Session, planning: models.ProductionPlanning) -> List[dict]:
+    """
+    Todos os carrinhos do planejamento, em ordem de sequência.
+
+    Lazy plannings mix the derived sequence with the rows already
+    materialized by checkout; pending lazy carts have id=None.
+    """
+    rows = db.query(models.CartLote).filter(
+        models.CartLote.planning_id == planning.id
+    ).order_by(models.CartLote.sequence_number).all()
+
+    carts = [
+        {
+            "id": c.id,
+            "planning_id": planning.id,
+            "sequence": c.sequence_number,
+            "status": c.status,
+            "quantity": c.quantity_pieces
+        } for c in rows
+    ]
+    if not planning.lazy_carts:
+        return carts
+
+    done = {c["sequence"] for c in carts}
+    for sequence, qty in enumerate(planning_cart_quantities(planning), start=1):
+        if sequence not in done:
+            carts.append({
+                "id": None,
+                "planning_id": planning.id,
+                "sequence": sequence,
+                "status": "Aguardando",
+                "quantity": qty
+            })
+    carts.sort(key=lambda c: c["sequence"])
+    return carts
+
+
+def count_planning_carts(db: Session, planning: models.ProductionPlanning) -> int:
+    if planning.lazy_carts:
+        return len(planning_cart_quantities(planning))
+    return db.query(models.CartLote).filter(models.CartLote.planning_id == planning.id).count()
+
+
+def materialize_cart(db: Session, planning: models.ProductionPlanning, sequence: int) -> Optional[models.CartLote]:
+    """
+    Creates the CartLote row of a lazy planning at checkout time.
+    None if the planning is not lazy or the sequence is outside it.
+    Raises CartAlreadyCheckedOut (after rolling back) when a concurrent
+    checkout inserted the same sequence first (uq_cart_lote_planning_sequence).
+    """
+    if not planning.lazy_carts:
+        return None
+    quantities = planning_cart_quantities(planning)
+    if sequence < 1 or sequence > len(quantities):
+        return None
+    cart = models.CartLote(
+        production_order_id=planning.production_order_id,
+        planning_id=planning.id,
+        sequence_number=sequence,
+        quantity_pieces=quantities[sequence - 1],
+        status="Aguardando"
+    )
+    db.add(cart)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise CartAlreadyCheckedOut(f"Cart {sequence} of planning {planning.id} already checked out")
+    return cart
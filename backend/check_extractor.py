@@ -0,0 +1,160 @@
+"""
+Regressão do parser local de PSO contra os PDFs de exemplo.
+
+Every PDF in 06_examples must parse with the local parser (no LLM call) and
+give exactly the JSON stored in 06_examples/expected/<ref>.json. A sheet that
+falls back (LowConfidenceParse) or differs from its golden fails (exit 1).
+
+Each golden is also checked against the sheet itself, read from the plain
+pypdf text and not from the positional parser: the ordem of the rows of the
+COSTURA sector (between the previous sector footer and the COSTURA footer)
+and the T.P. subtotal printed in that footer. The current goldens were
+verified this way, row by row and against the printed subtotals:
+
+    ref     ops  ordem   COSTURA subtotal
+    67019   16   15-30    6,4359
+    67073   19   10-28    8,5118
+    67555   14   16-29    5,9642
+    67582   26   14-39    9,6822
+    67806   22   14-35    9,7285
+    69636   40   15-54   22,6054
+    69823   25   16-40   10,3516
+
+After an intended parser change, regenerate the goldens with --update and
+review the diff (and bump extractor.LOCAL_PARSER_VERSION so the extraction
+cache misses). --update does not write a golden that fails that check.
+
+Uso:
+    python check_extractor.py
+    python check_extractor.py --update
+    python check_extractor.py --examples /path/to/pdfs
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+import extractor
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "06_examples")
+
+# Sector footer in the plain text: the name alone on a line, then the subtotal
+_SECTOR_FOOTER = re.compile(r"^([A-ZÇÃÂÉÊÍÓÕÚ][A-ZÇÃÂÉÊÍÓÕÚ /.-]+)[ \t]*\n(\d+,\d{4})[ \t]*$", re.M)
+# Start of an operation row: ordem, then the operation code (may end in a letter)
+_ROW_START = re.compile(r"^(\d+)\n\d+[A-Z]?\n(?=[^\n\d])", re.M)
+
+
+def golden_path(examples_dir: str, pdf_path: str) -> str:
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    ref = stem.rsplit(" - ", 1)[-1]
+    return os.path.join(examples_dir, "expected", f"{ref}.json")
+
+
+def sewing_sector(content: bytes):
+    """(ordem of the COSTURA rows, printed COSTURA subtotal) read from the plain PDF text."""
+    text = extractor.extract_text_from_pdf(content)
+    start = 0
+    for footer in _SECTOR_FOOTER.finditer(text):
+        if footer.group(1).strip() == "COSTURA":
+            rows = [int(ordem) for ordem in _ROW_START.findall(text, start, footer.start())]
+            return rows, float(footer.group(2).replace(",", "."))
+        start = footer.end()
+    return None
+
+
+def subtotal_problems(data: dict, sector) -> list:
+    """Differences between the operations of `data` and the sheet's own COSTURA sector."""
+    if sector is None:
+        return ["no COSTURA subtotal found in the PDF text"]
+    rows, subtotal = sector
+    ops = data.get("operacoes", [])
+    problems = []
+    if [op["ordem"] for op in ops] != rows:
+        problems.append(f"{len(ops)} ops, the COSTURA sector of the PDF has {len(rows)} rows")
+    total = round(sum(op["minutos_decimais"] for op in ops), 4)
+    if abs(total - subtotal) > 0.00005:
+        problems.append(f"T.P. sum {total} != COSTURA subtotal {subtotal}")
+    return problems
+
+
+def diff(expected: dict, actual: dict) -> list:
+    problems = []
+    for key in ("referencia", "produto"):
+        if expected.get(key) != actual.get(key):
+            problems.append(f"{key}: {expected.get(key)!r} != {actual.get(key)!r}")
+    expected_ops = {op["ordem"]: op for op in expected.get("operacoes", [])}
+    actual_ops = {op["ordem"]: op for op in actual.get("operacoes", [])}
+    for ordem in sorted(expected_ops.keys() - actual_ops.keys()):
+        problems.append(f"op {ordem}: missing")
+    for ordem in sorted(actual_ops.keys() - expected_ops.keys()):
+        problems.append(f"op {ordem}: unexpected")
+    for ordem in sorted(expected_ops.keys() & actual_ops.keys()):
+        for field, value in expected_ops[ordem].items():
+            if actual_ops[ordem].get(field) != value:
+                problems.append(f"op {ordem} {field}: {value!r} != {actual_ops[ordem].get(field)!r}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the local PSO parser against the example sheets")
+    parser.add_argument("--examples", default=EXAMPLES_DIR, help="Folder with the PDFs and expected/")
+    parser.add_argument("--update", action="store_true", help="Rewrite the goldens from the current parser")
+    args = parser.parse_args()
+
+    pdfs = sorted(glob.glob(os.path.join(args.examples, "*.pdf")))
+    if not pdfs:
+        print(f"No PDFs in {args.examples}")
+        return 1
+    failures = 0
+    for pdf_path in pdfs:
+        name = os.path.basename(pdf_path)
+        with open(pdf_path, "rb") as f:
+            content = f.read()
+        started = time.perf_counter()
+        try:
+            data = extractor.parse_sequence_sheet(content)
+        except extractor.LowConfidenceParse as e:
+            print(f"❌ {name}: would fall back to the LLM ({e})")
+            failures += 1
+            continue
+        ms = (time.perf_counter() - started) * 1000
+        expected_path = golden_path(args.examples, pdf_path)
+        sector = sewing_sector(content)
+
+        if args.update:
+            problems = subtotal_problems(data, sector)
+            if problems:
+                print(f"❌ {name}: golden not written, subtotal check failed: {'; '.join(problems)}")
+                failures += 1
+                continue
+            os.makedirs(os.path.dirname(expected_path), exist_ok=True)
+            with open(expected_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+                f.write("\n")
+            print(f"✏️ {name}: {len(data['operacoes'])} ops -> {os.path.relpath(expected_path)}")
+            continue
+        if not os.path.exists(expected_path):
+            print(f"❌ {name}: no golden at {expected_path} (run with --update)")
+            failures += 1
+            continue
+        with open(expected_path, encoding="utf-8") as f:
+            expected = json.load(f)
+        problems = [f"golden: {problem}" for problem in subtotal_problems(expected, sector)]
+        problems += diff(expected, data)
+        if problems:
+            failures += 1
+            print(f"❌ {name}: {len(problems)} difference(s)")
+            for problem in problems[:20]:
+                print(f"    {problem}")
+        else:
+            print(f"✅ {name}: {data['referencia']} {len(data['operacoes'])} ops in {ms:.0f} ms")
+
+    print(f"{len(pdfs) - failures}/{len(pdfs)} sheets OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Callable, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+
+stream_logger = logging.getLogger("dashboard_stream")
+
+KEEPALIVE_SECONDS = 15
+RESYNC_SECONDS = 30
+
+
+class DashboardBroadcaster:
+    """
+    Canal de push do Monitor de Fábrica (Page 01).
+
+    Mantém UM snapshot do estado da produção ativa, recalculado apenas quando
+    um endpoint de escrita sinaliza mudança (checkout, start/pause/resume/stop,
+    rebalanceamento, publicação). Todos os monitores conectados recebem o mesmo
+    payload já serializado; o cronômetro é calculado no cliente.
+
+    `clock_key` (the server clock the client syncs to) is left out of the
+    snapshot, so an unchanged state is not pushed again on every resync, and
+    is stamped fresh on each event sent.
+    """
+
+    def __init__(self, build_snapshot: Callable[[], dict], resync_seconds: int = RESYNC_SECONDS,
+                 clock_key: Optional[str] = None):
+        self._build_snapshot = build_snapshot
+        self._resync_seconds = resync_seconds
+        self._clock_key = clock_key
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._payload: Optional[str] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._dirty: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Starts the background refresher. Must be called from the event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._dirty = asyncio.Event()
+        self._dirty.set()  # First snapshot on boot
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify_change(self):
+        """
+        Marks the snapshot as stale. Safe to call from the sync endpoints,
+        which run on the threadpool and not on the event loop.
+        """
+        if self._loop is None or self._dirty is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._dirty.set)
+        except RuntimeError:
+            # Loop already closed (shutdown in progress)
+            pass
+
+    async def _run(self):
+        while True:
+            try:
+                # Periodic resync covers writes made by other workers/processes
+                await asyncio.wait_for(self._dirty.wait(), timeout=self._resync_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._dirty.clear()
+
+            try:
+                snapshot = await run_in_threadpool(self._build_snapshot)
+                if self._clock_key:
+                    snapshot = {k: v for k, v in snapshot.items() if k != self._clock_key}
+                payload = json.dumps(jsonable_encoder(snapshot))
+            except Exception as e:
+                stream_logger.error("[STREAM:error] snapshot failed: %s", e)
+                continue
+
+            if payload == self._payload:
+                continue
+            self._payload = payload
+            stream_logger.info("[STREAM:push] subscribers=%s", len(self._subscribers))
+            for queue in list(self._subscribers):
+                queue.put_nowait(payload)
+
+    def _stamped(self, payload: str) -> str:
+        """Adds the clock to the serialized snapshot (a JSON object) at send time."""
+        if not self._clock_key or not payload.endswith("}"):
+            return payload
+        clock = f'"{self._clock_key}": {json.dumps(jsonable_encoder(datetime.utcnow()))}'
+        return f"{payload[:-1]}{', ' if payload != '{}' else ''}{clock}}}"
+
+    async def events(self):
+        """
+        Async generator of Server-Sent Events for a single client.
+        Sends the current snapshot immediately, then only on changes.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.add(queue)
+        try:
+            if self._payload is not None:
+                yield f"event: snapshot\ndata: {self._stamped(self._payload)}\n\n"
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing the idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                # Drop stale snapshots if the client fell behind
+                while not queue.empty():
+                    payload = queue.get_nowait()
+                yield f"event: snapshot\ndata: {self._stamped(payload)}\n\n"
+        finally:
+            self._subscribers.discard(queue)
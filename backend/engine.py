@@ -1,4 +1,8 @@
 import math
+import time
+from typing import List, Optional
+
+import numpy as np
 
 def calculate_tl(operators: float, pulse_duration: int, tp_ajustado: float) -> int:
     """
@@ -19,3 +23,478 @@ def calculate_tl(operators: float, pulse_duration: int, tp_ajustado: float) -> i
     
     raw_tl = (operators * pulse_duration) / tp_ajustado
     return math.floor(raw_tl)
+
+def summarize_operations(operations) -> dict:
+    """
+    Consolida os tempos de uma PSO (valores denormalizados na tabela pso).
+    
+    Args:
+        operations: Operações da PSO (objetos com is_active, final_time e macro_machine).
+        
+    Returns:
+        dict: active_tp_minutes, inactive_tp_minutes, active_operation_count,
+        inactive_operation_count e machine_minutes (minutos ativos por macro_machine).
+    """
+    summary = {
+        "active_tp_minutes": 0.0,
+        "inactive_tp_minutes": 0.0,
+        "active_operation_count": 0,
+        "inactive_operation_count": 0,
+        "machine_minutes": {}
+    }
+    
+    for op in operations:
+        time_min = op.final_time or 0.0
+        if op.is_active:
+            summary["active_tp_minutes"] += time_min
+            summary["active_operation_count"] += 1
+            machine = op.macro_machine or "Indefinida"
+            summary["machine_minutes"][machine] = summary["machine_minutes"].get(machine, 0.0) + time_min
+        else:
+            summary["inactive_tp_minutes"] += time_min
+            summary["inactive_operation_count"] += 1
+    
+    summary["active_tp_minutes"] = round(summary["active_tp_minutes"], 4)
+    summary["inactive_tp_minutes"] = round(summary["inactive_tp_minutes"], 4)
+    summary["machine_minutes"] = {k: round(v, 4) for k, v in summary["machine_minutes"].items()}
+    return summary
+
+
+# ==================== Motor de Balanceamento Automático ====================
+
+BALANCE_EPSILON = 1e-9
+
+
+def _machine_key(machine: Optional[str]) -> Optional[str]:
+    """Macro máquina que ocupa um posto. Operações manuais não contam."""
+    key = (machine or "").strip().upper()
+    if not key or key.startswith("MANUAL"):
+        return None
+    return key
+
+
+class _LineModel:
+    """Dados imutáveis de um problema de balanceamento (tempos já em minutos por carrinho)."""
+
+    def __init__(self, operations: List[dict], stations: int, batch_size: int,
+                 efficiency_factor: float, allow_fractions: bool, max_machines_per_station: int):
+        self.operations = operations
+        self.n = len(operations)
+        self.k = stations
+        self.tl = batch_size
+        self.allow_fractions = allow_fractions and batch_size > 1
+        self.max_machines = max(1, max_machines_per_station)
+        eff = efficiency_factor or 1.0
+        # Tempo real por peça = TP / eficiência (mesma regra do Cockpit)
+        self.piece_time = [(op.get("final_time") or 0.0) / eff for op in operations]
+        self.load = [t * batch_size for t in self.piece_time]
+        self.machine = [_machine_key(op.get("macro_machine")) for op in operations]
+        self.suffix = [0.0] * (self.n + 1)
+        for i in range(self.n - 1, -1, -1):
+            self.suffix[i] = self.suffix[i + 1] + self.load[i]
+
+    def fits_machine(self, machines: set, i: int) -> bool:
+        m = self.machine[i]
+        return m is None or m in machines or len(machines) < self.max_machines
+
+
+def _greedy_fill(model: _LineModel, cap: float, allow_fractions: bool) -> Optional[List[List[tuple]]]:
+    """
+    Preenche os postos em ordem de sequência até `cap` minutos.
+    Retorna [[(op_index, qty), ...] por posto] ou None se não couber.
+    Sem frações o guloso é ótimo (precedência em cadeia); com frações uma
+    operação pode ser dividida uma única vez entre dois postos vizinhos.
+    """
+    stations = [[] for _ in range(model.k)]
+    s = 0
+    load = 0.0
+    machines = set()
+    i = 0
+    carry = 0  # Remaining pieces of op i (0 = op not started)
+
+    while i < model.n:
+        if s >= model.k:
+            return None
+        qty = carry or model.tl
+        op_load = model.piece_time[i] * qty
+
+        if model.fits_machine(machines, i) and load + op_load <= cap + BALANCE_EPSILON:
+            stations[s].append((i, qty))
+            load += op_load
+            if model.machine[i]:
+                machines.add(model.machine[i])
+            i += 1
+            carry = 0
+            continue
+
+        # Op does not fit whole: split it (only fresh ops, only once)
+        if allow_fractions and not carry and model.piece_time[i] > 0 and model.fits_machine(machines, i):
+            q = int((cap - load + BALANCE_EPSILON) // model.piece_time[i])
+            rest = model.tl - q
+            if 1 <= q < model.tl and rest * model.piece_time[i] <= cap + BALANCE_EPSILON:
+                stations[s].append((i, q))
+                carry = rest
+                s += 1
+                load, machines = 0.0, set()
+                continue
+
+        if not stations[s]:
+            return None  # Not even an empty station takes it
+        s += 1
+        load, machines = 0.0, set()
+
+    return stations
+
+
+def _station_loads(model: _LineModel, stations: List[List[tuple]]) -> List[float]:
+    return [sum(model.piece_time[i] * q for i, q in seat) for seat in stations]
+
+
+def _count_fractions(model: _LineModel, stations: List[List[tuple]]) -> int:
+    return len({i for seat in stations for i, q in seat if q < model.tl})
+
+
+def _merge_fractions(model: _LineModel, stations: List[List[tuple]], cap: float) -> List[List[tuple]]:
+    """Desfaz frações que não são necessárias para manter o gargalo <= cap."""
+    stations = [list(seat) for seat in stations]
+    for s in range(model.k - 1):
+        if not stations[s] or not stations[s + 1]:
+            continue
+        i, q = stations[s][-1]
+        j, rest = stations[s + 1][0]
+        if i != j or q >= model.tl:
+            continue
+        loads = _station_loads(model, stations)
+        machines_s = {model.machine[x] for x, _ in stations[s][:-1] if model.machine[x]}
+        machines_n = {model.machine[x] for x, _ in stations[s + 1][1:] if model.machine[x]}
+        if loads[s] + model.piece_time[i] * rest <= cap + BALANCE_EPSILON and model.fits_machine(machines_s, i):
+            stations[s][-1] = (i, model.tl)
+            stations[s + 1].pop(0)
+        elif loads[s + 1] + model.piece_time[i] * q <= cap + BALANCE_EPSILON and model.fits_machine(machines_n, i):
+            stations[s].pop()
+            stations[s + 1][0] = (i, model.tl)
+    return stations
+
+
+def _heuristic_balance(model: _LineModel) -> List[List[tuple]]:
+    """Busca binária no gargalo: exata sem frações, depois tenta reduzir fracionando."""
+    # 1. Whole operations: the optimum is one of the contiguous segment sums
+    prefix = [0.0]
+    for w in model.load:
+        prefix.append(prefix[-1] + w)
+    lower = max(max(model.load, default=0.0), prefix[-1] / model.k)
+    candidates = sorted({prefix[j] - prefix[i] for i in range(model.n) for j in range(i + 1, model.n + 1)
+                         if prefix[j] - prefix[i] >= lower - BALANCE_EPSILON})
+
+    best = None
+    lo, hi = 0, len(candidates) - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        result = _greedy_fill(model, candidates[mid], allow_fractions=False)
+        if result is not None:
+            best, best_cap = result, candidates[mid]
+            hi = mid - 1
+        else:
+            lo = mid + 1
+
+    if not model.allow_fractions:
+        return best
+
+    # 2. Fractions: bisection between the ideal load and the whole-op optimum.
+    # With the machine limit a split can block the next station, so whole-op
+    # greedy is kept as a fallback at every probe.
+    lo_cap = max(prefix[-1] / model.k, max(model.load, default=0.0) / 2)
+    hi_cap = best_cap if best is not None else prefix[-1]
+    split_best = None
+    for _ in range(40):
+        if hi_cap - lo_cap < 1e-4:
+            break
+        mid = (lo_cap + hi_cap) / 2
+        result = _greedy_fill(model, mid, allow_fractions=True) or _greedy_fill(model, mid, allow_fractions=False)
+        if result is not None:
+            split_best, hi_cap = result, mid
+        else:
+            lo_cap = mid
+    if split_best is None:
+        split_best = _greedy_fill(model, hi_cap, allow_fractions=True)
+
+    if best is None:
+        return split_best
+    if split_best is None:
+        return best
+
+    split_cap = max(_station_loads(model, split_best))
+    if split_cap < max(_station_loads(model, best)) - BALANCE_EPSILON:
+        return _merge_fractions(model, split_best, split_cap)
+    return best
+
+
+def _objective(model: _LineModel, stations: List[List[tuple]]) -> tuple:
+    """(gargalo, nº de frações, soma dos quadrados da ociosidade)"""
+    loads = _station_loads(model, stations)
+    bottleneck = max(loads, default=0.0)
+    return (round(bottleneck, 6), _count_fractions(model, stations), sum((bottleneck - l) ** 2 for l in loads))
+
+
+def _branch_and_bound(model: _LineModel, incumbent: List[List[tuple]], deadline: float):
+    """
+    Busca exata (branch-and-bound) sobre os cortes entre postos.
+    Minimiza o gargalo, depois o nº de frações e por fim a ociosidade.
+    Retorna (melhor solução, busca_completa).
+    """
+    best = {"stations": incumbent, "objective": _objective(model, incumbent)}
+    complete = [True]
+    current = [[] for _ in range(model.k)]
+
+    def dfs(s: int, i: int, carry: int, max_load: float, fractions: int):
+        if time.perf_counter() > deadline:
+            complete[0] = False
+            return
+        if i >= model.n:
+            candidate = [list(seat) for seat in current]
+            objective = _objective(model, candidate)
+            if objective < best["objective"]:
+                best["stations"], best["objective"] = candidate, objective
+            return
+        if s >= model.k:
+            return
+
+        upper = best["objective"][0]
+        remaining = (model.piece_time[i] * (carry or model.tl)) + model.suffix[i + 1]
+        if max(max_load, remaining / (model.k - s)) > upper + BALANCE_EPSILON:
+            return
+        if max_load >= upper - BALANCE_EPSILON and fractions > best["objective"][1]:
+            return
+
+        # Enumerate the content of station s: op i (or its remainder) plus following ops
+        options = []
+        load = 0.0
+        machines = set()
+        j = i
+        while j < model.n:
+            qty = carry if (j == i and carry) else model.tl
+            if not model.fits_machine(machines, j):
+                break
+            op_load = model.piece_time[j] * qty
+            # Partial of a fresh op j closes the station
+            if model.allow_fractions and qty == model.tl and model.piece_time[j] > 0:
+                room = upper + BALANCE_EPSILON - load
+                target = remaining / (model.k - s) - load
+                for q in {int(room // model.piece_time[j]), int(round(target / model.piece_time[j]))}:
+                    if 1 <= q < model.tl and load + model.piece_time[j] * q <= upper + BALANCE_EPSILON:
+                        options.append((j, q, load + model.piece_time[j] * q))
+            if load + op_load > upper + BALANCE_EPSILON:
+                break
+            load += op_load
+            if model.machine[j]:
+                machines.add(model.machine[j])
+            j += 1
+            options.append((j, 0, load))
+
+        # Longest segments first: reaches good incumbents quickly
+        for end, partial, seg_load in sorted(options, key=lambda o: (o[0], o[1]), reverse=True):
+            seat = []
+            for x in range(i, end):
+                seat.append((x, carry if (x == i and carry) else model.tl))
+            if partial:
+                seat.append((end, partial))
+            current[s] = seat
+            if partial:
+                dfs(s + 1, end, model.tl - partial, max(max_load, seg_load), fractions + 1)
+            else:
+                dfs(s + 1, end, 0, max(max_load, seg_load), fractions)
+            current[s] = []
+            if not complete[0]:
+                return
+
+    dfs(0, 0, 0, 0.0, 0)
+    return best["stations"], complete[0]
+
+
+def balance_line(
+    operations: List[dict],
+    workstation_ids: List[int],
+    pulse_duration: int,
+    efficiency_factor: float = 1.0,
+    batch_size: Optional[int] = None,
+    allow_fractions: bool = True,
+    max_machines_per_station: int = 2,
+    mode: str = "heuristic",
+    time_budget_ms: int = 2000
+) -> dict:
+    """
+    Balanceamento automático da célula (Cockpit / Page 04).
+    
+    Distribui as operações ativas de uma PSO entre os postos minimizando a
+    carga do posto gargalo. O carrinho percorre os postos na ordem de
+    `workstation_ids`, então cada posto recebe um trecho contínuo da
+    sequência operacional (precedência). Cada posto opera no máximo
+    `max_machines_per_station` macro máquinas (MANUAL não conta) e uma
+    operação pode ser fracionada entre dois postos vizinhos.
+    
+    Args:
+        operations: Operações ativas (dicts com id, sequence, macro_machine, final_time).
+        workstation_ids: IDs das costureiras, na ordem do fluxo.
+        pulse_duration: Duração do pulso em minutos.
+        efficiency_factor: Fator de eficiência da PSO (TP real = TP / eficiência).
+        batch_size: TL do carrinho. Se omitido, usa calculate_tl.
+        allow_fractions: Permite fracionar operações quando reduz o gargalo.
+        max_machines_per_station: Máximo de macro máquinas por posto.
+        mode: "heuristic" (milissegundos) ou "exact" (branch-and-bound).
+        time_budget_ms: Tempo máximo do modo exato.
+        
+    Returns:
+        dict: batch_size, allocations (formato de PlanningSyncRequest), workstations e metrics.
+    """
+    started = time.perf_counter()
+    ops = sorted(operations, key=lambda op: op.get("sequence") or 0)
+    eff = efficiency_factor or 1.0
+    total_tp = sum((op.get("final_time") or 0.0) for op in ops) / eff
+
+    if batch_size is None or batch_size <= 0:
+        batch_size = calculate_tl(len(workstation_ids), pulse_duration, total_tp)
+    batch_size = max(1, batch_size)
+
+    # Machine limit is relaxed one step at a time if the sequence cannot fit it
+    machine_limit = max(1, max_machines_per_station)
+    distinct_machines = len({_machine_key(op.get("macro_machine")) for op in ops} - {None})
+    stations = None
+    optimal = False
+    while True:
+        model = _LineModel(ops, len(workstation_ids), batch_size, eff, allow_fractions, machine_limit)
+        if not model.n or not model.k:
+            break
+        stations = _heuristic_balance(model)
+        if stations is not None or machine_limit >= distinct_machines:
+            break
+        machine_limit += 1
+
+    if stations is not None:
+        if mode == "exact":
+            deadline = started + time_budget_ms / 1000.0
+            stations, optimal = _branch_and_bound(model, stations, deadline)
+
+    if stations is None:
+        return {
+            "feasible": False,
+            "batch_size": batch_size,
+            "allocations": [],
+            "workstations": [],
+            "metrics": None
+        }
+
+    loads = _station_loads(model, stations)
+    allocations = []
+    workstations = []
+    for s, seat in enumerate(stations):
+        for position, (i, qty) in enumerate(seat, start=1):
+            allocations.append({
+                "operation_id": ops[i]["id"],
+                "workstation_id": workstation_ids[s],
+                "position": position,
+                "quantity": qty,
+                "is_fraction": qty < batch_size
+            })
+        workstations.append({
+            "workstation_id": workstation_ids[s],
+            "load_minutes": round(loads[s], 4),
+            "operation_count": len(seat),
+            "machines": sorted({model.machine[i] for i, _ in seat if model.machine[i]})
+        })
+
+    bottleneck = max(loads)
+    total_load = sum(loads)
+    return {
+        "feasible": True,
+        "batch_size": batch_size,
+        "allocations": allocations,
+        "workstations": workstations,
+        "metrics": {
+            "bottleneck_minutes": round(bottleneck, 4),
+            "total_load_minutes": round(total_load, 4),
+            "idle_minutes": round(bottleneck * len(loads) - total_load, 4),
+            "balance_efficiency": round(total_load / (bottleneck * len(loads)) * 100, 1) if bottleneck > 0 else 0.0,
+            "fits_pulse": bottleneck <= pulse_duration + BALANCE_EPSILON,
+            "fractions": _count_fractions(model, stations),
+            "max_machines_per_station": machine_limit,
+            "machine_limit_relaxed": machine_limit != max(1, max_machines_per_station),
+            "mode": mode,
+            "optimal": optimal if mode == "exact" else None,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+    }
+
+
+def evaluate_allocations(
+    op_times,
+    assignments,
+    n_workstations: int,
+    batch_size: int,
+    pulse_duration: int,
+    quantities=None,
+    efficiency_factor: float = 1.0
+) -> dict:
+    """
+    Avalia N alocações candidatas de uma vez (vetorizado com NumPy).
+    
+    Calcula as mesmas cargas que o Cockpit (updateCalculations na Page 04)
+    mostra por posto, para um lote inteiro de candidatos. Uma operação
+    fracionada entra como duas colunas em `op_times`, cada uma com sua
+    quantidade em `quantities`.
+    
+    Args:
+        op_times: Vetor (n_ops,) com o tempo por peça de cada operação, em minutos.
+        assignments: Matriz inteira (N, n_ops) com o índice do posto de cada
+            operação em cada candidato; -1 = operação ainda no banco.
+        n_workstations: Número de postos da célula.
+        batch_size: TL do carrinho (quantidade padrão por operação).
+        pulse_duration: Duração do pulso em minutos.
+        quantities: Opcional, (n_ops,) ou (N, n_ops) com peças por operação.
+        efficiency_factor: Fator de eficiência (TP real = TP / eficiência).
+        
+    Returns:
+        dict: Arrays NumPy indexados por candidato: loads (N, n_workstations),
+        bottleneck_minutes, total_load_minutes, idle_minutes, balance_efficiency,
+        overload_minutes, overloaded_stations, unassigned_minutes e fits_pulse.
+    """
+    times = np.asarray(op_times, dtype=np.float64) / (efficiency_factor or 1.0)
+    assign = np.asarray(assignments, dtype=np.intp)
+    if assign.ndim == 1:
+        assign = assign[np.newaxis, :]
+    n_candidates, n_ops = assign.shape
+    if times.shape != (n_ops,):
+        raise ValueError(f"op_times has {times.size} operations, assignments has {n_ops}")
+    if n_workstations <= 0:
+        raise ValueError("n_workstations must be positive")
+    if assign.size and (assign.max() >= n_workstations or assign.min() < -1):
+        raise ValueError("assignments must be workstation indexes in [-1, n_workstations)")
+
+    if quantities is None:
+        work = np.broadcast_to(times * batch_size, assign.shape)
+    else:
+        work = np.broadcast_to(times * np.asarray(quantities, dtype=np.float64), assign.shape)
+
+    # One bincount for every candidate: station s of candidate k lands in bin k * W + s
+    placed = assign >= 0
+    bins = (assign + np.arange(n_candidates)[:, np.newaxis] * n_workstations)[placed]
+    loads = np.bincount(
+        bins, weights=work[placed], minlength=n_candidates * n_workstations
+    ).reshape(n_candidates, n_workstations)
+
+    bottleneck = loads.max(axis=1)
+    total_load = loads.sum(axis=1)
+    capacity = bottleneck * n_workstations
+    with np.errstate(divide="ignore", invalid="ignore"):
+        balance_efficiency = np.where(bottleneck > 0, total_load / capacity * 100, 0.0)
+
+    return {
+        "loads": loads,
+        "bottleneck_minutes": bottleneck,
+        "total_load_minutes": total_load,
+        "idle_minutes": capacity - total_load,
+        "balance_efficiency": balance_efficiency,
+        "overload_minutes": np.clip(loads - pulse_duration, 0, None).sum(axis=1),
+        "overloaded_stations": (loads > pulse_duration + BALANCE_EPSILON).sum(axis=1),
+        "unassigned_minutes": np.where(placed, 0.0, work).sum(axis=1),
+        "fits_pulse": bottleneck <= pulse_duration + BALANCE_EPSILON
+    }
@@ -0,0 +1,130 @@
+"""
+Cache persistente da extração de PSO (PDF -> JSON da IA).
+
+The same sequence sheet uploaded again is answered from pso_extraction_cache
+instead of calling the LLM. The key is the SHA-256 of the PDF bytes plus a
+fingerprint of PROMPT_SYSTEM_CONTENT, the model and the local parser version,
+so editing either naturally misses (and the old rows are the first evicted).
+
+Size-bounded LRU: after each insert, rows from other prompts go first, then the
+least recently used, until the table fits EXTRACTION_CACHE_MAX_ENTRIES and
+EXTRACTION_CACHE_MAX_BYTES.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Callable, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import extractor
+import models
+
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE", "true").lower() in ("1", "true", "yes")
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "1000"))
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+
+def pdf_fingerprint(pdf_bytes: bytes) -> str:
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def prompt_fingerprint() -> str:
+    """Changes whenever the prompt, the model, the text sent to it or the local parser changes."""
+    source = (f"{extractor.EXTRACTION_MODEL}\0{extractor.LLM_TEXT_VERSION}\0{extractor.LOCAL_PARSER_VERSION}\0"
+              f"{extractor.PROMPT_SYSTEM_CONTENT}")
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    def __init__(self, max_entries: int = EXTRACTION_CACHE_MAX_ENTRIES,
+                 max_bytes: int = EXTRACTION_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def get(self, db: Session, pdf_sha256: str, prompt_hash: str) -> Optional[dict]:
+        entry = db.get(models.ExtractionCacheEntry, (pdf_sha256, prompt_hash))
+        if entry is None:
+            return None
+        entry.hits = (entry.hits or 0) + 1
+        entry.last_used_at = datetime.utcnow()
+        db.commit()
+        return json.loads(entry.payload)
+
+    def put(self, db: Session, pdf_sha256: str, prompt_hash: str, data: dict):
+        payload = json.dumps(data, ensure_ascii=False)
+        db.add(models.ExtractionCacheEntry(
+            pdf_sha256=pdf_sha256, prompt_hash=prompt_hash, payload=payload,
+            size_bytes=len(payload.encode("utf-8")), hits=0
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # The same PDF extracted concurrently: the other import stored it
+            db.rollback()
+            return
+        self.evict(db)
+
+    def evict(self, db: Session) -> int:
+        """Deletes rows until the bounds hold. Returns the number of rows deleted."""
+        Entry = models.ExtractionCacheEntry
+        count, total = db.query(func.count(), func.coalesce(func.sum(Entry.size_bytes), 0)).one()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return 0
+        # Other prompts can never hit again, then least recently used first
+        prompt_hash = prompt_fingerprint()
+        rows = db.query(Entry.pdf_sha256, Entry.prompt_hash, Entry.size_bytes).order_by(
+            (Entry.prompt_hash == prompt_hash).asc(), Entry.last_used_at.asc()
+        ).all()
+        deleted = 0
+        for pdf_sha256, row_prompt, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            db.query(Entry).filter(Entry.pdf_sha256 == pdf_sha256, Entry.prompt_hash == row_prompt).delete()
+            count -= 1
+            total -= size
+            deleted += 1
+        db.commit()
+        return deleted
+
+    def purge(self, db: Session) -> int:
+        deleted = db.query(models.ExtractionCacheEntry).delete()
+        db.commit()
+        return deleted
+
+    def stats(self, db: Session) -> dict:
+        Entry = models.ExtractionCacheEntry
+        count, total, hits = db.query(
+            func.count(), func.coalesce(func.sum(Entry.size_bytes), 0), func.coalesce(func.sum(Entry.hits), 0)
+        ).one()
+        current = db.query(func.count()).filter(Entry.prompt_hash == prompt_fingerprint()).scalar()
+        return {
+            "enabled": EXTRACTION_CACHE_ENABLED, "entries": count, "current_prompt_entries": current,
+            "size_bytes": total, "hits": hits,
+            "max_entries": self.max_entries, "max_bytes": self.max_bytes
+        }
+
+    def extract(self, db: Session, pdf_bytes: bytes,
+                extract: Optional[Callable[[bytes], dict]] = None) -> Tuple[dict, bool]:
+        """
+        JSON of the PDF, from the cache or from `extract` (default: local
+        parser with LLM fallback). Returns (data, cached). Empty results are
+        not stored.
+        """
+        extract = extract or extractor.extract_pso
+        if not EXTRACTION_CACHE_ENABLED:
+            return extract(pdf_bytes), False
+        pdf_sha256, prompt_hash = pdf_fingerprint(pdf_bytes), prompt_fingerprint()
+        data = self.get(db, pdf_sha256, prompt_hash)
+        if data is not None:
+            return data, True
+        data = extract(pdf_bytes)
+        if data and data.get("operacoes"):
+            self.put(db, pdf_sha256, prompt_hash, data)
+        return data, False
+
+
+extraction_cache = ExtractionCache()
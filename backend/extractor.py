@@ -1,5 +1,7 @@
 import os
+import re
 import json
+from typing import Iterator, List
 from openai import OpenAI
 from pypdf import PdfReader
 from io import BytesIO
@@ -25,20 +27,91 @@ def get_openai_client():
         )
     return client
 
-def extract_text_from_pdf(pdf_bytes: bytes) -> str:
+# Below this many pages one process extracts faster than the pool round-trip
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "8"))
+PDF_PAGES_PER_TASK = 4
+# Text per LLM call; chunks are cut at page boundaries, nothing is truncated
+LLM_CHUNK_CHARS = int(os.getenv("LLM_CHUNK_CHARS", "60000"))
+# Bump when the text sent to the LLM changes (invalidates the extraction cache)
+LLM_TEXT_VERSION = "2"
+# Footer of the sewing sector: its name alone on a line, then the T.P. subtotal
+_SEWING_END = re.compile(r"^COSTURA[ \t]*\n\d+,\d{4}[ \t]*$", re.M)
+
+
+def _extract_pages_text(pdf_bytes: bytes, start: int, stop: int) -> List[str]:
+    """Worker of the process pool: text of pages [start, stop)."""
+    reader = PdfReader(BytesIO(pdf_bytes))
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def iter_pdf_pages(pdf_bytes: bytes) -> Iterator[str]:
     """
-    Extracts text from a PDF file using pypdf.
-    Ensures proper byte stream handling for complex PDFs.
+    Yields the text of each page, in order, as soon as it is extracted.
+    Large PDFs are split in page ranges over the process pool; closing the
+    generator early cancels the ranges not started yet.
     """
     # Ensure bytes from FastAPI are properly loaded into memory
-    stream = BytesIO(pdf_bytes)
-    reader = PdfReader(stream)
-    text = ""
-    for page in reader.pages:
-        page_text = page.extract_text()
-        if page_text:  # Only add if text was extracted
-            text += page_text + "\n"
-    return text
+    reader = PdfReader(BytesIO(pdf_bytes))
+    total = len(reader.pages)
+    if total < PDF_PARALLEL_MIN_PAGES:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+
+    from process_pool import get_process_pool
+    pool = get_process_pool()
+    futures = [
+        pool.submit(_extract_pages_text, pdf_bytes, start, min(start + PDF_PAGES_PER_TASK, total))
+        for start in range(0, total, PDF_PAGES_PER_TASK)
+    ]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def extract_text_from_pdf(pdf_bytes: bytes) -> str:
+    """
+    Extracts text from a PDF file using pypdf (every page).
+    """
+    return "".join(f"{text}\n" for text in iter_pdf_pages(pdf_bytes) if text)
+
+
+def sewing_text_pages(pdf_bytes: bytes) -> List[str]:
+    """
+    Pages the LLM needs: from the first one (product header) to the end of
+    the COSTURA sector. Extraction stops at its subtotal row; the rest of that
+    page and the later pages (acabamento, consumo) are not read. Without the
+    footer (other layout) every page is kept.
+    """
+    pages = []
+    page_texts = iter_pdf_pages(pdf_bytes)
+    try:
+        for text in page_texts:
+            match = _SEWING_END.search(text)
+            if match:
+                pages.append(text[:match.end()])
+                break
+            pages.append(text)
+    finally:
+        page_texts.close()
+    return [text for text in pages if text.strip()]
+
+
+def chunk_pages(pages: List[str], max_chars: int = LLM_CHUNK_CHARS) -> List[str]:
+    """Groups whole pages into chunks of up to max_chars (a longer page is a chunk alone)."""
+    chunks, current, size = [], [], 0
+    for text in pages:
+        if current and size + len(text) > max_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(text)
+        size += len(text) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
 
 PROMPT_SYSTEM_CONTENT = """
 ### 📝 Prompt de Extração para o Agente de IA
@@ -90,31 +163,54 @@ PROMPT_SYSTEM_CONTENT = """
 }
 """
 
-def process_pdf_with_gpt4(pdf_bytes: bytes):
-    client = get_openai_client()
+EXTRACTION_MODEL = "gpt-4o"
+
+def _llm_extract_chunk(client, text_content: str, part: int, parts: int) -> dict:
+    scope = "" if parts == 1 else f" (parte {part} de {parts}; extraia apenas as operações desta parte)"
+    response = client.chat.completions.create(
+        model=EXTRACTION_MODEL,
+        messages=[
+            {"role": "system", "content": PROMPT_SYSTEM_CONTENT},
+            {"role": "user", "content": f"Extraia os dados deste PDF{scope} (conteúdo de texto abaixo):\n\n{text_content}"}
+        ],
+        response_format={"type": "json_object"},
+        temperature=0
+    )
+    return json.loads(response.choices[0].message.content)
+
+
+def process_pdf_with_gpt4(pdf_bytes: bytes, client=None):
+    """
+    Extracts the PSO JSON from the PDF through the LLM.
+    `client` defaults to the OpenAI client; any object with the same
+    chat.completions.create interface works (e.g. a local stub).
+
+    Only the pages up to the end of the COSTURA sector are sent, in chunks
+    of whole pages (one call each, operations merged by ordem).
+    """
+    client = client or get_openai_client()
     if not client:
         raise Exception("OpenAI API Key not configured/available.")
 
-    text_content = extract_text_from_pdf(pdf_bytes)
-    
-    # Truncate if too long (though GPT-4o has 128k context, keeping it safe)
-    if len(text_content) > 100000:
-        text_content = text_content[:100000]
+    chunks = chunk_pages(sewing_text_pages(pdf_bytes), LLM_CHUNK_CHARS)
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": PROMPT_SYSTEM_CONTENT},
-                {"role": "user", "content": f"Extraia os dados deste PDF (conteúdo de texto abaixo):\n\n{text_content}"}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0
-        )
-        
-        content = response.choices[0].message.content
-        data = json.loads(content)
-        
+        data = {}
+        operations = []
+        seen = set()
+        for part, text_content in enumerate(chunks, start=1):
+            extracted = _llm_extract_chunk(client, text_content, part, len(chunks))
+            for key in ("referencia", "produto"):
+                if not data.get(key) and extracted.get(key):
+                    data[key] = extracted[key]
+            for op in extracted.get("operacoes", []):
+                # Chunks do not overlap, but the model may repeat an edge row
+                if op.get("ordem") is not None and op["ordem"] in seen:
+                    continue
+                seen.add(op.get("ordem"))
+                operations.append(op)
+        data["operacoes"] = sorted(operations, key=lambda op: (op.get("ordem") is None, op.get("ordem") or 0))
+
         # Fallback: garante que se a IA falhar em algum campo, o sistema não quebre
         for op in data.get("operacoes", []):
             if "minutos_decimais" not in op or op["minutos_decimais"] is None:
@@ -125,3 +221,223 @@ def process_pdf_with_gpt4(pdf_bytes: bytes):
     except Exception as e:
         print(f"Error calling OpenAI: {e}")
         raise e
+
+
+# ==================== Parser local (Sequência Operacional) ====================
+#
+# The sequence sheets share one table: ordem, código, nome, CM, T.P., máquina,
+# bitola, acessório, aparelho, observações. Each sector (setor) closes with a
+# subtotal row (name + T.P. sum) and the sheet with a grand total. The rows are
+# rebuilt from the text positions (pypdf visitor), so wrapped names/machines
+# and the Observações column land in the right field, and the subtotals give a
+# checksum: a sheet is trusted only when every sum matches.
+
+LOCAL_PARSER_VERSION = "1"
+# auto: local parser, LLM only on low confidence | local: never the LLM | llm: always the LLM
+PSO_EXTRACTOR = os.getenv("PSO_EXTRACTOR", "auto").lower()
+
+SEWING_SECTORS = {"COSTURA"}
+# Regras do prompt: ruído de acabamento fica de fora mesmo dentro da costura
+NOISE_PREFIXES = ("CONFERIR TAMANHOS", "PISTOLAR TAG", "LAVAÇÃO", "LAVAÇAO", "LAVACAO", "DOBRAR E EMBALAR")
+# (maquina_macro, keywords) in the prompt's priority order
+MACHINE_MACROS = [
+    ("RETA", ("RETA",)),
+    ("OVERLOCK", ("OVERLOCK", "OVER", "PONTO CONJUGADO")),
+    ("COBERTURA", ("COBERTURA",)),
+    ("CATRACA", ("CATRACA",)),
+    ("MANUAL", ("MANUAL COSTURA",)),
+]
+COLUMN_HEADERS = ("Código", "Nome", "CM", "T.P.", "Máquina", "Bit.", "Acessório", "Aparelho", "Observações")
+ROW_TOLERANCE = 1.0       # fragments of the same row
+WRAP_DISTANCE = 8.0       # wrapped lines sit ~3.6pt above/below their row
+_INT = re.compile(r"^\d+$")
+_CODE = re.compile(r"^\d+[A-Z]?$")
+_DECIMAL = re.compile(r"^\d+(,\d+)?$")
+_SUBTOTAL = re.compile(r"^\d+,\d{4}$")
+_PRODUCT = re.compile(r"^(.+?)\s*\(([^()\s]+)\)$")
+
+
+class LowConfidenceParse(Exception):
+    pass
+
+
+def _decimal(value: str) -> float:
+    return float(value.replace(",", "."))
+
+
+def machine_macro(machine: str, description: str = "") -> str:
+    """Maquina_Macro pelas regras do prompt: nome da máquina primeiro, descrição como fallback."""
+    for text in (machine.upper(), description.upper()):
+        for macro, keywords in MACHINE_MACROS:
+            if any(re.search(rf"\b{re.escape(k)}", text) for k in keywords):
+                return macro
+    return machine.strip().upper()
+
+
+def _page_fragments(pdf_bytes: bytes) -> List[List[tuple]]:
+    """Per page: (x, y, text, font_size) of every text fragment."""
+    reader = PdfReader(BytesIO(pdf_bytes))
+    pages = []
+    for page in reader.pages:
+        fragments = []
+
+        def visit(text, cm, tm, font_dict, font_size):
+            text = text.strip()
+            if text:
+                x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+                y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+                fragments.append((x, y, text, font_size))
+
+        page.extract_text(visitor_text=visit)
+        pages.append(fragments)
+    return pages
+
+
+def _rows(fragments: List[tuple]) -> List[tuple]:
+    """Groups fragments into rows, top to bottom: [(y, [(x, text, size), ...])]."""
+    rows = []
+    for x, y, text, size in sorted(fragments, key=lambda f: (-f[1], f[0])):
+        if rows and abs(rows[-1][0] - y) <= ROW_TOLERANCE:
+            rows[-1][1].append((x, text, size))
+        else:
+            rows.append((y, [(x, text, size)]))
+    return rows
+
+
+def parse_sequence_sheet(pdf_bytes: bytes) -> dict:
+    """
+    Extração determinística (sem IA) de uma Sequência Operacional.
+
+    Returns the same structure as the LLM (referencia, produto, operacoes)
+    with the sewing operations only. Raises LowConfidenceParse when the layout
+    is not recognized or a subtotal does not match its operations.
+    """
+    pages = _page_fragments(pdf_bytes)
+    header = {}
+    for fragments in pages:
+        for x, y, text, size in fragments:
+            if text in COLUMN_HEADERS and text not in header:
+                header[text] = x
+        if len(header) == len(COLUMN_HEADERS):
+            break
+    if len(header) != len(COLUMN_HEADERS):
+        raise LowConfidenceParse("Column header not found")
+
+    # Column boundaries: midpoints between the header positions (the ordem column has no header)
+    columns = ["codigo", "nome", "cm", "tp", "maquina", "bitola", "acessorio", "aparelho", "observacoes"]
+    starts = [header[h] for h in COLUMN_HEADERS]
+    bounds = [(starts[i] + starts[i + 1]) / 2 for i in range(len(starts) - 1)]
+
+    def column(x: float) -> str:
+        if x < starts[0]:
+            return "ordem"
+        for name, bound in zip(columns, bounds):
+            if x < bound:
+                return name
+        return columns[-1]
+
+    referencia = produto = None
+    operations, sectors, grand_total = [], [], None
+    pending = []  # operations waiting for their sector subtotal
+    for fragments in pages:
+        page_ops = []
+        loose = []
+        for y, cells in _rows(fragments):
+            by_column = {}
+            for x, text, size in cells:
+                by_column.setdefault(column(x), []).append(text)
+            first = by_column.get("ordem", [])
+            tp = by_column.get("tp", [])
+            if first and _INT.match(first[0]) and by_column.get("codigo") and _CODE.match(by_column["codigo"][0]):
+                op = {"y": y, "ordem": int(first[0]), "cells": {k: [(y, " ".join(v))] for k, v in by_column.items()}}
+                page_ops.append(op)
+                pending.append(op)
+            elif first and not _INT.match(first[0]) and len(tp) == 1 and _SUBTOTAL.match(tp[0]):
+                sectors.append({"setor": " ".join(first), "total": _decimal(tp[0]), "ops": pending})
+                for op in pending:
+                    op["setor"] = " ".join(first)
+                pending = []
+            elif not first and list(by_column) == ["tp"] and _DECIMAL.match(tp[0]) and grand_total is None:
+                grand_total = _decimal(tp[0])
+            else:
+                for x, text, size in cells:
+                    match = _PRODUCT.match(text)
+                    if match and produto is None:
+                        produto, referencia = match.group(1).strip(), match.group(2)
+                loose.append((y, by_column))
+        # Wrapped lines belong to the nearest operation row of the page
+        for y, by_column in loose:
+            nearest = min(page_ops, key=lambda op: abs(op["y"] - y), default=None)
+            if nearest is None or abs(nearest["y"] - y) > WRAP_DISTANCE:
+                continue
+            for name, texts in by_column.items():
+                nearest["cells"].setdefault(name, []).append((y, " ".join(texts)))
+        operations.extend(page_ops)
+
+    def cell(op, name):
+        return " ".join(t for _, t in sorted(op["cells"].get(name, []), key=lambda c: -c[0])).strip()
+
+    issues = []
+    if not referencia or not produto:
+        issues.append("reference/product header not found")
+    if not operations:
+        issues.append("no operation rows")
+    if [op["ordem"] for op in operations] != list(range(1, len(operations) + 1)):
+        issues.append("ordem is not a contiguous sequence")
+    if pending:
+        issues.append(f"{len(pending)} operation(s) without a sector subtotal")
+    for op in operations:
+        tp_text = cell(op, "tp")
+        if not _DECIMAL.match(tp_text) or not cell(op, "nome") or not cell(op, "maquina"):
+            issues.append(f"incomplete row {op['ordem']}")
+            continue
+        op["tp"] = _decimal(tp_text)
+    if not issues:
+        for sector in sectors:
+            # T.P. has up to 4 decimals, the subtotal is printed with 4
+            if abs(sum(op["tp"] for op in sector["ops"]) - sector["total"]) > 0.0001 * len(sector["ops"]) + 1e-9:
+                issues.append(f"subtotal of {sector['setor']} does not match its operations")
+        if grand_total is not None and abs(sum(s["total"] for s in sectors) - grand_total) > 0.006:
+            issues.append("grand total does not match the sector subtotals")
+    if issues:
+        raise LowConfidenceParse("; ".join(issues))
+
+    sewing = []
+    for op in operations:
+        descricao = cell(op, "nome")
+        if op["setor"] not in SEWING_SECTORS or descricao.upper().startswith(NOISE_PREFIXES):
+            continue
+        maquina = cell(op, "maquina")
+        acessorio, aparelho = cell(op, "acessorio"), cell(op, "aparelho")
+        extras = [a for a in (acessorio, aparelho) if a and a not in ("Padrão", "* Não informado")]
+        sewing.append({
+            "ordem": op["ordem"],
+            "descricao": descricao,
+            "maquina_original": maquina,
+            "maquina_macro": machine_macro(maquina, descricao),
+            "minutos_decimais": op["tp"],
+            "aparelho_acessorio": " / ".join(extras)
+        })
+    if not sewing:
+        raise LowConfidenceParse("no operation in a sewing sector")
+    return {"referencia": referencia, "produto": produto, "operacoes": sewing}
+
+
+def extract_pso(pdf_bytes: bytes, client=None) -> dict:
+    """
+    JSON da PSO: parser local; a IA só quando o parser não confia no resultado
+    (layout diferente, subtotal que não fecha) ou com PSO_EXTRACTOR=llm.
+    `extraction_source` tells which one answered.
+    """
+    if PSO_EXTRACTOR != "llm":
+        try:
+            data = parse_sequence_sheet(pdf_bytes)
+            data["extraction_source"] = "local"
+            return data
+        except LowConfidenceParse as e:
+            if PSO_EXTRACTOR == "local":
+                raise Exception(f"Local PSO parser could not read the PDF: {e}")
+            print(f"⚠️ Local PSO parser low confidence ({e}); falling back to the LLM")
+    data = process_pdf_with_gpt4(pdf_bytes, client=client)
+    data["extraction_source"] = "llm"
+    return data
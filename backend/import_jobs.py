@@ -0,0 +1,268 @@
+"""
+Fila de importação de PSO em background (upload de vários PDFs de uma vez).
+
+POST /api/pso/import/jobs stores one pso_import_jobs row per file and returns
+at once; the extraction (local parser or LLM, then the database writes) runs
+on a small thread pool, so neither the event loop nor the request threadpool
+waits for it. IMPORT_WORKERS bounds how many sheets are extracted at a time,
+which also bounds the concurrent LLM calls.
+
+A failed attempt is retried with exponential backoff up to IMPORT_MAX_ATTEMPTS,
+except ImportRejected (the PDF was read but is not an importable sheet).
+
+Job state lives in the database, so any uvicorn worker answers the polling and
+the SSE stream. The PDF bytes only live in the memory of the worker that got
+the upload: jobs left pending by a dead worker are failed on startup.
+"""
+import asyncio
+import json
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal, run_read
+
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+IMPORT_MAX_ATTEMPTS = int(os.getenv("IMPORT_MAX_ATTEMPTS", "3"))
+IMPORT_RETRY_SECONDS = float(os.getenv("IMPORT_RETRY_SECONDS", "5"))
+IMPORT_MAX_FILES = int(os.getenv("IMPORT_MAX_FILES", "100"))
+IMPORT_MAX_FILE_BYTES = int(os.getenv("IMPORT_MAX_FILE_BYTES", str(20 * 1024 * 1024)))
+# Pending longer than this = its worker is gone (other host/container)
+IMPORT_STALE_MINUTES = int(os.getenv("IMPORT_STALE_MINUTES", "60"))
+IMPORT_JOB_RETENTION_DAYS = int(os.getenv("IMPORT_JOB_RETENTION_DAYS", "30"))
+STREAM_POLL_SECONDS = 1.0
+KEEPALIVE_SECONDS = 15
+
+STATUSES = ("queued", "running", "retrying", "done", "failed")
+PENDING = ("queued", "running", "retrying")
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class ImportRejected(Exception):
+    """O PDF foi lido mas não é uma PSO importável; tentar de novo não muda nada."""
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows: rely on IMPORT_STALE_MINUTES
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def job_payload(job: models.ImportJob) -> dict:
+    return {
+        "id": job.id,
+        "filename": job.filename,
+        "size_bytes": job.size_bytes,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": job.error,
+        "result": json.loads(job.result) if job.result else None,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at
+    }
+
+
+def batch_payload(db: Session, batch_id: str) -> Optional[dict]:
+    jobs = db.query(models.ImportJob).filter(models.ImportJob.batch_id == batch_id).order_by(
+        models.ImportJob.position
+    ).all()
+    if not jobs:
+        return None
+    counts = {status: 0 for status in STATUSES}
+    for job in jobs:
+        counts[job.status] = counts.get(job.status, 0) + 1
+    return {
+        "batch_id": batch_id,
+        "total": len(jobs),
+        **counts,
+        "finished": counts["done"] + counts["failed"] == len(jobs),
+        "jobs": [job_payload(job) for job in jobs]
+    }
+
+
+class ImportJobQueue:
+    """
+    `handler(db, pdf_bytes)` imports one sheet and returns the JSON stored as
+    the job result. It must commit once at the end (a retry re-runs it whole).
+    """
+
+    def __init__(self, handler: Callable[[Session, bytes], dict], workers: int = IMPORT_WORKERS,
+                 max_attempts: int = IMPORT_MAX_ATTEMPTS, retry_seconds: float = IMPORT_RETRY_SECONDS):
+        self._handler = handler
+        self._workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._content: Dict[str, bytes] = {}
+        self._closed = False
+
+    @staticmethod
+    def validate(content: bytes) -> Optional[str]:
+        if not content:
+            return "Empty file"
+        if len(content) > IMPORT_MAX_FILE_BYTES:
+            return f"File larger than {IMPORT_MAX_FILE_BYTES // (1024 * 1024)} MB"
+        if not content.lstrip()[:5].startswith(b"%PDF"):
+            return "Not a PDF file"
+        return None
+
+    def submit(self, db: Session, files: List[Tuple[str, bytes]]) -> dict:
+        """Queues one job per (filename, bytes); invalid files become failed jobs. Returns the batch."""
+        batch_id = uuid.uuid4().hex
+        now = datetime.utcnow()
+        queued = []
+        for position, (filename, content) in enumerate(files):
+            problem = self.validate(content)
+            job = models.ImportJob(
+                id=uuid.uuid4().hex, batch_id=batch_id, position=position, filename=filename,
+                size_bytes=len(content), status="failed" if problem else "queued", attempts=0,
+                worker=WORKER_ID, error=problem, created_at=now, finished_at=now if problem else None
+            )
+            db.add(job)
+            if not problem:
+                queued.append((job.id, content))
+        db.commit()
+        with self._lock:
+            for job_id, content in queued:
+                self._content[job_id] = content
+        for job_id, _ in queued:
+            self._schedule(job_id)
+        return batch_payload(db, batch_id)
+
+    def _schedule(self, job_id: str):
+        with self._lock:
+            if self._closed:
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="pso-import")
+            self._executor.submit(self._run, job_id)
+
+    def _retry_later(self, job_id: str, delay: float):
+        timer = threading.Timer(delay, self._schedule, args=(job_id,))
+        timer.daemon = True
+        timer.start()
+
+    def _run(self, job_id: str):
+        content = self._content.get(job_id)
+        if content is None:
+            return
+        db = SessionLocal()
+        try:
+            job = db.get(models.ImportJob, job_id)
+            if job is None:
+                self._content.pop(job_id, None)
+                return
+            job.status = "running"
+            job.attempts = (job.attempts or 0) + 1
+            job.started_at = job.started_at or datetime.utcnow()
+            db.commit()
+
+            try:
+                result = self._handler(db, content)
+            except Exception as e:
+                db.rollback()
+                job.error = str(e) or e.__class__.__name__
+                if not isinstance(e, ImportRejected) and job.attempts < self.max_attempts:
+                    delay = self.retry_seconds * 2 ** (job.attempts - 1)
+                    job.status = "retrying"
+                    db.commit()
+                    print(f"⚠️ PSO import {job.filename} failed (attempt {job.attempts}), retrying in {delay:.0f}s: {e}")
+                    self._retry_later(job_id, delay)
+                    return
+                job.status = "failed"
+                job.finished_at = datetime.utcnow()
+                db.commit()
+                self._content.pop(job_id, None)
+                print(f"❌ PSO import {job.filename} failed: {e}")
+                return
+
+            job.status = "done"
+            job.error = None
+            job.result = json.dumps(jsonable_encoder(result))
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            self._content.pop(job_id, None)
+        except Exception as e:
+            # Bookkeeping failed (database down): the job stays pending until recover()
+            print(f"❌ PSO import job {job_id} could not be updated: {e}")
+        finally:
+            db.close()
+
+    def recover(self, db: Session) -> int:
+        """
+        Startup: fails the pending jobs whose worker is gone (restart, crash,
+        another container that stopped long ago) and prunes old jobs.
+        """
+        host = socket.gethostname()
+        stale_before = datetime.utcnow() - timedelta(minutes=IMPORT_STALE_MINUTES)
+        failed = 0
+        for job in db.query(models.ImportJob).filter(models.ImportJob.status.in_(PENDING)).all():
+            job_host, _, pid = (job.worker or "").rpartition(":")
+            if job.worker == WORKER_ID:
+                orphan = job.id not in self._content
+            elif job_host == host and pid.isdigit():
+                orphan = not _pid_alive(int(pid))
+            else:
+                orphan = job.created_at is None or job.created_at < stale_before
+            if orphan:
+                job.status = "failed"
+                job.error = "Interrupted: the server restarted before the import finished. Upload the file again."
+                job.finished_at = datetime.utcnow()
+                failed += 1
+        db.query(models.ImportJob).filter(
+            models.ImportJob.status.in_(("done", "failed")),
+            models.ImportJob.finished_at < datetime.utcnow() - timedelta(days=IMPORT_JOB_RETENTION_DAYS)
+        ).delete(synchronize_session=False)
+        db.commit()
+        return failed
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def events(self, batch_id: str):
+        """
+        Server-Sent Events of one batch: a `progress` event whenever a job
+        changes, `done` when every job finished. Reads the database, so it
+        follows jobs running on any worker.
+        """
+        last = None
+        idle = 0.0
+        while True:
+            batch = await run_read(batch_payload, batch_id)
+            if batch is None:
+                yield f"event: error\ndata: {json.dumps({'detail': 'Import batch not found'})}\n\n"
+                return
+            payload = json.dumps(jsonable_encoder(batch))
+            if batch["finished"]:
+                yield f"event: done\ndata: {payload}\n\n"
+                return
+            if payload != last:
+                last = payload
+                idle = 0.0
+                yield f"event: progress\ndata: {payload}\n\n"
+            elif idle >= KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield ": keepalive\n\n"
+            await asyncio.sleep(STREAM_POLL_SECONDS)
+            idle += STREAM_POLL_SECONDS
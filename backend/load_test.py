@@ -0,0 +1,156 @@
+"""
+Teste de carga: reproduz o polling das telas do chão de fábrica.
+
+Each virtual terminal polls like the real page does:
+    page_01 (Monitor)      GET /api/dashboard/active-status          every 1 s
+    page_05 (Checklist)    GET /api/batches/pending                  every 5 s
+    page_03 (Engenharia)   GET /api/production/active + /api/products every 30 s
+    page_07 (BI)           GET /api/analytics/dashboard?hours=8      every 30 s
+plus checkout terminals that take the first pending cart and check it out.
+Reports p50/p95/p99 per endpoint at the end.
+
+Uso (database seeded with seed_dataset.py):
+    python load_test.py --base-url http://localhost:8001 --duration 60 --monitors 20 --checklists 20
+    DATABASE_URL=sqlite:////tmp/sgp_load.db python load_test.py --in-process --duration 30
+"""
+import argparse
+import asyncio
+import logging
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, **kwargs):
+        label = f"{method} {ID_SEGMENT.sub('/{id}', url.split('?')[0])}"
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[label] += 1
+            return None
+        self.latencies[label].append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 500:
+            self.errors[label] += 1
+        return response
+
+
+async def sleep_until(deadline, seconds):
+    await asyncio.sleep(max(0.0, min(seconds, deadline - time.monotonic())))
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def poller(recorder, client, deadline, interval, requests):
+    # Terminals are not switched on in the same millisecond
+    await sleep_until(deadline, random.uniform(0, interval))
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        for method, url in requests:
+            await recorder.request(client, method, url)
+        await sleep_until(deadline, interval - (time.monotonic() - started))
+
+
+async def checkout_terminal(recorder, client, deadline, interval, workstation_id):
+    await sleep_until(deadline, random.uniform(0, interval))
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        response = await recorder.request(client, "GET", "/api/batches/pending")
+        batches = response.json().get("batches", []) if response is not None and response.status_code == 200 else []
+        if batches:
+            cart = batches[0]
+            payload = {"workstation_id": workstation_id}
+            if cart.get("id") is not None:
+                payload["batch_id"] = cart["id"]
+            else:
+                payload.update({"planning_id": cart["planning_id"], "sequence": cart["sequence"]})
+            # 409/404 happen when two terminals race for the same cart, as on the floor
+            await recorder.request(client, "POST", "/api/batches/checkout", json=payload)
+        await sleep_until(deadline, interval - (time.monotonic() - started))
+
+
+def report(recorder, elapsed):
+    print(f"\n{'endpoint':<42} {'count':>7} {'err':>5} {'rps':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    total = 0
+    for label in sorted(recorder.latencies):
+        values = sorted(recorder.latencies[label])
+        total += len(values)
+        print(f"{label:<42} {len(values):>7} {recorder.errors[label]:>5} {len(values) / elapsed:>7.1f} "
+              f"{percentile(values, 50):>8.1f} {percentile(values, 95):>8.1f} {percentile(values, 99):>8.1f} "
+              f"{values[-1]:>8.1f}")
+    print(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+
+
+async def run(args):
+    if args.in_process:
+        from main import app
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=args.timeout)
+    else:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits)
+
+    recorder = Recorder()
+    deadline = time.monotonic() + args.duration
+    tasks = []
+    async with client:
+        for _ in range(args.monitors):
+            tasks.append(poller(recorder, client, deadline, 1, [("GET", "/api/dashboard/active-status")]))
+        for _ in range(args.checklists):
+            tasks.append(poller(recorder, client, deadline, 5, [("GET", "/api/batches/pending")]))
+        for _ in range(args.engineering):
+            tasks.append(poller(recorder, client, deadline, 30, [("GET", "/api/production/active"), ("GET", "/api/products")]))
+        for _ in range(args.analysts):
+            tasks.append(poller(recorder, client, deadline, 30, [("GET", "/api/analytics/dashboard?hours=8")]))
+        for n in range(args.checkouts):
+            tasks.append(checkout_terminal(recorder, client, deadline, args.checkout_interval, n + 1))
+
+        print(f"{len(tasks)} virtual terminals for {args.duration}s against "
+              f"{'the in-process app' if args.in_process else args.base_url}")
+        started = time.monotonic()
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+
+    report(recorder, elapsed)
+    return 1 if any(recorder.errors.values()) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the floor terminals' polling mix against the API")
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--in-process", action="store_true", help="Call main.app directly (uses DATABASE_URL)")
+    parser.add_argument("--duration", type=int, default=60, help="Seconds")
+    parser.add_argument("--monitors", type=int, default=4, help="page_01 terminals (1 s)")
+    parser.add_argument("--checklists", type=int, default=10, help="page_05 terminals (5 s)")
+    parser.add_argument("--engineering", type=int, default=2, help="page_03 terminals (30 s)")
+    parser.add_argument("--analysts", type=int, default=2, help="page_07 terminals (30 s)")
+    parser.add_argument("--checkouts", type=int, default=1, help="Terminals checking out carts")
+    parser.add_argument("--checkout-interval", type=float, default=10.0, help="Seconds between checkouts per terminal")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    # One INFO line per request would drown the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    random.seed(args.seed)
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,10 @@
 from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, PlainTextResponse, FileResponse
+from fastapi.routing import APIRoute
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, func, exists, insert
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime, timedelta, time
@@ -12,9 +13,27 @@ import json
 import math
 import logging
 
-from database import engine, get_db, Base
+from database import engine, get_db, Base, SessionLocal, run_read, dispose_async_engine
 import models
-import extractor
+from engine import summarize_operations, balance_line
+from dashboard_stream import DashboardBroadcaster
+from production_state import production_state, planning_tp_minutes
+from pause_log import pause_log
+from scenarios import scenario_runner
+from shift_calendar import ShiftCalendar, shift_calendar_cache
+from simulation import CartFlowModel, run_monte_carlo
+from request_metrics import RequestMetricsMiddleware, request_metrics
+from sampling_profiler import sampling_profiler
+from auth import require_admin
+from extraction_cache import extraction_cache
+from import_jobs import ImportJobQueue, ImportRejected, IMPORT_MAX_FILES, batch_payload, job_payload
+from process_pool import shutdown_process_pool
+from rollups import hour_bucket, cycle_start, record_cycle, rebuild_rollups, rollup_rebuild
+import pso_store
+from carts import (
+    LAZY_CART_GENERATION, split_cart_quantities, list_planning_carts, count_planning_carts, materialize_cart,
+    CartAlreadyCheckedOut
+)
 from fastapi.templating import Jinja2Templates
 
 cart_logger = logging.getLogger("cart_lote")
@@ -48,62 +67,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all methods
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["X-Query-Count", "X-DB-Time-Ms", "X-Debug-Queries"],
 )
+# Outermost: counts SQL, DB time and bytes of every request (see /api/_metrics)
+app.add_middleware(RequestMetricsMiddleware)
 
 # Shift Configuration Helper
 def get_shift_config(db: Session):
-    config_entry = db.query(models.SystemConfig).filter(models.SystemConfig.key == "SHIFT_CONFIG").first()
-    if config_entry:
-        return json.loads(config_entry.value)
-    # Default Config
-    return {
-        "start_time": "07:00",
-        "end_time": "17:00",
-        "breaks": [
-            {"start": "12:00", "end": "13:00"}
-        ]
-    }
+    return get_shift_calendar(db).config
+
+def get_shift_calendar(db: Session) -> ShiftCalendar:
+    """Calendário de turno compilado (cache em memória, ver shift_calendar)."""
+    return shift_calendar_cache.get(db)
 
 def calculate_working_minutes(db: Session, start_dt: datetime, end_dt: datetime) -> float:
     """
-    Calculate actual working minutes between two datetimes,
-    using dynamic configuration from DB.
+    Minutos trabalhados entre dois instantes segundo o calendário de turno:
+    only the shift windows (start..end minus breaks) of working days count,
+    across any number of days.
     """
-    total_minutes = (end_dt - start_dt).total_seconds() / 60
-    
-    config = get_shift_config(db)
-    breaks_config = config.get("breaks", [])
-    
-    # Parse dynamic breaks
-    parsed_breaks = []
-    for brk in breaks_config:
-        try:
-            b_start = datetime.strptime(brk["start"], "%H:%M").time()
-            b_end = datetime.strptime(brk["end"], "%H:%M").time()
-            parsed_breaks.append((b_start, b_end))
-        except ValueError: 
-            continue
-
-    for b_start, b_end in parsed_breaks:
-        # Check if work interval overlaps with this break
-        if start_dt.time() < b_end and end_dt.time() > b_start:
-            
-            # CRITICAL FIX for "Production During Break":
-            if start_dt.time() >= b_start:
-                continue 
-
-            # Calculate intersection
-            overlap_start = max(start_dt.time(), b_start)
-            overlap_end = min(end_dt.time(), b_end)
-            
-            overlap_minutes = (
-                datetime.combine(start_dt.date(), overlap_end) -
-                datetime.combine(start_dt.date(), overlap_start)
-            ).total_seconds() / 60
-            
-            total_minutes -= overlap_minutes
-    
-    return max(total_minutes, 0)
+    return get_shift_calendar(db).working_minutes(start_dt, end_dt)
 
 def calculate_working_minutes_with_pauses(
     db: Session, 
@@ -113,38 +96,80 @@ def calculate_working_minutes_with_pauses(
 ) -> float:
     """
     Calcula os minutos trabalhados descontando almoço E pausas registradas.
+    As pausas vêm da linha do tempo em memória (pause_log), não do banco.
     """
-    # 1. Cálculo Bruto (incluindo lógica de almoço dinâmica)
-    total_minutes = calculate_working_minutes(db, start_dt, end_dt) 
-    
-    # 2. Buscar eventos de pausa/retorno para este planejamento
-    events = db.query(models.ProductionEvent).filter(
-        models.ProductionEvent.planning_id == planning_id
-    ).order_by(models.ProductionEvent.created_at).all()
-    
-    pause_minutes = 0.0
-    pause_start = None
+    # 1. Minutos do calendário de turno (janelas, fins de semana, feriados)
+    calendar = get_shift_calendar(db)
+    total_minutes = calendar.working_minutes(start_dt, end_dt)
     
-    # Filter only relevant events (optimization)
-    relevant_events = [e for e in events if e.created_at >= start_dt and e.created_at <= end_dt]
-    
-    for event in relevant_events:
-        if event.event_type == 'pause':
-            if not pause_start: 
-                pause_start = event.created_at
-        elif event.event_type == 'resume' and pause_start:
-            duration = (event.created_at - pause_start).total_seconds() / 60
-            pause_minutes += duration
-            pause_start = None
-            
-    if pause_start and pause_start < end_dt:
-        duration = (end_dt - pause_start).total_seconds() / 60
-        pause_minutes += duration
+    # 2. Pausas/retornos deste planejamento (só o tempo de turno conta)
+    pause_minutes = pause_log.paused_minutes(db, planning_id, start_dt, end_dt, calendar)
 
     return max(total_minutes - pause_minutes, 0)
 
+def apply_pso_aggregates(pso: models.PSO, operations) -> dict:
+    """Stores the denormalized totals of `operations` on the PSO row."""
+    summary = summarize_operations(operations)
+    pso.active_tp_minutes = summary["active_tp_minutes"]
+    pso.inactive_tp_minutes = summary["inactive_tp_minutes"]
+    pso.active_operation_count = summary["active_operation_count"]
+    pso.inactive_operation_count = summary["inactive_operation_count"]
+    pso.machine_minutes = json.dumps(summary["machine_minutes"])
+    return summary
+
+def refresh_pso_aggregates(db: Session, pso: models.PSO) -> dict:
+    """Recomputes the PSO totals from its operations."""
+    operations = db.query(models.Operation).filter(models.Operation.pso_id == pso.id).all()
+    return apply_pso_aggregates(pso, operations)
+
 # ... (Seeding remains the same)
 
+# ==================== Metrics ====================
+
+@app.get("/api/_metrics", response_class=PlainTextResponse)
+def get_request_metrics():
+    """Per-endpoint requests, latency, SQL statements, DB/Python time and bytes (Prometheus text format)."""
+    return PlainTextResponse(request_metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+class ProfilerStartRequest(BaseModel):
+    seconds: float = 30
+    interval_ms: float = 10
+    format: str = "collapsed"  # "collapsed" (flamegraph.pl) or "speedscope"
+
+def endpoint_codes() -> dict:
+    """Code object of each endpoint -> route path, for the per-route hotspots."""
+    return {route.endpoint.__code__: route.path for route in app.routes if isinstance(route, APIRoute)}
+
+@app.post("/api/_profiler/start")
+def start_profiler(data: ProfilerStartRequest, admin: str = Depends(require_admin)):
+    """Samples every thread of this worker for N seconds and writes the stacks to disk (admin only)."""
+    try:
+        started = sampling_profiler.start(data.seconds, data.interval_ms, data.format, endpoint_codes())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    print(f"🔬 Profiler started by {admin} for {started['seconds']}s")
+    return started
+
+@app.post("/api/_profiler/stop")
+def stop_profiler(admin: str = Depends(require_admin)):
+    sampling_profiler.stop()
+    return sampling_profiler.status()
+
+@app.get("/api/_profiler")
+def get_profiler_status(admin: str = Depends(require_admin)):
+    """State of the capture and, once finished, the file and the hotspots per route."""
+    return sampling_profiler.status()
+
+@app.get("/api/_profiler/download")
+def download_profile(admin: str = Depends(require_admin)):
+    result = sampling_profiler.last_result
+    if not result or not result.get("file") or not os.path.exists(result["file"]):
+        raise HTTPException(status_code=404, detail="No profile captured yet")
+    return FileResponse(result["file"], filename=os.path.basename(result["file"]))
+
 # ==================== System Config Endpoints ====================
 
 class BreakInterval(BaseModel):
@@ -157,10 +182,16 @@ class ShiftConfigModel(BaseModel):
     start_time: str
     end_time: str
     breaks: List[BreakInterval]
+    workdays: Optional[List[int]] = None  # Monday=0 .. Sunday=6; None = every day
+    holidays: Optional[List[str]] = None  # "YYYY-MM-DD"
 
 @app.post("/api/config/shift")
 def save_shift_config(config: ShiftConfigModel, db: Session = Depends(get_db)):
     """Save shift configuration"""
+    try:
+        ShiftCalendar(config.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid shift configuration: {e}")
     config_json = json.dumps(config.dict())
     
     existing = db.query(models.SystemConfig).filter(models.SystemConfig.key == "SHIFT_CONFIG").first()
@@ -170,6 +201,8 @@ def save_shift_config(config: ShiftConfigModel, db: Session = Depends(get_db)):
         db.add(models.SystemConfig(key="SHIFT_CONFIG", value=config_json))
     
     db.commit()
+    shift_calendar_cache.invalidate()
+    dashboard_broadcaster.notify_change()
     return {"message": "Configuration saved"}
 
 @app.get("/api/config/shift")
@@ -189,7 +222,10 @@ def seed_seamstresses(db: Session):
 # We will check this inside the setup endpoint lazily or just once.
 
 class CheckoutRequest(BaseModel):
-    batch_id: int
+    batch_id: Optional[int] = None
+    # Lazy plannings: pending carts have no row yet, identified by planning + sequence
+    planning_id: Optional[int] = None
+    sequence: Optional[int] = None
     workstation_id: Optional[int] = None
 
 class AllocationItem(BaseModel):
@@ -208,6 +244,44 @@ class PlanningSyncRequest(BaseModel):
     batch_size: Optional[int] = None
     total_quantity: Optional[int] = 1000 # Default if not provided
 
+class ScenarioRequest(BaseModel):
+    pso_id: int
+    operator_counts: Optional[List[int]] = None # None = active seamstresses
+    pulse_durations: Optional[List[int]] = [30, 60]
+    batch_sizes: Optional[List[int]] = None # None = TL calculado por ponto
+    total_quantity: Optional[int] = 1000
+    start_at: Optional[datetime] = None # None = now
+
+MAX_SCENARIO_POINTS = 5000
+
+class SimulationRequest(BaseModel):
+    # Either an existing planning...
+    planning_id: Optional[int] = None
+    # ...or a proposed balance, same fields as PlanningSyncRequest (not yet published)
+    pso_id: Optional[int] = None
+    allocations: Optional[List[AllocationItem]] = None
+    pulse_duration: Optional[int] = 60
+    batch_size: Optional[int] = None
+    total_quantity: Optional[int] = 1000
+    # Monte Carlo
+    replications: Optional[int] = 500
+    seed: Optional[int] = None
+    efficiency_mean: Optional[float] = None # None = PSO default_efficiency_factor
+    efficiency_sd: Optional[float] = 0.1
+    start_at: Optional[datetime] = None # None = now
+
+MAX_SIMULATION_REPLICATIONS = 20000
+
+class AutoBalanceRequest(BaseModel):
+    pso_id: int
+    pulse_duration: Optional[int] = 60
+    batch_size: Optional[int] = None # None = TL calculado (calculate_tl)
+    seamstress_ids: Optional[List[int]] = None # None = all active, in ID order
+    allow_fractions: Optional[bool] = True
+    max_machines_per_station: Optional[int] = 2
+    mode: Optional[str] = "heuristic" # "heuristic" or "exact"
+    time_budget_ms: Optional[int] = 2000
+
 
 @app.on_event("startup")
 def startup_event():
@@ -225,6 +299,22 @@ def startup_event():
     seed_seamstresses(db)
     seed_default_user(db)
 
+    try:
+        warmed = pause_log.warm(db)
+        print(f"✅ Pause timelines loaded for {warmed} planning(s)")
+    except Exception as e:
+        print(f"⚠️ Error loading pause timelines: {e}")
+
+    # First boot with rollups: build them from the existing checkout history
+    try:
+        if db.query(models.ProductionRollup.id).first() is None and db.query(models.BatchTracking.id).first() is not None:
+            replayed = rebuild_rollups(db, calculate_working_minutes_with_pauses)
+            db.commit()
+            print(f"✅ Rollups rebuilt from {replayed} cycle(s)")
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️ Error rebuilding rollups: {e}")
+
 def seed_default_user(db: Session):
     """Create default admin user if no users exist"""
     try:
@@ -389,6 +479,7 @@ def update_seamstress(id: int, data: SeamstressUpdate, db: Session = Depends(get
         s.status = "Ativa" if data.is_active else "Inativa" # Sync legacy field
         
     db.commit()
+    production_state.invalidate()
     db.commit()
     return {"message": "Seamstress updated"}
 
@@ -428,48 +519,50 @@ def get_products(db: Session = Depends(get_db)):
     Returns list of all products with their PSO versions and calculated metrics.
     Used by Tela 03 (OP Management).
     """
-    products = db.query(models.Product).all()
-    
+    # Does this product reference have an active planning?
+    has_active_planning = exists().where(
+        models.ProductionOrder.product_reference == models.Product.reference,
+        models.ProductionPlanning.production_order_id == models.ProductionOrder.id,
+        models.ProductionPlanning.is_active == True
+    ).correlate(models.Product)
+
+    rows = db.query(
+        models.Product.reference,
+        models.Product.description,
+        models.PSO.id,
+        models.PSO.version_name,
+        models.PSO.status,
+        models.PSO.default_efficiency_factor,
+        models.PSO.created_at,
+        models.PSO.active_operation_count,
+        models.PSO.active_tp_minutes,
+        models.PSO.machine_minutes,
+        has_active_planning.label("has_active_planning")
+    ).join(
+        models.PSO, models.PSO.product_id == models.Product.id
+    ).filter(
+        models.PSO.is_archived.isnot(True)  # Exclude archived
+    ).order_by(desc(models.PSO.created_at)).all()  # Most recent first
+
     result = []
-    for product in products:
-        # Filter PSOs: Exclude archived
-        active_psos = [p for p in product.psos if not p.is_archived]
-        
-        for pso in active_psos:
-            # Calculate total TP (sum of all operation times)
-            operations = db.query(models.Operation).filter(models.Operation.pso_id == pso.id).all()
-            # Check if this PSO has an active planning
-            has_active_planning = db.query(models.ProductionPlanning).join(
-                models.ProductionOrder
-            ).filter(
-                models.ProductionOrder.product_reference == product.reference,
-                models.ProductionPlanning.is_active == True
-            ).first() is not None
-
-            # Count only ACTIVE operations
-            active_ops = [op for op in operations if op.is_active]
-            active_ops_count = len(active_ops)
-
-            # Calculate total TP based on ACTIVE operations and EFFICIENCY factor
-            # TP Real = TP Standard / Efficiency
-            efficiency = pso.default_efficiency_factor or 1.0
-            total_tp_minutes = sum(op.final_time for op in active_ops if op.final_time) / efficiency
+    for row in rows:
+        # Calculate total TP based on ACTIVE operations and EFFICIENCY factor
+        # TP Real = TP Standard / Efficiency
+        efficiency = row.default_efficiency_factor or 1.0
+        total_tp_minutes = (row.active_tp_minutes or 0.0) / efficiency
 
-            result.append({
-                "product_reference": product.reference,
-                "product_description": product.description,
-                "pso_id": pso.id,
-                "pso_version": pso.version_name,
-                "status": pso.status,
-                "total_tp_minutes": round(total_tp_minutes, 4),
-                "operation_count": active_ops_count, # Return only active count
-                "operation_count": active_ops_count, # Return only active count
-                "created_at": pso.created_at,
-                "has_active_planning": has_active_planning
-            })
-    
-    # Sort by most recent first
-    result.sort(key=lambda x: x["created_at"], reverse=True)
+        result.append({
+            "product_reference": row.reference,
+            "product_description": row.description,
+            "pso_id": row.id,
+            "pso_version": row.version_name,
+            "status": row.status,
+            "total_tp_minutes": round(total_tp_minutes, 4),
+            "operation_count": row.active_operation_count or 0, # Return only active count
+            "machine_minutes": json.loads(row.machine_minutes or "{}"),
+            "created_at": row.created_at,
+            "has_active_planning": bool(row.has_active_planning)
+        })
     
     return {"products": result}
 
@@ -487,7 +580,7 @@ def get_pso_details(pso_id: int, db: Session = Depends(get_db)):
         models.Operation.pso_id == pso_id
     ).order_by(models.Operation.sequence).all()
     
-    total_tp = sum(op.final_time for op in operations if op.final_time)
+    total_tp = (pso.active_tp_minutes or 0.0) + (pso.inactive_tp_minutes or 0.0)
     
     return {
         "pso_id": pso.id,
@@ -497,6 +590,7 @@ def get_pso_details(pso_id: int, db: Session = Depends(get_db)):
         "status": pso.status,
         "total_tp_minutes": round(total_tp, 4),
         "default_efficiency_factor": pso.default_efficiency_factor, # Return saved efficiency
+        "machine_minutes": json.loads(pso.machine_minutes or "{}"),
         "operations": [
             {
                 "sequence": op.sequence,
@@ -560,16 +654,16 @@ def get_planning_setup(pso_id: Optional[int] = None, db: Session = Depends(get_d
         # --- SPRINT 13: SHIELDING CODE (CAPACITY CALCULATION) ---
         num_active_operators = len(seamstresses)
         
-        # Calculate total TP of the product (in minutes)
-        total_tp_minutes = sum(op['time'] for op in operations) / 60.0
+        # Total TP of the product (in minutes), denormalized on the PSO row
+        total_tp_minutes = (pso.active_tp_minutes or 0.0) / eff_factor
 
         if num_active_operators == 0:
             suggested_tl = 10 
             target_tact = 0
             print("⚠️ Warning: No active seamstresses found for calculation.")
         else:
-            # 2. Total Capacity (528 min * operators)
-            total_available_minutes = 528 * num_active_operators
+            # 2. Total Capacity (productive shift minutes * operators)
+            total_available_minutes = get_shift_calendar(db).day_minutes * num_active_operators
             
             # 3. Suggested Batch Size (TL)
             if total_tp_minutes > 0:
@@ -601,6 +695,208 @@ def get_planning_setup(pso_id: Optional[int] = None, db: Session = Depends(get_d
         }
     }
 
+@app.post("/api/planning/auto-balance")
+def auto_balance_planning(data: AutoBalanceRequest, db: Session = Depends(get_db)):
+    """
+    Suggests a balance for the Cockpit (Tela 04) using engine.balance_line.
+    The returned allocations have the same shape accepted by /api/planning/sync.
+    """
+    if data.mode not in ("heuristic", "exact"):
+        raise HTTPException(status_code=422, detail="mode must be 'heuristic' or 'exact'")
+
+    pso = db.query(models.PSO).filter(models.PSO.id == data.pso_id).first()
+    if not pso:
+        raise HTTPException(status_code=404, detail=f"PSO with ID {data.pso_id} not found")
+
+    seamstress_query = db.query(models.Seamstress).filter(models.Seamstress.is_active == True)
+    if data.seamstress_ids:
+        seamstress_query = seamstress_query.filter(models.Seamstress.id.in_(data.seamstress_ids))
+    seamstresses = seamstress_query.order_by(models.Seamstress.id).all()
+    if not seamstresses:
+        raise HTTPException(status_code=400, detail="No active seamstresses available for balancing")
+
+    ops = db.query(models.Operation).filter(
+        models.Operation.pso_id == pso.id,
+        models.Operation.is_active == True
+    ).order_by(models.Operation.sequence).all()
+    if not ops:
+        raise HTTPException(status_code=400, detail="PSO has no active operations")
+
+    pulse_duration = data.pulse_duration or 60
+    result = balance_line(
+        [
+            {"id": op.id, "sequence": op.sequence, "macro_machine": op.macro_machine, "final_time": op.final_time}
+            for op in ops
+        ],
+        [s.id for s in seamstresses],
+        pulse_duration,
+        efficiency_factor=pso.default_efficiency_factor or 1.0,
+        batch_size=data.batch_size,
+        allow_fractions=data.allow_fractions if data.allow_fractions is not None else True,
+        max_machines_per_station=data.max_machines_per_station or 2,
+        mode=data.mode,
+        time_budget_ms=min(max(data.time_budget_ms or 2000, 50), 30000)
+    )
+
+    if not result["feasible"]:
+        raise HTTPException(status_code=422, detail="Could not find a feasible balance for this PSO")
+
+    names = {s.id: s.name for s in seamstresses}
+    for ws in result["workstations"]:
+        ws["seamstress_name"] = names.get(ws["workstation_id"])
+
+    return {
+        "pso_id": pso.id,
+        "pulse_duration": pulse_duration,
+        **result
+    }
+
+@app.post("/api/planning/scenarios")
+def simulate_planning_scenarios(data: ScenarioRequest, db: Session = Depends(get_db)):
+    """
+    What-if da célula: varre TL x pulso x nº de costureiras para uma PSO e
+    estima vazão, carrinhos por turno e término usando a configuração de turno.
+    """
+    pso = db.query(models.PSO).filter(models.PSO.id == data.pso_id).first()
+    if not pso:
+        raise HTTPException(status_code=404, detail=f"PSO with ID {data.pso_id} not found")
+
+    operator_counts = sorted(set(data.operator_counts or [
+        db.query(models.Seamstress).filter(models.Seamstress.is_active == True).count()
+    ]))
+    pulse_durations = sorted(set(data.pulse_durations or [60]))
+    batch_sizes = sorted(set(data.batch_sizes)) if data.batch_sizes else None
+    total_quantity = data.total_quantity or 1000
+
+    if min(operator_counts) <= 0 or min(pulse_durations) <= 0 or (batch_sizes and min(batch_sizes) <= 0):
+        raise HTTPException(status_code=422, detail="operator_counts, pulse_durations and batch_sizes must be positive")
+    n_points = len(operator_counts) * len(pulse_durations) * (len(batch_sizes) if batch_sizes else 1)
+    if n_points > MAX_SCENARIO_POINTS:
+        raise HTTPException(status_code=422, detail=f"Grid has {n_points} points (max {MAX_SCENARIO_POINTS})")
+
+    ops = db.query(
+        models.Operation.id, models.Operation.sequence, models.Operation.macro_machine, models.Operation.final_time
+    ).filter(
+        models.Operation.pso_id == pso.id,
+        models.Operation.is_active == True
+    ).order_by(models.Operation.sequence).all()
+    if not ops:
+        raise HTTPException(status_code=400, detail="PSO has no active operations")
+
+    calendar = get_shift_calendar(db)
+    result = scenario_runner.run(
+        pso_key={"id": pso.id, "version": pso.version_name},
+        ops=[
+            {"id": op.id, "sequence": op.sequence, "macro_machine": op.macro_machine, "final_time": op.final_time}
+            for op in ops
+        ],
+        efficiency_factor=pso.default_efficiency_factor or 1.0,
+        operator_counts=operator_counts,
+        pulse_durations=pulse_durations,
+        batch_sizes=batch_sizes,
+        total_quantity=total_quantity,
+        calendar=calendar,
+        start_at=data.start_at or datetime.utcnow()
+    )
+
+    return {
+        "pso_id": pso.id,
+        "pso_version": pso.version_name,
+        "total_quantity": total_quantity,
+        "shift_minutes": calendar.day_minutes,
+        "cached": result["cached"],
+        "points": result["points"]
+    }
+
+@app.post("/api/planning/simulate")
+def simulate_planning(data: SimulationRequest, db: Session = Depends(get_db)):
+    """
+    Prevê o fluxo de carrinhos de um planejamento (publicado ou proposto):
+    horário de checkout de cada carrinho, probabilidade de atraso e posto gargalo.
+    """
+    replications = data.replications or 500
+    if replications <= 0 or replications > MAX_SIMULATION_REPLICATIONS:
+        raise HTTPException(status_code=422, detail=f"replications must be between 1 and {MAX_SIMULATION_REPLICATIONS}")
+
+    station_minutes = {}
+    if data.planning_id:
+        planning = db.query(models.ProductionPlanning).filter(models.ProductionPlanning.id == data.planning_id).first()
+        if not planning:
+            raise HTTPException(status_code=404, detail=f"Planning with ID {data.planning_id} not found")
+        pso = db.query(models.PSO).filter(models.PSO.id == planning.pso_id).first()
+        batch_size = planning.batch_size or 0
+        pulse_duration = planning.pulse_duration or 60
+
+        rows = db.query(
+            models.WorkstationAllocation.seamstress_id,
+            func.coalesce(func.sum(models.Operation.final_time * models.OperationAllocation.executed_quantity), 0.0)
+        ).join(
+            models.OperationAllocation, models.OperationAllocation.allocation_id == models.WorkstationAllocation.id
+        ).join(
+            models.Operation, models.Operation.id == models.OperationAllocation.operation_id
+        ).filter(
+            models.WorkstationAllocation.planning_id == planning.id
+        ).group_by(models.WorkstationAllocation.seamstress_id).all()
+        station_minutes = {ws_id: float(load) for ws_id, load in rows}
+
+        cart_quantities = [c["quantity"] for c in list_planning_carts(db, planning)]
+    else:
+        if not data.pso_id or not data.allocations:
+            raise HTTPException(status_code=422, detail="Send planning_id or pso_id with allocations")
+        pso = db.query(models.PSO).filter(models.PSO.id == data.pso_id).first()
+        if not pso:
+            raise HTTPException(status_code=404, detail=f"PSO with ID {data.pso_id} not found")
+        batch_size = data.batch_size or 0
+        pulse_duration = data.pulse_duration or 60
+
+        op_times = dict(db.query(models.Operation.id, models.Operation.final_time).filter(
+            models.Operation.pso_id == pso.id
+        ).all())
+        for item in data.allocations:
+            if item.workstation_id is None or item.operation_id not in op_times:
+                continue
+            station_minutes[item.workstation_id] = station_minutes.get(item.workstation_id, 0.0) + \
+                (op_times[item.operation_id] or 0.0) * (item.quantity or batch_size)
+        cart_quantities = split_cart_quantities(data.total_quantity or 1000, batch_size) if batch_size > 0 else []
+
+    if batch_size <= 0 or not station_minutes or not cart_quantities:
+        raise HTTPException(status_code=400, detail="Planning has no batch size, allocations or carts to simulate")
+
+    # Stations follow the line order used by the Cockpit (seamstress ID)
+    station_ids = sorted(station_minutes)
+    eff = data.efficiency_mean or (pso.default_efficiency_factor if pso else None) or 1.0
+    model = CartFlowModel(
+        station_ids=station_ids,
+        station_minutes=[station_minutes[ws_id] for ws_id in station_ids],
+        batch_size=batch_size,
+        cart_quantities=cart_quantities,
+        pulse_duration=pulse_duration,
+        efficiency_mean=eff,
+        efficiency_sd=max(data.efficiency_sd or 0.0, 0.0)
+    )
+    result = run_monte_carlo(
+        model,
+        replications=replications,
+        seed=data.seed,
+        start_at=data.start_at or datetime.utcnow(),
+        calendar=get_shift_calendar(db)
+    )
+
+    names = dict(db.query(models.Seamstress.id, models.Seamstress.name).filter(
+        models.Seamstress.id.in_(station_ids)
+    ).all())
+    for station in result["stations"]:
+        station["seamstress_name"] = names.get(station["workstation_id"])
+
+    return {
+        "planning_id": data.planning_id,
+        "pso_id": pso.id if pso else None,
+        "pulse_duration": pulse_duration,
+        "batch_size": batch_size,
+        "efficiency_mean": eff,
+        **result
+    }
+
 @app.post("/api/planning/sync")
 def sync_planning(data: PlanningSyncRequest, db: Session = Depends(get_db)):
     """
@@ -650,7 +946,8 @@ def sync_planning(data: PlanningSyncRequest, db: Session = Depends(get_db)):
             total_quantity=total_qty,
             notes=data.notes,
             total_operators=len({a.workstation_id for a in data.allocations if a.workstation_id is not None}),
-            is_active=False  # ✅ Default to inactive. Must be started manually in Monitor (Page 01)
+            is_active=False,  # ✅ Default to inactive. Must be started manually in Monitor (Page 01)
+            lazy_carts=LAZY_CART_GENERATION
         )
         db.add(new_planning)
         db.flush()
@@ -676,35 +973,54 @@ def sync_planning(data: PlanningSyncRequest, db: Session = Depends(get_db)):
             grouped_allocations[item.workstation_id].append(item)
 
         # Get valid OP IDs for this PSO to prevent FK error
-        valid_op_ids = {row[0] for row in db.query(models.Operation.id).filter(models.Operation.pso_id == pso.id).all()}
+        op_final_times = dict(db.query(models.Operation.id, models.Operation.final_time).filter(models.Operation.pso_id == pso.id).all())
+        valid_op_ids = set(op_final_times)
+
+        # Bulk insert: one statement per table, whatever the number of seats/operations/carts
+        ws_ids = {}
+        if grouped_allocations:
+            # Create Workstation Allocations (The "Seats" at the table) and get their IDs back
+            ws_rows = db.execute(
+                insert(models.WorkstationAllocation).returning(
+                    models.WorkstationAllocation.id,
+                    models.WorkstationAllocation.seamstress_id,
+                    sort_by_parameter_order=True
+                ),
+                [
+                    {
+                        "planning_id": new_planning.id,
+                        "seamstress_id": ws_id,
+                        "position_sequence": 1, # Logic for sorting workstations not implemented yet, default 1
+                        "load_time_batch_min": 0 # Calculated later if needed
+                    }
+                    for ws_id in grouped_allocations
+                ]
+            ).all()
+            ws_ids = {seamstress_id: alloc_id for alloc_id, seamstress_id in ws_rows}
 
+        op_rows = []
+        skipped_op_ids = []
         for ws_id, items in grouped_allocations.items():
-            # Create Workstation Allocation (The "Seat" at the table)
-            ws_alloc = models.WorkstationAllocation(
-                planning_id=new_planning.id,
-                seamstress_id=ws_id,
-                position_sequence=1, # Logic for sorting workstations not implemented yet, default 1
-                load_time_batch_min=0 # Calculated later if needed
-            )
-            db.add(ws_alloc)
-            db.flush()
-
-            # Add Operations to this Workstation
             for alloc_item in items:
                 # Validation: Skip operations that don't belong to this PSO (Stale IDs from frontend)
                 if alloc_item.operation_id not in valid_op_ids:
-                    print(f"⚠️ Warning: Skipping stale/invalid operation ID {alloc_item.operation_id} (Not in PSO {pso.id})")
+                    skipped_op_ids.append(alloc_item.operation_id)
                     continue
 
-                # Create operation allocation
                 # Use frontend's is_fraction flag instead of comparing with po.quantity
-                op_alloc = models.OperationAllocation(
-                    allocation_id=ws_alloc.id,
-                    operation_id=alloc_item.operation_id,
-                    executed_quantity=alloc_item.quantity,
-                    is_fractioned=alloc_item.is_fraction  # ✅ Use frontend's flag
-                )
-                db.add(op_alloc)
+                op_rows.append({
+                    "allocation_id": ws_ids[ws_id],
+                    "operation_id": alloc_item.operation_id,
+                    "executed_quantity": alloc_item.quantity,
+                    "is_fractioned": alloc_item.is_fraction  # ✅ Use frontend's flag
+                })
+        if skipped_op_ids:
+            print(f"⚠️ Warning: Skipping {len(skipped_op_ids)} stale/invalid operation ID(s) {skipped_op_ids} (Not in PSO {pso.id})")
+        if op_rows:
+            db.execute(insert(models.OperationAllocation), op_rows)
+        # TP of the planning, read by analytics without joining the allocations
+        new_planning.tp_minutes = sum(op_final_times[row["operation_id"]] or 0.0 for row in op_rows)
+        cart_logger.info("[SYNC:allocations] planning_id=%s workstations=%s operations=%s", new_planning.id, len(ws_ids), len(op_rows))
 
         # 5. Generate Batches (CartLote) for THIS planning session
         # Update PO quantity to match current planning metadata
@@ -717,29 +1033,28 @@ def sync_planning(data: PlanningSyncRequest, db: Session = Depends(get_db)):
         db.flush()
 
         # Generate new batches based on total quantity and batch size
-        num_lotes = math.ceil(total_qty / batch_size_val)
-        cart_logger.info("[SYNC:batches] planning_id=%s num=%s batch_size=%s", new_planning.id, num_lotes, batch_size_val)
-        
-        for i in range(num_lotes):
-            # Calculate quantity for this specific batch
-            current_qty = batch_size_val
-            # If it's the last batch, check if it's partial
-            if (i + 1) * batch_size_val > total_qty:
-                current_qty = total_qty % batch_size_val
-                if current_qty == 0:
-                    current_qty = batch_size_val
-            
-            new_lote = models.CartLote(
-                production_order_id=po.id,
-                planning_id=new_planning.id,  # ✅ Link to this specific session
-                sequence_number=i + 1,
-                quantity_pieces=current_qty,
-                status="Aguardando"
-            )
-            db.add(new_lote)
-            cart_logger.info("[SYNC:cart] seq=%s qty=%s planning_id=%s", i + 1, current_qty, new_planning.id)
+        quantities = split_cart_quantities(total_qty, batch_size_val)
+        num_lotes = len(quantities)
+        # Lazy plannings derive their carts on demand (see carts.py)
+        if quantities and not new_planning.lazy_carts:
+            db.execute(insert(models.CartLote), [
+                {
+                    "production_order_id": po.id,
+                    "planning_id": new_planning.id,  # ✅ Link to this specific session
+                    "sequence_number": i + 1,
+                    "quantity_pieces": current_qty,
+                    "status": "Aguardando"
+                }
+                for i, current_qty in enumerate(quantities)
+            ])
+        cart_logger.info(
+            "[SYNC:batches] planning_id=%s num=%s batch_size=%s last_qty=%s lazy=%s",
+            new_planning.id, num_lotes, batch_size_val, quantities[-1] if quantities else 0, new_planning.lazy_carts
+        )
 
         db.commit()
+        production_state.invalidate()
+        dashboard_broadcaster.notify_change()
         cart_logger.info("[SYNC:done] planning_id=%s num_lotes=%s", new_planning.id, num_lotes)
         return {"status": "synced", "message": "Balanceamento publicado com sucesso!", "planning_id": new_planning.id}
 
@@ -1013,6 +1328,8 @@ def delete_planning(planning_id: int, db: Session = Depends(get_db)):
         # Finally delete the planning itself
         db.delete(planning)
         db.commit()
+        production_state.invalidate()
+        dashboard_broadcaster.notify_change()
         
         return {
             "status": "deleted",
@@ -1060,6 +1377,8 @@ def start_production(data: dict, db: Session = Depends(get_db)):
             event_type="start"
         ))
         db.commit()
+        production_state.record_event(planning.id, "start", datetime.utcnow())
+        dashboard_broadcaster.notify_change()
         cart_logger.info("[START:done] planning=%s active=%s", planning.id, planning.is_active)
         
         return {
@@ -1087,8 +1406,12 @@ def pause_production(data: dict, db: Session = Depends(get_db)):
         if not planning or not planning.is_active:
             raise HTTPException(status_code=400, detail="Planning not found or not active")
             
-        db.add(models.ProductionEvent(planning_id=planning.id, event_type="pause"))
+        event_time = datetime.utcnow()
+        db.add(models.ProductionEvent(planning_id=planning.id, event_type="pause", created_at=event_time))
         db.commit()
+        production_state.record_event(planning.id, "pause", event_time)
+        pause_log.record_event(planning.id, "pause", event_time)
+        dashboard_broadcaster.notify_change()
         return {"status": "paused", "message": "Produção pausada"}
     except Exception as e:
         db.rollback()
@@ -1104,8 +1427,12 @@ def resume_production(data: dict, db: Session = Depends(get_db)):
         if not planning or not planning.is_active:
             raise HTTPException(status_code=400, detail="Planning not found or not active")
             
-        db.add(models.ProductionEvent(planning_id=planning.id, event_type="resume"))
+        event_time = datetime.utcnow()
+        db.add(models.ProductionEvent(planning_id=planning.id, event_type="resume", created_at=event_time))
         db.commit()
+        production_state.record_event(planning.id, "resume", event_time)
+        pause_log.record_event(planning.id, "resume", event_time)
+        dashboard_broadcaster.notify_change()
         return {"status": "resumed", "message": "Produção retomada"}
     except Exception as e:
         db.rollback()
@@ -1122,11 +1449,21 @@ def stop_production(data: dict, db: Session = Depends(get_db)):
             raise HTTPException(status_code=404, detail="Planning not found")
             
         # Log event and deactivate
-        db.add(models.ProductionEvent(planning_id=planning.id, event_type="stop"))
+        stop_time = datetime.utcnow()
+        db.add(models.ProductionEvent(planning_id=planning.id, event_type="stop", created_at=stop_time))
+
+        # Worked time since the last checkout counts in the rollups even without a cart
+        if planning.is_active:
+            cycle_begin = cycle_start(db, planning, stop_time, include_end=True)
+            tail_minutes = calculate_working_minutes_with_pauses(db, planning.id, cycle_begin, stop_time)
+            if tail_minutes > 0:
+                record_cycle(db, planning, stop_time, tail_minutes)
         
         # Deactivate
         planning.is_active = False
         db.commit()
+        production_state.record_event(planning.id, "stop", stop_time)
+        dashboard_broadcaster.notify_change()
         
         return {"status": "stopped", "message": "Produção finalizada"}
     except Exception as e:
@@ -1178,6 +1515,7 @@ def rebalance_production(data: dict, db: Session = Depends(get_db)):
         
         # Clone Operations (keeping original properties)
         original_ops = db.query(models.Operation).filter(models.Operation.pso_id == original_pso.id).all()
+        cloned_ops = []
         for op in original_ops:
             new_op = models.Operation(
                 pso_id=new_pso.id,
@@ -1191,8 +1529,11 @@ def rebalance_production(data: dict, db: Session = Depends(get_db)):
                 is_active=op.is_active # Crucial: Keep same active/inactive state
             )
             db.add(new_op)
+            cloned_ops.append(new_op)
+        apply_pso_aggregates(new_pso, cloned_ops)
             
         db.commit()
+        dashboard_broadcaster.notify_change()
         
         return {
             "status": "rebalancing_prepared",
@@ -1208,44 +1549,34 @@ def rebalance_production(data: dict, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def active_production_payload(db: Session) -> dict:
+    state = production_state.get(db)
+
+    if not state:
+        return {"active": False, "planning": None}
+
+    return {
+        "active": True,
+        "planning": {
+            "id": state.planning_id,
+            "version_name": state.version_name,
+            "pso_id": state.pso_id,
+            "pso_version": state.pso_version,
+            "product_reference": state.product_reference,
+            "pulse_duration": state.pulse_duration,
+            "batch_size": state.batch_size
+        }
+    }
+
 @app.get("/api/production/active")
-def get_active_production(db: Session = Depends(get_db)):
+async def get_active_production():
     """
     Get the currently active production planning.
     Returns null if no production is running.
+    Async: served from the in-process state, database only on a cache miss.
     """
     try:
-        active_planning = db.query(models.ProductionPlanning).filter(
-            models.ProductionPlanning.is_active == True
-        ).first()
-        
-        if not active_planning:
-            return {"active": False, "planning": None}
-        
-        # Get PSO info
-        pso = None
-        if active_planning.pso_id:
-            pso = db.query(models.PSO).filter(
-                models.PSO.id == active_planning.pso_id
-            ).first()
-        
-        product_reference = None
-        if pso and pso.product:
-            product_reference = pso.product.reference
-        
-        return {
-            "active": True,
-            "planning": {
-                "id": active_planning.id,
-                "version_name": active_planning.version_name,
-                "pso_id": active_planning.pso_id,
-                "pso_version": pso.version_name if pso else None,
-                "product_reference": product_reference,
-                "pulse_duration": active_planning.pulse_duration,
-                "batch_size": active_planning.batch_size
-            }
-        }
-        
+        return await run_read(active_production_payload)
     except Exception as e:
         print(f"Error getting active production: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1253,148 +1584,109 @@ def get_active_production(db: Session = Depends(get_db)):
 
 # --- Existing Endpoints ---
 
-@app.get("/api/dashboard/active-status")
-def get_dashboard_active_status(db: Session = Depends(get_db)):
+IDLE_DASHBOARD_STATUS = {
+    "status": "idle",
+    "pulse_duration": 60,
+    "elapsed_seconds": 0,
+    "carts_produced": 0,
+    "workstations": []
+}
+
+def build_dashboard_status(db: Session, live_metrics: bool = True) -> dict:
     """
-    Returns real-time status for the Factory Dashboard (Monitor).
-    Includes: Active Planning, Last Checkout Time, Pulse Status, Seamstress Allocations
+    Computes the Factory Dashboard (Monitor) state for the active planning.
+
+    With live_metrics=False the time-dependent fields (elapsed_seconds,
+    efficiency, is_delayed) are left out: this is the snapshot pushed by
+    /api/dashboard/stream, where the client derives them from
+    current_cycle_start, session_start, pause_intervals and calendar (shift windows, workdays, holidays).
     """
-    try:
-        # 1. Get Latest Active Planning
-        planning = db.query(models.ProductionPlanning).filter(
-            models.ProductionPlanning.is_active == True
-        ).order_by(desc(models.ProductionPlanning.id)).first()
+    state = production_state.get(db)
 
-        if not planning:
-            return {
-                "status": "idle", 
-                "message": "Nenhum planejamento ativo.",
-                "pulse_duration": 60,
-                "elapsed_seconds": 0,
-                "carts_produced": 0,
-                "workstations": []
-            }
+    if not state:
+        return {**IDLE_DASHBOARD_STATUS, "message": "Nenhum planejamento ativo."}
 
-        po = db.query(models.ProductionOrder).filter(models.ProductionOrder.id == planning.production_order_id).first()
-        
-        if not po:
-            return {
-                "status": "idle", 
-                "message": "Ordem de Produção não encontrada.",
-                "pulse_duration": 60,
-                "elapsed_seconds": 0,
-                "carts_produced": 0,
-                "workstations": []
-            }
-        
-        # 2. Get Last Checkout for THIS SPECIFIC PLANNING (Pulse Reference)
-        last_tracking = db.query(models.BatchTracking).filter(
-            models.BatchTracking.planning_id == planning.id
-        ).order_by(desc(models.BatchTracking.checkout_time)).first()
-
-        # Determine start time for the current cycle with Session Awareness
-        # Find the latest START event for this planning
-        latest_start_event = db.query(models.ProductionEvent).filter(
-            models.ProductionEvent.planning_id == planning.id, 
-            models.ProductionEvent.event_type == 'start'
-        ).order_by(desc(models.ProductionEvent.created_at)).first()
-
-        # Base reference is the start of this session (or planning creation as fallback)
-        session_start_time = latest_start_event.created_at if latest_start_event else planning.created_at
-
-        carts_produced = 0
-        start_time = session_start_time
-
-        if last_tracking:
-            # ✅ CRITICAL: Only count batches from THIS planning session
-            carts_produced = db.query(models.BatchTracking).filter(
-                models.BatchTracking.planning_id == planning.id
-            ).count()
-            
-            # If the last batch was completed, the current cycle starts from that checkout time
-            if last_tracking.checkout_time > session_start_time:
-                start_time = last_tracking.checkout_time
-            else:
-                # If the last checkout was BEFORE this session (e.g. yesterday), 
-                # we start counting from the session start (08:00 today).
-                start_time = session_start_time
+    if state.production_order_id is None:
+        return {**IDLE_DASHBOARD_STATUS, "message": "Ordem de Produção não encontrada."}
 
-        
-        # Calculate elapsed time with pauses (New Logic)
-        current_time = datetime.utcnow()
-        elapsed_minutes = calculate_working_minutes_with_pauses(
-            db, planning.id, start_time, current_time
+    # Pulse reference: last checkout of THIS session, or the session start
+    start_time = state.current_cycle_start
+    current_time = datetime.utcnow()
+
+    result = {
+        "status": "paused" if state.is_paused else "active",
+        "product": state.po_reference,
+        "planning_id": state.planning_id,
+        "pulse_duration": state.pulse_duration,
+        "total_batches": state.total_batches,
+        "session_start": state.session_start,
+        "current_cycle_start": start_time,
+        "now_server": current_time,
+        "pause_intervals": pause_log.intervals(db, state.planning_id, state.session_start),
+        "calendar": get_shift_calendar(db).to_dict(),
+        "standard_minutes": state.standard_minutes,
+        "carts_produced": state.carts_produced,
+        "workstations": state.workstations
+    }
+
+    if not live_metrics:
+        return result
+
+    # Calculate elapsed time with pauses (New Logic)
+    elapsed_minutes = calculate_working_minutes_with_pauses(
+        db, state.planning_id, start_time, current_time
+    )
+    elapsed_seconds = max(0, elapsed_minutes * 60)
+
+    # ✅ REAL-TIME EFFICIENCY CALCULATION
+    efficiency = 0.0
+    if state.carts_produced > 0:
+        # Calculate Actual Worked Minutes (Session Start to Now, minus pauses)
+        worked_minutes = calculate_working_minutes_with_pauses(
+            db, state.planning_id, state.session_start, current_time
         )
-        elapsed_seconds = max(0, elapsed_minutes * 60)
-        
-        # Determine current status based on last event
-        latest_event = db.query(models.ProductionEvent).filter(
-            models.ProductionEvent.planning_id == planning.id
-        ).order_by(desc(models.ProductionEvent.created_at)).first()
-        
-        is_paused = latest_event and latest_event.event_type == 'pause'
-        
-        # 3. Get Active Seamstresses and Loads
-        allocations = []
-        for seat in planning.allocations:
-            active_ops_count = len(seat.op_allocations)
-            allocations.append({
-                "seamstress_name": seat.seamstress.name,
-                "position": seat.seamstress_id, # Simplify for now
-                "load_count": active_ops_count,
-                "status": "Produzindo" if active_ops_count > 0 else "Ociosa"
-            })
 
-        allocations.sort(key=lambda x: x["position"])
+        # Efficiency = (Standard Minutes / Worked Minutes) × 100
+        if worked_minutes > 0:
+            efficiency = (state.standard_minutes / worked_minutes) * 100
+            efficiency = round(efficiency, 1)
 
-        # Calculate total batches for THIS session
-        total_batches = db.query(models.CartLote).filter(
-            models.CartLote.planning_id == planning.id
-        ).count()
-        
-        # ✅ REAL-TIME EFFICIENCY CALCULATION
-        efficiency = 0.0
-        
-        if carts_produced > 0:
-            # Calculate Standard Minutes (TP × Completed Batches)
-            total_tp_per_batch = 0.0
-            for alloc in planning.allocations:
-                for op_alloc in alloc.op_allocations:
-                    operation = db.query(models.Operation).filter(
-                        models.Operation.id == op_alloc.operation_id
-                    ).first()
-                    if operation:
-                        total_tp_per_batch += operation.final_time
-            
-            standard_minutes = total_tp_per_batch * carts_produced
-            
-            # Calculate Actual Worked Minutes (Session Start to Now, minus pauses)
-            worked_minutes = calculate_working_minutes_with_pauses(
-                db, planning.id, session_start_time, current_time
-            )
-            
-            # Efficiency = (Standard Minutes / Worked Minutes) × 100
-            if worked_minutes > 0:
-                efficiency = (standard_minutes / worked_minutes) * 100
-                efficiency = round(efficiency, 1)
+    result.update({
+        "elapsed_seconds": elapsed_seconds,
+        "is_delayed": elapsed_seconds > (state.pulse_duration * 60),
+        "efficiency": efficiency
+    })
+    return result
 
-        # Determine status
-        final_status = "paused" if is_paused else "active"
+def build_dashboard_snapshot() -> dict:
+    """Snapshot shared by every client of /api/dashboard/stream (own session)."""
+    db = SessionLocal()
+    try:
+        return build_dashboard_status(db, live_metrics=False)
+    finally:
+        db.close()
 
-        return {
-            "status": final_status,
-            "product": po.product_reference if po else "Desconhecido",
-            "planning_id": planning.id,
-            "pulse_duration": planning.pulse_duration,
-            "total_batches": total_batches,
-            "current_cycle_start": start_time,
-            "now_server": current_time,
-            "elapsed_seconds": elapsed_seconds,
-            "is_delayed": elapsed_seconds > (planning.pulse_duration * 60),
-            "carts_produced": carts_produced,
-            "efficiency": efficiency,
-            "workstations": allocations
-        }
+dashboard_broadcaster = DashboardBroadcaster(build_dashboard_snapshot, clock_key="now_server")
+
+@app.on_event("startup")
+async def start_dashboard_stream():
+    dashboard_broadcaster.start()
+
+@app.on_event("shutdown")
+async def stop_dashboard_stream():
+    await dashboard_broadcaster.stop()
+    shutdown_process_pool()
+    await dispose_async_engine()
+
+@app.get("/api/dashboard/active-status")
+async def get_dashboard_active_status():
+    """
+    Returns real-time status for the Factory Dashboard (Monitor).
+    Includes: Active Planning, Last Checkout Time, Pulse Status, Seamstress Allocations
+    Polling fallback for clients without /api/dashboard/stream.
+    """
+    try:
+        return await run_read(build_dashboard_status)
     except Exception as e:
         print(f"Error in get_dashboard_active_status: {e}")
         import traceback
@@ -1408,159 +1700,197 @@ def get_dashboard_active_status(db: Session = Depends(get_db)):
             "workstations": []
         }
 
-@app.post("/api/pso/import", status_code=status.HTTP_201_CREATED)
-async def import_pso(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    try:
-        content = await file.read()
-        extracted_data = extractor.process_pdf_with_gpt4(content)
-        
-        if not extracted_data:
-            raise HTTPException(status_code=500, detail="Failed to extract data or no data returned.")
-        
-        reference = extracted_data.get("referencia")
-        product_name = extracted_data.get("produto")
-        operations = extracted_data.get("operacoes", [])
-        
-        if not reference or not operations:
-             raise HTTPException(status_code=422, detail="Missing required data (reference or operations) in extraction.")
+@app.get("/api/dashboard/stream")
+async def stream_dashboard_status():
+    """
+    Server-Sent Events channel for the Factory Dashboard (Monitor).
+    Pushes a state snapshot only when production changes; the timer is
+    ticked on the client.
+    """
+    return StreamingResponse(
+        dashboard_broadcaster.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-        product = db.query(models.Product).filter(models.Product.reference == reference).first()
-        if not product:
-            product = models.Product(
-                reference=reference,
-                description=product_name
-            )
-            db.add(product)
-            db.commit()
-            db.refresh(product)
+def import_pso_content(db: Session, content: bytes) -> dict:
+    """
+    Extracts one sequence sheet and stores product, PSO version and operations
+    (pso_store: one transaction, bulk insert). A failed attempt leaves nothing
+    behind, so the import queue can retry it.
+    """
+    # Same PDF + same prompt = same JSON: re-imports skip the LLM
+    extracted_data, from_cache = extraction_cache.extract(db, content)
 
-        existing_psos_count = db.query(models.PSO).filter(models.PSO.product_id == product.id).count()
-        version_name = f"V{existing_psos_count + 1}"
-        
-        pso = models.PSO(
-            product_id=product.id,
-            version_name=version_name,
-            status="Ativa",
-            default_efficiency_factor=1.0
-        )
-        db.add(pso)
-        db.commit()
-        db.refresh(pso)
-        
-        for op in operations:
-            raw_time_min = op.get("minutos_decimais", 0.0) # Correct key now
-            
-            new_op = models.Operation(
-                pso_id=pso.id,
-                sequence=op.get("ordem"),
-                description=op.get("descricao"),
-                original_machine=op.get("maquina_original"),
-                macro_machine=op.get("maquina_macro"),
-                time_pdf=raw_time_min,
-                time_edited=None,
-                final_time=raw_time_min,
-                is_active=True  # All imported operations are active by default
-            )
-            db.add(new_op)
-        
-        db.commit()
-        
-        # Calculate total TP for response
-        total_tp = sum(op.get("minutos_decimais", 0.0) for op in operations)
-        
-        return {
-            "message": "PSO Importado com sucesso",
-            "pso_id": pso.id,
-            "product_reference": product.reference,
-            "version": pso.version_name,
-            "operation_count": len(operations),
-            "total_tp_minutes": round(total_tp, 4)
+    if not extracted_data:
+        raise Exception("Failed to extract data or no data returned.")
+
+    reference = extracted_data.get("referencia")
+    product_name = extracted_data.get("produto")
+    operations = extracted_data.get("operacoes", [])
+
+    if not reference or not operations:
+        raise ImportRejected("Missing required data (reference or operations) in extraction.")
+
+    # Upsert locks the product row: concurrent imports get consecutive versions
+    product_id = pso_store.upsert_product(db, reference, product_name)
+    version_name = pso_store.next_version_name(db, product_id)
+    pso_id, summary = pso_store.insert_pso_version(db, product_id, version_name, 1.0, [
+        {
+            "sequence": op.get("ordem"),
+            "description": op.get("descricao"),
+            "original_machine": op.get("maquina_original"),
+            "macro_machine": op.get("maquina_macro"),
+            "time_pdf": op.get("minutos_decimais", 0.0),
+            "time_edited": None,
+            "final_time": op.get("minutos_decimais", 0.0),
+            "is_active": True  # All imported operations are active by default
         }
+        for op in operations
+    ])
+    db.commit()
+
+    return {
+        "message": "PSO Importado com sucesso",
+        "pso_id": pso_id,
+        "product_reference": reference,
+        "version": version_name,
+        "operation_count": len(operations),
+        "total_tp_minutes": summary["active_tp_minutes"],
+        "extraction_source": extracted_data.get("extraction_source", "llm"),
+        "extraction_cached": from_cache
+    }
+
+import_job_queue = ImportJobQueue(import_pso_content)
+
+@app.on_event("startup")
+def recover_import_jobs():
+    db = SessionLocal()
+    try:
+        failed = import_job_queue.recover(db)
+        if failed:
+            print(f"⚠️ {failed} PSO import job(s) interrupted by the restart marked as failed")
+    finally:
+        db.close()
 
+@app.on_event("shutdown")
+def stop_import_jobs():
+    import_job_queue.shutdown()
+
+@app.post("/api/pso/import", status_code=status.HTTP_201_CREATED)
+def import_pso(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    """
+    Imports one PDF and answers when it is stored. Sync endpoint: the
+    extraction runs on the threadpool, not on the event loop. For several
+    files use /api/pso/import/jobs.
+    """
+    try:
+        return import_pso_content(db, file.file.read())
+    except ImportRejected as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         print(f"Error importing PSO: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/pso/import/jobs", status_code=status.HTTP_202_ACCEPTED)
+def create_import_jobs(files: List[UploadFile] = File(...), db: Session = Depends(get_db)):
+    """
+    Queues one background import per PDF (a whole season at once) and returns
+    the batch right away. Follow it with GET /api/pso/import/batches/{batch_id}
+    or its /stream (SSE).
+    """
+    if len(files) > IMPORT_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {IMPORT_MAX_FILES} files per upload")
+    uploads = [(f.filename, f.file.read()) for f in files]
+    return import_job_queue.submit(db, uploads)
+
+@app.get("/api/pso/import/batches/{batch_id}")
+def get_import_batch(batch_id: str, db: Session = Depends(get_db)):
+    batch = batch_payload(db, batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Import batch not found")
+    return batch
+
+@app.get("/api/pso/import/batches/{batch_id}/stream")
+async def stream_import_batch(batch_id: str):
+    """Server-Sent Events: `progress` on every job change, `done` with the final state."""
+    return StreamingResponse(
+        import_job_queue.events(batch_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/pso/import/jobs/{job_id}")
+def get_import_job(job_id: str, db: Session = Depends(get_db)):
+    job = db.get(models.ImportJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return {"batch_id": job.batch_id, **job_payload(job)}
+
+@app.get("/api/_extraction-cache")
+def get_extraction_cache_stats(db: Session = Depends(get_db), admin: str = Depends(require_admin)):
+    return extraction_cache.stats(db)
+
+@app.delete("/api/_extraction-cache")
+def purge_extraction_cache(db: Session = Depends(get_db), admin: str = Depends(require_admin)):
+    """Drops every cached PDF extraction (admin only); the next imports call the LLM again."""
+    deleted = extraction_cache.purge(db)
+    print(f"🧹 Extraction cache purged by {admin}: {deleted} entries")
+    return {"deleted": deleted}
+
 
 @app.post("/api/pso/save-version", status_code=status.HTTP_201_CREATED)
-async def save_pso_version(payload: dict, db: Session = Depends(get_db)):
+def save_pso_version(payload: dict, db: Session = Depends(get_db)):
     """
     Save a new PSO version with edited operations.
     Used by Tela 03 when user edits and saves a PSO version.
+    One transaction: product upsert, PSO and a bulk insert of the operations.
     """
+    reference = payload.get("referencia")
+    product_name = payload.get("produto")
+    version_name = payload.get("version_name")
+    efficiency_factor = payload.get("default_efficiency_factor", 1.0) # Get efficiency from payload
+    operations = payload.get("operacoes", [])
+
+    if not reference or not version_name or not operations:
+        raise HTTPException(status_code=422, detail="Missing required data (reference, version_name, or operations).")
+
     try:
-        reference = payload.get("referencia")
-        product_name = payload.get("produto")
-        version_name = payload.get("version_name")
-        efficiency_factor = payload.get("default_efficiency_factor", 1.0) # Get efficiency from payload
-        operations = payload.get("operacoes", [])
-        
-        if not reference or not version_name or not operations:
-            raise HTTPException(status_code=422, detail="Missing required data (reference, version_name, or operations).")
-
-        # Get or create product
-        product = db.query(models.Product).filter(models.Product.reference == reference).first()
-        if not product:
-            product = models.Product(
-                reference=reference,
-                description=product_name or reference
-            )
-            db.add(product)
-            db.commit()
-            db.refresh(product)
-
-        # Create new PSO version
-        pso = models.PSO(
-            product_id=product.id,
-            version_name=version_name,
-            status="Ativa",
-            default_efficiency_factor=efficiency_factor # Save efficiency
-        )
-        db.add(pso)
-        db.commit()
-        db.refresh(pso)
-        
+        product_id = pso_store.upsert_product(db, reference, product_name or reference)
+
         # Add ALL operations (both active and inactive)
-        total_tp = 0
-        active_count = 0
-        
+        rows = []
         for op in operations:
             raw_time_min = op.get("minutos_decimais", 0.0)
             is_active = op.get("ativa")
             if is_active is None:
                 is_active = True # Default to true only if explicitly missing
-            
-            # Save ALL operations to database
-            new_op = models.Operation(
-                pso_id=pso.id,
-                sequence=op.get("ordem"),
-                description=op.get("descricao"),
-                original_machine=op.get("maquina_macro"),
-                macro_machine=op.get("maquina_macro"),
-                time_pdf=raw_time_min,
-                time_edited=None,
-                final_time=raw_time_min,
-                is_active=is_active  # Store active/inactive status
-            )
-            db.add(new_op)
-            
-            # Only count active operations in TP total
-            if is_active:
-                total_tp += raw_time_min
-                active_count += 1
-        
+            rows.append({
+                "sequence": op.get("ordem"),
+                "description": op.get("descricao"),
+                "original_machine": op.get("maquina_macro"),
+                "macro_machine": op.get("maquina_macro"),
+                "time_pdf": raw_time_min,
+                "time_edited": None,
+                "final_time": raw_time_min,
+                "is_active": is_active  # Store active/inactive status
+            })
+
+        # Only active operations count in the TP total
+        pso_id, summary = pso_store.insert_pso_version(db, product_id, version_name, efficiency_factor, rows)
         db.commit()
-        
+
         return {
             "message": f"Versão '{version_name}' salva com sucesso",
-            "pso_id": pso.id,
-            "product_reference": product.reference,
-            "version": pso.version_name,
-            "operation_count": active_count,  # Only active operations
-            "total_tp_minutes": round(total_tp, 4)  # Only sum active operations
+            "pso_id": pso_id,
+            "product_reference": reference,
+            "version": version_name,
+            "operation_count": summary["active_operation_count"],  # Only active operations
+            "total_tp_minutes": summary["active_tp_minutes"]  # Only sum active operations
         }
 
     except Exception as e:
+        db.rollback()
         print(f"Error saving PSO version: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1602,6 +1932,7 @@ def archive_pso(pso_id: int, db: Session = Depends(get_db)):
         
     pso.is_archived = True
     pso.status = "Arquivada"
+    refresh_pso_aggregates(db, pso)
     db.commit()
     return {"message": "PSO arquivada com sucesso"}
 
@@ -1614,6 +1945,7 @@ def restore_pso(pso_id: int, db: Session = Depends(get_db)):
         
     pso.is_archived = False
     pso.status = "Ativa"
+    refresh_pso_aggregates(db, pso)
     db.commit()
     return {"message": "PSO restaurada com sucesso"}
 
@@ -1624,13 +1956,12 @@ def get_archived_psos(db: Session = Depends(get_db)):
     
     result = []
     for pso in psos:
-        operations = db.query(models.Operation).filter(models.Operation.pso_id == pso.id).all()
         result.append({
             "pso_id": pso.id,
             "product_reference": pso.product.reference if pso.product else "N/A",
             "version_name": pso.version_name,
             "archived_at": pso.created_at, # Using created_at for sorting basically
-            "operations_count": len(operations)
+            "operations_count": (pso.active_operation_count or 0) + (pso.inactive_operation_count or 0)
         })
     return result
 
@@ -1638,9 +1969,33 @@ def get_archived_psos(db: Session = Depends(get_db)):
 
 @app.post("/api/batches/checkout", status_code=status.HTTP_201_CREATED)
 def checkout_batch(item: CheckoutRequest, db: Session = Depends(get_db)):
-    cart = db.query(models.CartLote).filter(models.CartLote.id == item.batch_id).first()
-    if not cart:
-        raise HTTPException(status_code=404, detail=f"Cart (Carrinho) with ID {item.batch_id} not found")
+    # FOR UPDATE: a second checkout of the same cart waits here and then sees it Concluido
+    if item.batch_id:
+        cart = db.query(models.CartLote).filter(models.CartLote.id == item.batch_id).with_for_update().first()
+        if not cart:
+            raise HTTPException(status_code=404, detail=f"Cart (Carrinho) with ID {item.batch_id} not found")
+        if cart.status == "Concluido":
+            raise HTTPException(status_code=409, detail=f"Cart (Carrinho) with ID {item.batch_id} already checked out")
+    else:
+        # Lazy planning: the cart row is created now, on its checkout
+        if not item.planning_id or not item.sequence:
+            raise HTTPException(status_code=422, detail="Send batch_id or planning_id with sequence")
+        planning = db.query(models.ProductionPlanning).filter(models.ProductionPlanning.id == item.planning_id).first()
+        if not planning:
+            raise HTTPException(status_code=404, detail=f"Planning with ID {item.planning_id} not found")
+        cart = db.query(models.CartLote).filter(
+            models.CartLote.planning_id == planning.id,
+            models.CartLote.sequence_number == item.sequence
+        ).with_for_update().first()
+        if cart and cart.status == "Concluido":
+            raise HTTPException(status_code=409, detail=f"Cart {item.sequence} of planning {planning.id} already checked out")
+        if not cart:
+            try:
+                cart = materialize_cart(db, planning, item.sequence)
+            except CartAlreadyCheckedOut as e:
+                raise HTTPException(status_code=409, detail=str(e))
+        if not cart:
+            raise HTTPException(status_code=404, detail=f"Cart {item.sequence} not found in planning {planning.id}")
     
     op = cart.production_order
     pulse_duration_minutes = op.pulse_duration if op and op.pulse_duration else 60
@@ -1674,7 +2029,7 @@ def checkout_batch(item: CheckoutRequest, db: Session = Depends(get_db)):
             is_delayed = True
 
     tracking_record = models.BatchTracking(
-        batch_id=item.batch_id,
+        batch_id=cart.id,
         planning_id=cart.planning_id,  # ✅ Link directly to session through the cart
         workstation_id=item.workstation_id,
         checkout_time=current_time,
@@ -1684,14 +2039,29 @@ def checkout_batch(item: CheckoutRequest, db: Session = Depends(get_db)):
     cart.status = "Concluido" # Mark as Done
     db.add(cart)
     db.add(tracking_record)
+
+    # Analytics rollups: this cart closes the cycle started at the previous checkout (or START)
+    if cart.planning:
+        cycle_begin = cycle_start(db, cart.planning, current_time)
+        record_cycle(
+            db, cart.planning, current_time,
+            calculate_working_minutes_with_pauses(db, cart.planning_id, cycle_begin, current_time),
+            pieces=cart.quantity_pieces or 0,
+            is_delayed=is_delayed
+        )
     db.commit()
     db.refresh(tracking_record)
+    production_state.record_checkout(cart.planning_id, cart.sequence_number, current_time)
     
     # ✅ AUTO-STOP LOGIC: Check if this was the last batch for THIS specific planning session
-    remaining_batches = db.query(models.CartLote).filter(
-        models.CartLote.planning_id == cart.planning_id,
-        models.CartLote.status != "Concluido"
-    ).count()
+    # (lazy plannings have no rows for pending carts, so count the completed ones)
+    remaining_batches = 0
+    if cart.planning:
+        completed_batches = db.query(models.CartLote).filter(
+            models.CartLote.planning_id == cart.planning_id,
+            models.CartLote.status == "Concluido"
+        ).count()
+        remaining_batches = count_planning_carts(db, cart.planning) - completed_batches
     
     is_last_batch = (remaining_batches == 0)
     
@@ -1714,9 +2084,12 @@ def checkout_batch(item: CheckoutRequest, db: Session = Depends(get_db)):
             )
             db.add(stop_event)
             db.commit()
+            production_state.record_event(planning.id, "stop", current_time)
             
             print(f"✅ AUTO-STOP: Last batch completed for Planning {planning.id}. Production stopped automatically.")
     
+    dashboard_broadcaster.notify_change()
+    
     return {
         "message": "Checkout registered successfully",
         "tracking_id": tracking_record.id,
@@ -1728,8 +2101,24 @@ def checkout_batch(item: CheckoutRequest, db: Session = Depends(get_db)):
         "production_completed": is_last_batch
     }
 
+def pending_batches_payload(db: Session) -> dict:
+    # 1. Active Planning/PO (in-process state, no DB round-trip)
+    state = production_state.get(db)
+
+    if not state or state.production_order_id is None:
+        return {"batches": [], "po_reference": "N/A", "op_code": "N/A", "batch_size": 0}
+
+    # 2. Pending Carts for THIS planning session
+    return {
+        "po_reference": state.po_reference or "N/A",
+        "product_description": state.product_description or "N/A",  # Description/name of the product
+        "op_code": f"OP-{state.production_order_id}",  # Format OP code with ID
+        "batch_size": state.batch_size,  # Gets the batch size from the ACTIVE planning (handles rebalancing)
+        "batches": state.pending_carts
+    }
+
 @app.get("/api/batches/pending")
-def get_pending_batches(db: Session = Depends(get_db)):
+async def get_pending_batches():
     """
     Returns pending batches for the active Production Order.
     Used by the Checklist Screen (Page 05).
@@ -1742,53 +2131,33 @@ def get_pending_batches(db: Session = Depends(get_db)):
     - batches: List of pending cart/batch objects
     """
     try:
-        # 1. Find Active Planning/PO
-        planning = db.query(models.ProductionPlanning).filter(
-            models.ProductionPlanning.is_active == True
-        ).order_by(desc(models.ProductionPlanning.id)).first()
-
-        if not planning:
-             return {"batches": [], "po_reference": "N/A", "op_code": "N/A", "batch_size": 0}
-
-        po = db.query(models.ProductionOrder).filter(models.ProductionOrder.id == planning.production_order_id).first()
-        
-        if not po:
-            return {"batches": [], "po_reference": "N/A", "op_code": "N/A", "batch_size": 0}
-        
-        # Get the PSO to find product description
-        pso = None
-        product_description = "N/A"
-        if planning.pso_id:
-            pso = db.query(models.PSO).filter(models.PSO.id == planning.pso_id).first()
-            if pso and pso.product:
-                product_description = pso.product.description
-        
-        # 2. Get Pending Carts for THIS planning session
-        carts = db.query(models.CartLote).filter(
-            models.CartLote.planning_id == planning.id,
-            models.CartLote.status == "Aguardando"
-        ).order_by(models.CartLote.sequence_number).all()
-
-        return {
-            "po_reference": po.product_reference or "N/A",
-            "product_description": product_description,  # Description/name of the product
-            "op_code": f"OP-{po.id}" if po.id else "OP-N/A",  # Format OP code with ID
-            "batch_size": planning.batch_size or 0,  # Gets the batch size from the ACTIVE planning (handles rebalancing)
-            "batches": [
-                {
-                    "id": c.id, 
-                    "sequence": c.sequence_number, 
-                    "status": c.status,
-                    "quantity": c.quantity_pieces
-                } for c in carts
-            ]
-        }
+        return await run_read(pending_batches_payload)
     except Exception as e:
         print(f"Error in get_pending_batches: {e}")
         import traceback
         traceback.print_exc()
         return {"batches": [], "po_reference": "N/A", "op_code": "N/A", "batch_size": 0}
 
+def hourly_checkout_breakdown(db: Session, rollup_filter) -> list:
+    """
+    Pieces and carts checked out per hour of the day ("07:00", "08:00", ...),
+    summed from the cell rollups. Same buckets whether the window is 8 hours or 30 days.
+    """
+    hour = func.extract("hour", models.ProductionRollup.hour_start)
+    rows = db.query(
+        hour,
+        func.coalesce(func.sum(models.ProductionRollup.pieces), 0),
+        func.coalesce(func.sum(models.ProductionRollup.carts), 0)
+    ).filter(
+        models.ProductionRollup.seamstress_id.is_(None),
+        models.ProductionRollup.carts > 0,
+        rollup_filter
+    ).group_by(hour).order_by(hour).all()
+    return [
+        {"hour": f"{int(h):02d}:00", "pieces": int(pieces), "batches": int(batches)}
+        for h, pieces, batches in rows
+    ]
+
 @app.get("/api/analytics/dashboard")
 def get_analytics_dashboard(hours: int = 8, db: Session = Depends(get_db)):
     """
@@ -1799,12 +2168,18 @@ def get_analytics_dashboard(hours: int = 8, db: Session = Depends(get_db)):
     current_time = datetime.utcnow()
     start_time = current_time - timedelta(hours=hours)
     
-    # Get all completed batches in time window
-    completed_batches = db.query(models.BatchTracking).filter(
-        models.BatchTracking.checkout_time >= start_time
-    ).all()
-    
-    if not completed_batches:
+    # Cell rollups of every hour touched by the window (see rollups.py)
+    window_filter = models.ProductionRollup.hour_start >= hour_bucket(start_time)
+    totals = db.query(
+        func.coalesce(func.sum(models.ProductionRollup.carts), 0),
+        func.coalesce(func.sum(models.ProductionRollup.delayed_carts), 0),
+        func.coalesce(func.sum(models.ProductionRollup.pieces), 0),
+        func.coalesce(func.sum(models.ProductionRollup.standard_minutes), 0.0),
+        func.coalesce(func.sum(models.ProductionRollup.worked_minutes), 0.0)
+    ).filter(models.ProductionRollup.seamstress_id.is_(None), window_filter).one()
+    total_batches, delayed_count, total_pieces, total_standard_minutes, worked_minutes = totals
+    
+    if not total_batches:
         return {
             "efficiency": {"current": 0, "target": 80.0, "status": "no_data"},
             "delay_rate": {"delayed_count": 0, "total_count": 0, "percentage": 0},
@@ -1813,99 +2188,29 @@ def get_analytics_dashboard(hours: int = 8, db: Session = Depends(get_db)):
         }
     
     # Calculate metrics
-    total_batches = len(completed_batches)
-    delayed_count = sum(1 for b in completed_batches if b.is_delayed)
     delay_percentage = (delayed_count / total_batches * 100) if total_batches > 0 else 0
-    
-    # Calculate production volume
-    total_pieces = 0
-    batch_ids = [b.batch_id for b in completed_batches]
-    carts = db.query(models.CartLote).filter(models.CartLote.id.in_(batch_ids)).all()
-    total_pieces = sum(c.quantity_pieces for c in carts if c.quantity_pieces)
-    
     avg_pieces_per_hour = total_pieces / hours if hours > 0 else 0
     
-    # Get the active planning to find operation times and specific targets
-    planning = db.query(models.ProductionPlanning).filter(
-        models.ProductionPlanning.is_active == True
-    ).order_by(desc(models.ProductionPlanning.id)).first()
+    # Active planning (in-process state): targets
+    state = production_state.get(db)
 
     # Get target volume from active planning session
     target_volume = 0
     target_batches = 0
-    if planning:
-        target_batches = db.query(models.CartLote).filter(
-            models.CartLote.planning_id == planning.id
-        ).count()
-        # Get the production order associated with this planning
-        po = db.query(models.ProductionOrder).filter(
-            models.ProductionOrder.id == planning.production_order_id
-        ).first()
-        if po:
-            target_volume = po.quantity or 0
-    
-    # Efficiency calculated below using the planning session found above
+    if state:
+        target_batches = state.total_batches
+        target_volume = state.po_quantity
     
     efficiency_current = 0
-    if planning and len(completed_batches) > 1:
-        # Get all workstation allocations for this planning
-        # WorkstationAllocation uses 'planning_id' to link to ProductionPlanning
-        ws_allocations = db.query(models.WorkstationAllocation).filter(
-            models.WorkstationAllocation.planning_id == planning.id
-        ).all()
-        
-        if not ws_allocations:
-            # No workstation allocations found, efficiency remains 0
-            pass
-        else:
-            # Get all operation allocations through workstation allocations
-            ws_ids = [ws.id for ws in ws_allocations]
-            op_allocations = db.query(models.OperationAllocation).filter(
-                models.OperationAllocation.allocation_id.in_(ws_ids)
-            ).all()
-            
-            # Calculate total standard time (sum of operation times * pieces produced)
-            total_standard_minutes = 0
-            for cart in carts:
-                # Sum all operation times for one piece
-                piece_time = 0
-                for alloc in op_allocations:
-                    operation = db.query(models.Operation).filter(
-                        models.Operation.id == alloc.operation_id
-                    ).first()
-                    if operation and operation.final_time:
-                        piece_time += operation.final_time
-                
-                total_standard_minutes += piece_time * (cart.quantity_pieces or 0)
-            
-            # Calculate actual elapsed time (first checkout to last checkout)
-            # Use shift-aware calculation that excludes lunch breaks
-            checkout_times = sorted([b.checkout_time for b in completed_batches])
-            if len(checkout_times) >= 2:
-                elapsed_time = calculate_working_minutes(db, checkout_times[0], checkout_times[-1])
-                
-                # Protection against division by zero
-                if elapsed_time > 0 and total_standard_minutes > 0:
-                    efficiency_current = (total_standard_minutes / elapsed_time) * 100
+    if state and total_batches > 1 and state.workstations:
+        # Standard time (TP of each cart's planning * pieces) over the worked cycles,
+        # both already without lunch breaks and pauses
+        if worked_minutes > 0 and total_standard_minutes > 0:
+            efficiency_current = (total_standard_minutes / worked_minutes) * 100
     
     efficiency_status = "above_target" if efficiency_current >= 80 else "below_target"
     
-    # Hourly breakdown
-    hourly_data = {}
-    for batch in completed_batches:
-        hour_key = batch.checkout_time.strftime("%H:00")
-        if hour_key not in hourly_data:
-            hourly_data[hour_key] = {"pieces": 0, "batches": 0}
-        
-        cart = db.query(models.CartLote).filter(models.CartLote.id == batch.batch_id).first()
-        if cart:
-            hourly_data[hour_key]["pieces"] += cart.quantity_pieces or 0
-            hourly_data[hour_key]["batches"] += 1
-    
-    hourly_breakdown = [
-        {"hour": hour, "pieces": data["pieces"], "batches": data["batches"]}
-        for hour, data in sorted(hourly_data.items())
-    ]
+    hourly_breakdown = hourly_checkout_breakdown(db, window_filter)
     
     return {
         "efficiency": {
@@ -1930,6 +2235,71 @@ def get_analytics_dashboard(hours: int = 8, db: Session = Depends(get_db)):
         "hourly_breakdown": hourly_breakdown
     }
 
+@app.get("/api/analytics/rollups")
+def get_analytics_rollups(
+    days: int = 30,
+    granularity: str = "day",
+    pso_id: Optional[int] = None,
+    by_seamstress: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Histórico de produção a partir dos rollups: uma linha por hora ou dia
+    (e por costureira, se by_seamstress), sem ler BatchTracking.
+    """
+    if granularity not in ("hour", "day"):
+        raise HTTPException(status_code=422, detail="granularity must be 'hour' or 'day'")
+
+    rollup = models.ProductionRollup
+    bucket = rollup.hour_start if granularity == "hour" else func.date(rollup.hour_start)
+    group = [bucket, rollup.seamstress_id] if by_seamstress else [bucket]
+
+    query = db.query(
+        *group,
+        func.coalesce(func.sum(rollup.pieces), 0),
+        func.coalesce(func.sum(rollup.carts), 0),
+        func.coalesce(func.sum(rollup.delayed_carts), 0),
+        func.coalesce(func.sum(rollup.standard_minutes), 0.0),
+        func.coalesce(func.sum(rollup.worked_minutes), 0.0)
+    ).filter(rollup.hour_start >= hour_bucket(datetime.utcnow() - timedelta(days=days)))
+    query = query.filter(rollup.seamstress_id.isnot(None) if by_seamstress else rollup.seamstress_id.is_(None))
+    if pso_id:
+        query = query.filter(rollup.pso_id == pso_id)
+
+    series = []
+    for row in query.group_by(*group).order_by(*group).all():
+        period, rest = row[0], row[1:]
+        seamstress_id = None
+        if by_seamstress:
+            seamstress_id, rest = rest[0], rest[1:]
+        pieces, carts, delayed, standard_minutes, worked_minutes = rest
+        series.append({
+            "period": period,
+            "seamstress_id": seamstress_id,
+            "pieces": int(pieces),
+            "carts": int(carts),
+            "delayed_carts": int(delayed),
+            "standard_minutes": round(standard_minutes, 2),
+            "worked_minutes": round(worked_minutes, 2),
+            "efficiency": round(standard_minutes / worked_minutes * 100, 1) if worked_minutes > 0 else 0.0
+        })
+    return {"granularity": granularity, "days": days, "pso_id": pso_id, "series": series}
+
+@app.post("/api/analytics/rollups/rebuild", status_code=status.HTTP_202_ACCEPTED)
+def rebuild_analytics_rollups(admin: str = Depends(require_admin)):
+    """
+    Regenerates every rollup from the checkout history (same as `python rollups.py --rebuild`)
+    on a background thread; follow it with GET /api/analytics/rollups/rebuild. Admin only.
+    """
+    try:
+        return rollup_rebuild.start(SessionLocal, calculate_working_minutes_with_pauses, requested_by=admin)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/api/analytics/rollups/rebuild")
+def get_rollups_rebuild_status(admin: str = Depends(require_admin)):
+    return rollup_rebuild.status()
+
 @app.get("/api/analytics/pso/{pso_id}")
 def get_pso_analytics(pso_id: int, db: Session = Depends(get_db)):
     """
@@ -1965,47 +2335,37 @@ def get_pso_analytics(pso_id: int, db: Session = Depends(get_db)):
         ).first()
         
         target_volume = po.quantity if po and po.quantity else 0
-        target_batches = db.query(models.CartLote).filter(
-            models.CartLote.production_order_id == po.id
-        ).count() if po else 0
+        if latest_planning.lazy_carts:
+            target_batches = count_planning_carts(db, latest_planning)
+        else:
+            target_batches = db.query(models.CartLote).filter(
+                models.CartLote.production_order_id == po.id
+            ).count() if po else 0
         
-        completed_trackings = []
+        produced_batches, produced_volume, last_checkout = 0, 0, None
+        planning_filter = models.ProductionRollup.planning_id == latest_planning.id
         if po:
-            completed_trackings = db.query(models.BatchTracking).filter(
-                models.BatchTracking.planning_id == latest_planning.id
-            ).order_by(models.BatchTracking.checkout_time).all()
-        
-        produced_batches = len(completed_trackings)
-        
-        produced_volume = 0
-        if completed_trackings:
-            batch_ids = [t.batch_id for t in completed_trackings]
-            carts = db.query(models.CartLote).filter(
-                models.CartLote.id.in_(batch_ids)
-            ).all()
-            produced_volume = sum(c.quantity_pieces or 0 for c in carts)
+            produced_batches, produced_volume, last_checkout = db.query(
+                func.coalesce(func.sum(models.ProductionRollup.carts), 0),
+                func.coalesce(func.sum(models.ProductionRollup.pieces), 0),
+                func.max(models.ProductionRollup.last_checkout_at)
+            ).filter(models.ProductionRollup.seamstress_id.is_(None), planning_filter).one()
         
         efficiency = 0.0
         if produced_batches > 0 and latest_planning:
-            total_tp_per_batch = 0.0
-            for alloc in latest_planning.allocations:
-                for op_alloc in alloc.op_allocations:
-                    operation = db.query(models.Operation).filter(
-                        models.Operation.id == op_alloc.operation_id
-                    ).first()
-                    if operation:
-                        total_tp_per_batch += operation.final_time
+            total_tp_per_batch = latest_planning.tp_minutes
+            if total_tp_per_batch is None:
+                total_tp_per_batch = planning_tp_minutes(db, latest_planning.id)
             
             standard_minutes = total_tp_per_batch * produced_batches
             
-            if completed_trackings:
+            if last_checkout:
                 start_event = db.query(models.ProductionEvent).filter(
                     models.ProductionEvent.planning_id == latest_planning.id,
                     models.ProductionEvent.event_type == 'start'
                 ).order_by(models.ProductionEvent.created_at).first()
                 
                 session_start = start_event.created_at if start_event else latest_planning.created_at
-                last_checkout = completed_trackings[-1].checkout_time
                 
                 worked_minutes = (last_checkout - session_start).total_seconds() / 60
                 
@@ -2013,23 +2373,7 @@ def get_pso_analytics(pso_id: int, db: Session = Depends(get_db)):
                     efficiency = (standard_minutes / worked_minutes) * 100
                     efficiency = round(efficiency, 1)
         
-        hourly_data = {}
-        for tracking in completed_trackings:
-            hour_key = tracking.checkout_time.strftime("%H:00")
-            if hour_key not in hourly_data:
-                hourly_data[hour_key] = {"pieces": 0, "batches": 0}
-            
-            cart = db.query(models.CartLote).filter(
-                models.CartLote.id == tracking.batch_id
-            ).first()
-            if cart:
-                hourly_data[hour_key]["pieces"] += cart.quantity_pieces or 0
-                hourly_data[hour_key]["batches"] += 1
-        
-        hourly_production = [
-            {"hour": hour, "pieces": data["pieces"], "batches": data["batches"]}
-            for hour, data in sorted(hourly_data.items())
-        ]
+        hourly_production = hourly_checkout_breakdown(db, planning_filter) if produced_batches else []
         
         return {
             "pso_id": pso_id,
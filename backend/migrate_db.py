@@ -1,5 +1,76 @@
+import json
 from database import engine
 from sqlalchemy import text
+from engine import summarize_operations
+
+class _OperationRow:
+    def __init__(self, is_active, final_time, macro_machine):
+        self.is_active = is_active
+        self.final_time = final_time
+        self.macro_machine = macro_machine
+
+def backfill_pso_aggregates(conn) -> int:
+    """Fills the denormalized PSO totals for rows created before the columns existed."""
+    pso_ids = [row[0] for row in conn.execute(text(
+        "SELECT id FROM pso WHERE active_operation_count IS NULL"
+    ))]
+    if not pso_ids:
+        return 0
+
+    operations = {}
+    rows = conn.execute(text(
+        "SELECT pso_id, is_active, final_time, macro_machine FROM operations "
+        "WHERE pso_id IN (SELECT id FROM pso WHERE active_operation_count IS NULL)"
+    ))
+    for pso_id, is_active, final_time, macro_machine in rows:
+        operations.setdefault(pso_id, []).append(_OperationRow(is_active, final_time, macro_machine))
+
+    conn.execute(
+        text(
+            "UPDATE pso SET active_tp_minutes = :active_tp_minutes, "
+            "inactive_tp_minutes = :inactive_tp_minutes, "
+            "active_operation_count = :active_operation_count, "
+            "inactive_operation_count = :inactive_operation_count, "
+            "machine_minutes = :machine_minutes WHERE id = :id"
+        ),
+        [
+            {**summary, "machine_minutes": json.dumps(summary["machine_minutes"]), "id": pso_id}
+            for pso_id, summary in (
+                (pso_id, summarize_operations(operations.get(pso_id, []))) for pso_id in pso_ids
+            )
+        ]
+    )
+    return len(pso_ids)
+
+def backfill_planning_tp(conn) -> int:
+    """Fills production_planning.tp_minutes for plannings published before the column existed."""
+    result = conn.execute(text("""
+        UPDATE production_planning SET tp_minutes = (
+            SELECT COALESCE(SUM(o.final_time), 0)
+            FROM operation_allocations oa
+            JOIN workstation_allocations wa ON wa.id = oa.allocation_id
+            JOIN operations o ON o.id = oa.operation_id
+            WHERE wa.planning_id = production_planning.id
+        )
+        WHERE tp_minutes IS NULL
+    """))
+    return result.rowcount or 0
+
+# (name, table, columns); same definitions as the __table_args__ in models.py
+HOT_PATH_INDEXES = [
+    ("ix_production_events_planning_created", "production_events", "planning_id, created_at"),
+    ("ix_batch_tracking_planning_checkout", "batch_tracking", "planning_id, checkout_time"),
+    ("ix_batch_tracking_batch", "batch_tracking", "batch_id"),
+    ("ix_cart_lote_planning_status_sequence", "cart_lote", "planning_id, status, sequence_number"),
+    ("ix_cart_lote_order_status", "cart_lote", "production_order_id, status"),
+    ("ix_workstation_allocations_planning", "workstation_allocations", "planning_id, seamstress_id"),
+    ("ix_operation_allocations_allocation", "operation_allocations", "allocation_id"),
+    ("ix_operation_allocations_operation", "operation_allocations", "operation_id"),
+    ("ix_operations_pso_sequence", "operations", "pso_id, sequence"),
+    ("ix_production_planning_order", "production_planning", "production_order_id"),
+    ("ix_production_planning_pso", "production_planning", "pso_id"),
+    ("ix_production_planning_active", "production_planning", "is_active"),
+]
 
 def run_migrations():
     with engine.connect() as conn:
@@ -20,6 +91,8 @@ def run_migrations():
             conn.execute(text("ALTER TABLE production_planning ADD COLUMN IF NOT EXISTS total_operators INTEGER DEFAULT 0"))
             conn.execute(text("ALTER TABLE production_planning ADD COLUMN IF NOT EXISTS notes TEXT"))
             conn.execute(text("ALTER TABLE production_planning ADD COLUMN IF NOT EXISTS version_name VARCHAR"))
+            conn.execute(text("ALTER TABLE production_planning ADD COLUMN IF NOT EXISTS lazy_carts BOOLEAN DEFAULT FALSE"))
+            conn.execute(text("ALTER TABLE production_planning ADD COLUMN IF NOT EXISTS tp_minutes FLOAT"))
             print("Verified/Added columns to production_planning")
         except Exception as e:
             print(f"Error checking production_planning columns: {e}")
@@ -45,6 +118,81 @@ def run_migrations():
             print(f"Error checking users columns: {e}")
         # ---------------------------
 
+        # --- PSO AGGREGATES (denormalized totals) ---
+        try:
+            conn.execute(text("ALTER TABLE pso ADD COLUMN IF NOT EXISTS active_tp_minutes FLOAT DEFAULT 0"))
+            conn.execute(text("ALTER TABLE pso ADD COLUMN IF NOT EXISTS inactive_tp_minutes FLOAT DEFAULT 0"))
+            conn.execute(text("ALTER TABLE pso ADD COLUMN IF NOT EXISTS active_operation_count INTEGER"))
+            conn.execute(text("ALTER TABLE pso ADD COLUMN IF NOT EXISTS inactive_operation_count INTEGER"))
+            conn.execute(text("ALTER TABLE pso ADD COLUMN IF NOT EXISTS machine_minutes VARCHAR DEFAULT '{}'"))
+            print("Verified/Added aggregate columns to pso")
+        except Exception as e:
+            print(f"Error checking pso aggregate columns: {e}")
+
+        # --- HOT PATH INDEXES (see explain_audit.py) ---
+        for name, table, columns in HOT_PATH_INDEXES:
+            try:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+            except Exception as e:
+                print(f"Error creating index {name}: {e}")
+        print(f"Verified/Created {len(HOT_PATH_INDEXES)} hot path indexes")
+
+        # --- CART UNIQUENESS (one CartLote per planning sequence) ---
+        try:
+            # Checked first: a failed CREATE would abort the rest of this transaction on Postgres
+            duplicates = conn.execute(text(
+                "SELECT COUNT(*) FROM (SELECT planning_id, sequence_number FROM cart_lote "
+                "WHERE planning_id IS NOT NULL GROUP BY planning_id, sequence_number HAVING COUNT(*) > 1) d"
+            )).scalar()
+            if duplicates:
+                print(f"⚠️ {duplicates} duplicated cart sequence(s): uq_cart_lote_planning_sequence not created, "
+                      f"see migrations/add_cart_lote_unique_sequence.sql")
+            else:
+                conn.execute(text(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS uq_cart_lote_planning_sequence "
+                    "ON cart_lote (planning_id, sequence_number)"
+                ))
+                # The unique index serves the lookups of the old plain one
+                conn.execute(text("DROP INDEX IF EXISTS ix_cart_lote_planning_sequence"))
+                print("Verified/Created uq_cart_lote_planning_sequence")
+        except Exception as e:
+            print(f"Error creating uq_cart_lote_planning_sequence: {e}")
+
+        # --- ROLLUP UPSERT TARGETS (one row per planning, seamstress and hour) ---
+        try:
+            duplicates = conn.execute(text(
+                "SELECT COUNT(*) FROM (SELECT planning_id, seamstress_id, hour_start FROM production_rollups "
+                "GROUP BY planning_id, seamstress_id, hour_start HAVING COUNT(*) > 1) d"
+            )).scalar()
+            if duplicates:
+                print(f"⚠️ {duplicates} duplicated rollup bucket(s): unique rollup indexes not created, "
+                      f"run python rollups.py --rebuild and restart")
+            else:
+                conn.execute(text(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS uq_production_rollups_cell_hour "
+                    "ON production_rollups (planning_id, hour_start) WHERE seamstress_id IS NULL"
+                ))
+                conn.execute(text(
+                    "CREATE UNIQUE INDEX IF NOT EXISTS uq_production_rollups_seamstress_hour "
+                    "ON production_rollups (planning_id, seamstress_id, hour_start) WHERE seamstress_id IS NOT NULL"
+                ))
+                conn.execute(text("DROP INDEX IF EXISTS ix_production_rollups_key"))
+                print("Verified/Created unique rollup indexes")
+        except Exception as e:
+            print(f"Error creating unique rollup indexes: {e}")
+
+        try:
+            backfilled = backfill_pso_aggregates(conn)
+            print(f"Backfilled aggregates for {backfilled} PSO(s)")
+        except Exception as e:
+            print(f"Error backfilling pso aggregates: {e}")
+
+        try:
+            backfilled = backfill_planning_tp(conn)
+            print(f"Backfilled TP for {backfilled} planning(s)")
+        except Exception as e:
+            print(f"Error backfilling planning TP: {e}")
+
         conn.commit()
         print("Migration check complete.")
 
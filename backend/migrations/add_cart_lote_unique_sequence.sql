@@ -0,0 +1,21 @@
+-- One CartLote per (planning_id, sequence_number)
+-- Two racing checkouts of the same lazy cart could both insert it (counted twice,
+-- auto-stop never fired). migrate_db.py creates this index on startup when there
+-- are no duplicates; on a large production database run this file by hand:
+--   psql "$DATABASE_URL" -f migrations/add_cart_lote_unique_sequence.sql
+
+-- 1. Duplicates left by the race (must return no rows before step 2)
+SELECT planning_id, sequence_number, COUNT(*) AS carts, array_agg(id ORDER BY id) AS cart_ids
+FROM cart_lote
+WHERE planning_id IS NOT NULL
+GROUP BY planning_id, sequence_number
+HAVING COUNT(*) > 1;
+
+-- Keep the first cart of each pair and move its checkouts to it, e.g.:
+--   UPDATE batch_tracking SET batch_id = <kept id> WHERE batch_id = <duplicate id>;
+--   DELETE FROM cart_lote WHERE id = <duplicate id>;
+-- then rebuild the analytics: python rollups.py --rebuild
+
+-- 2. The constraint (replaces the plain index)
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_cart_lote_planning_sequence ON cart_lote (planning_id, sequence_number);
+DROP INDEX CONCURRENTLY IF EXISTS ix_cart_lote_planning_sequence;
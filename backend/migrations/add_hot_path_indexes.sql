@@ -0,0 +1,26 @@
+-- Hot path indexes (Monitor, Checklist, checkout, BI)
+-- migrate_db.py creates the same indexes on startup; on a large production
+-- database run this file by hand first so the tables are not locked:
+--   psql "$DATABASE_URL" -f migrations/add_hot_path_indexes.sql
+-- Check the plans afterwards with: python explain_audit.py
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_production_events_planning_created ON production_events (planning_id, created_at);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_batch_tracking_planning_checkout ON batch_tracking (planning_id, checkout_time);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_batch_tracking_batch ON batch_tracking (batch_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_cart_lote_planning_status_sequence ON cart_lote (planning_id, status, sequence_number);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_cart_lote_order_status ON cart_lote (production_order_id, status);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_workstation_allocations_planning ON workstation_allocations (planning_id, seamstress_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_operation_allocations_allocation ON operation_allocations (allocation_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_operation_allocations_operation ON operation_allocations (operation_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_operations_pso_sequence ON operations (pso_id, sequence);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_production_planning_order ON production_planning (production_order_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_production_planning_pso ON production_planning (pso_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_production_planning_active ON production_planning (is_active);
+
+-- Superseded by ix_batch_tracking_planning_checkout (add_planning_id_to_batch_tracking.sql)
+DROP INDEX CONCURRENTLY IF EXISTS idx_batch_tracking_planning_id;
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Index, Text, UniqueConstraint, text
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -21,6 +21,13 @@ class PSO(Base):
     # Sprint 14: Soft Delete
     is_archived = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Denormalized totals (engine.summarize_operations), kept in sync on every write
+    active_tp_minutes = Column(Float, default=0.0)
+    inactive_tp_minutes = Column(Float, default=0.0)
+    active_operation_count = Column(Integer, default=0)
+    inactive_operation_count = Column(Integer, default=0)
+    machine_minutes = Column(String, default="{}")  # JSON: {"RETA": 1.23, ...}
     product = relationship("Product", back_populates="psos")
     operations = relationship("Operation", back_populates="pso")
 
@@ -38,6 +45,10 @@ class Operation(Base):
     is_active = Column(Boolean, default=True)  # Track if operation is active
     pso = relationship("PSO", back_populates="operations")
 
+    __table_args__ = (
+        Index("ix_operations_pso_sequence", "pso_id", "sequence"),
+    )
+
 class Seamstress(Base):
     """
     Tabela: SEAMSTRESS (Costureiras/Operadoras)
@@ -74,11 +85,19 @@ class ProductionPlanning(Base):
     total_operators = Column(Integer)
     efficiency_factor = Column(Float, default=1.0)
     is_active = Column(Boolean, default=True)
+    lazy_carts = Column(Boolean, default=False)  # Carts derived on demand, CartLote row written on checkout
+    tp_minutes = Column(Float, nullable=True)  # Sum of final_time of the allocated operations (set on publish)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     allocations = relationship("WorkstationAllocation", back_populates="planning")
     pso = relationship("PSO")  # ✅ Relationship to PSO
 
+    __table_args__ = (
+        Index("ix_production_planning_order", "production_order_id"),
+        Index("ix_production_planning_pso", "pso_id"),
+        Index("ix_production_planning_active", "is_active"),
+    )
+
 class WorkstationAllocation(Base):
     """
     Tabela: WORKSTATION_ALLOCATION (Estação de Trabalho / Costureira)
@@ -94,6 +113,10 @@ class WorkstationAllocation(Base):
     seamstress = relationship("Seamstress", back_populates="allocations")
     op_allocations = relationship("OperationAllocation", back_populates="workstation")
 
+    __table_args__ = (
+        Index("ix_workstation_allocations_planning", "planning_id", "seamstress_id"),
+    )
+
 class OperationAllocation(Base):
     """
     Tabela: OPERATION_ALLOCATION (Operações alocadas na estação)
@@ -108,6 +131,11 @@ class OperationAllocation(Base):
     workstation = relationship("WorkstationAllocation", back_populates="op_allocations")
     operation = relationship("Operation")
 
+    __table_args__ = (
+        Index("ix_operation_allocations_allocation", "allocation_id"),
+        Index("ix_operation_allocations_operation", "operation_id"),
+    )
+
 class CartLote(Base):
     __tablename__ = "cart_lote"
     id = Column(Integer, primary_key=True, index=True)
@@ -119,6 +147,13 @@ class CartLote(Base):
     production_order = relationship("ProductionOrder")
     planning = relationship("ProductionPlanning")  # ✅ NEW: Link to specific session
 
+    __table_args__ = (
+        Index("ix_cart_lote_planning_status_sequence", "planning_id", "status", "sequence_number"),
+        # One cart per sequence of a planning: two racing checkouts of a lazy cart cannot both insert it
+        UniqueConstraint("planning_id", "sequence_number", name="uq_cart_lote_planning_sequence"),
+        Index("ix_cart_lote_order_status", "production_order_id", "status"),
+    )
+
 class BatchTracking(Base):
     __tablename__ = "batch_tracking"
     id = Column(Integer, primary_key=True, index=True)
@@ -130,6 +165,11 @@ class BatchTracking(Base):
     batch = relationship("CartLote")
     planning = relationship("ProductionPlanning")  # ✅ NEW: Link to planning session
 
+    __table_args__ = (
+        Index("ix_batch_tracking_planning_checkout", "planning_id", "checkout_time"),
+        Index("ix_batch_tracking_batch", "batch_id"),
+    )
+
 class User(Base):
     """User model for authentication"""
     __tablename__ = "users"
@@ -153,6 +193,10 @@ class ProductionEvent(Base):
     
     planning = relationship("ProductionPlanning")
 
+    __table_args__ = (
+        Index("ix_production_events_planning_created", "planning_id", "created_at"),
+    )
+
 class SystemConfig(Base):
     """
     Tabela: SYSTEM_CONFIG (Configurações Gerais)
@@ -161,3 +205,78 @@ class SystemConfig(Base):
     __tablename__ = "system_config"
     key = Column(String, primary_key=True, index=True)
     value = Column(String) # JSON payload
+
+class ProductionRollup(Base):
+    """
+    Tabela: PRODUCTION_ROLLUPS (BI por hora)
+    One row per planning, seamstress and hour; seamstress_id NULL = cell totals.
+    Maintained by checkout/stop (see rollups.py).
+    """
+    __tablename__ = "production_rollups"
+    id = Column(Integer, primary_key=True, index=True)
+    planning_id = Column(Integer, ForeignKey("production_planning.id"), nullable=False)
+    pso_id = Column(Integer, ForeignKey("pso.id"), nullable=True)
+    seamstress_id = Column(Integer, ForeignKey("seamstresses.id"), nullable=True)
+    hour_start = Column(DateTime, nullable=False)
+    pieces = Column(Integer, default=0)
+    carts = Column(Integer, default=0)
+    delayed_carts = Column(Integer, default=0)
+    standard_minutes = Column(Float, default=0.0)
+    worked_minutes = Column(Float, default=0.0)
+    last_checkout_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Upsert targets of rollups._add; partial because NULL seamstress_id (cell totals) never conflicts
+        Index("uq_production_rollups_cell_hour", "planning_id", "hour_start", unique=True,
+              postgresql_where=text("seamstress_id IS NULL"), sqlite_where=text("seamstress_id IS NULL")),
+        Index("uq_production_rollups_seamstress_hour", "planning_id", "seamstress_id", "hour_start", unique=True,
+              postgresql_where=text("seamstress_id IS NOT NULL"), sqlite_where=text("seamstress_id IS NOT NULL")),
+        Index("ix_production_rollups_hour", "hour_start"),
+        Index("ix_production_rollups_pso_hour", "pso_id", "hour_start"),
+    )
+
+class ExtractionCacheEntry(Base):
+    """
+    Tabela: PSO_EXTRACTION_CACHE (resultado da extração por IA)
+    Parsed JSON of a sequence sheet, keyed by the SHA-256 of the PDF bytes and
+    the fingerprint of the prompt/model that produced it (see extraction_cache.py).
+    """
+    __tablename__ = "pso_extraction_cache"
+    pdf_sha256 = Column(String(64), primary_key=True)
+    prompt_hash = Column(String(64), primary_key=True)
+    payload = Column(Text, nullable=False)  # JSON returned by the extractor
+    size_bytes = Column(Integer, nullable=False)
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_pso_extraction_cache_last_used", "last_used_at"),
+    )
+
+
+class ImportJob(Base):
+    """
+    Tabela: PSO_IMPORT_JOBS (importação de PDF em background)
+    One row per uploaded sequence sheet; files uploaded together share batch_id.
+    status: queued -> running -> done | failed (retrying between attempts).
+    The PDF bytes stay in the memory of the worker process named in `worker`.
+    """
+    __tablename__ = "pso_import_jobs"
+    id = Column(String(32), primary_key=True)
+    batch_id = Column(String(32), nullable=False)
+    position = Column(Integer, default=0)  # order of the file in the upload
+    filename = Column(String, nullable=True)
+    size_bytes = Column(Integer, default=0)
+    status = Column(String(16), nullable=False, default="queued")
+    attempts = Column(Integer, default=0)
+    worker = Column(String, nullable=True)  # "host:pid" holding the PDF
+    error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)  # JSON of the import (pso_id, reference, ...)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_pso_import_jobs_batch", "batch_id"),
+    )
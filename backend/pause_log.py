@@ -0,0 +1,156 @@
+"""
+Linha do tempo de pausas por planejamento.
+
+PAUSE/RESUME events are kept in memory as sorted, non-overlapping intervals
+per planning, appended as the events are written and loaded from
+production_events (planning_id, created_at) on a miss. Paused time inside a
+window is then a bisect plus a prefix sum instead of a scan of the events.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+import models
+from shift_calendar import ShiftCalendar
+
+# Safety net for events written by another process (e.g. a second uvicorn worker)
+PAUSE_LOG_TTL_SECONDS = float(os.getenv("PAUSE_LOG_TTL_SECONDS", "30"))
+
+
+class PauseTimeline:
+    """Pausas de um planejamento em ordem: starts[i]..ends[i] (None = pausa em aberto)."""
+
+    def __init__(self):
+        self.starts: List[datetime] = []
+        self.ends: List[Optional[datetime]] = []
+        # prefix[k] = shift minutes paused in pauses 0..k-1, for _prefix_calendar
+        self._prefix: List[float] = [0.0]
+        self._prefix_calendar: Optional[ShiftCalendar] = None
+
+    @property
+    def is_open(self) -> bool:
+        return bool(self.ends) and self.ends[-1] is None
+
+    def append(self, event_type: str, created_at: datetime):
+        """Applies a pause/resume event; a repeated pause or a stray resume is ignored."""
+        if event_type == "pause" and not self.is_open:
+            self.starts.append(created_at)
+            self.ends.append(None)
+        elif event_type == "resume" and self.is_open:
+            self.ends[-1] = created_at
+
+    def _prefix_for(self, calendar: ShiftCalendar) -> List[float]:
+        if calendar is not self._prefix_calendar:
+            self._prefix = [0.0]
+            self._prefix_calendar = calendar
+        # Every pause but the last one is closed
+        while len(self._prefix) < len(self.starts):
+            k = len(self._prefix) - 1
+            self._prefix.append(self._prefix[-1] + calendar.working_minutes(self.starts[k], self.ends[k]))
+        return self._prefix
+
+    def paused_minutes(self, start_dt: datetime, end_dt: datetime, calendar: ShiftCalendar) -> float:
+        """
+        Shift minutes paused inside [start_dt, end_dt]. Only pauses that began
+        inside the window count; a pause still open at end_dt is cut there.
+        """
+        first = bisect_left(self.starts, start_dt)
+        last = bisect_right(self.starts, end_dt) - 1
+        if last < first:
+            return 0.0
+        prefix = self._prefix_for(calendar)
+        # Pauses first..last-1 end before the next one starts, so inside the window
+        total = prefix[last] - prefix[first]
+        last_end = self.ends[last]
+        if last_end is None or last_end > end_dt:
+            last_end = end_dt
+        return total + calendar.working_minutes(self.starts[last], last_end)
+
+    def intervals(self, since: datetime) -> List[dict]:
+        """Pausas iniciadas a partir de `since`: [{"start": dt, "end": dt | None}]."""
+        first = bisect_left(self.starts, since)
+        return [{"start": s, "end": e} for s, e in zip(self.starts[first:], self.ends[first:])]
+
+
+def load_timeline(db: Session, planning_id: int) -> PauseTimeline:
+    timeline = PauseTimeline()
+    events = db.query(models.ProductionEvent.event_type, models.ProductionEvent.created_at).filter(
+        models.ProductionEvent.planning_id == planning_id,
+        models.ProductionEvent.event_type.in_(["pause", "resume"])
+    ).order_by(models.ProductionEvent.created_at).all()
+    for event_type, created_at in events:
+        timeline.append(event_type, created_at)
+    return timeline
+
+
+class PauseLogCache:
+    """
+    Linhas do tempo de pausa em memória, por planejamento.
+    Loaded on the first read (or by warm() on startup) and appended by
+    record_event; reloaded after the TTL in case another process wrote events.
+    """
+
+    def __init__(self, ttl_seconds: float = PAUSE_LOG_TTL_SECONDS):
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._timelines: Dict[int, PauseTimeline] = {}
+        self._loaded_at: Dict[int, float] = {}
+        self._generation: Dict[int, int] = {}
+
+    def _timeline(self, db: Session, planning_id: int) -> PauseTimeline:
+        # Loaded outside the lock (async endpoints share one thread, see database.run_read)
+        with self._lock:
+            loaded_at = self._loaded_at.get(planning_id)
+            if loaded_at is not None and time.monotonic() - loaded_at <= self._ttl_seconds:
+                return self._timelines[planning_id]
+            generation = self._generation.get(planning_id, 0)
+        timeline = load_timeline(db, planning_id)
+        with self._lock:
+            if self._generation.get(planning_id, 0) == generation:
+                self._timelines[planning_id] = timeline
+                self._loaded_at[planning_id] = time.monotonic()
+        return timeline
+
+    def paused_minutes(self, db: Session, planning_id: int, start_dt: datetime, end_dt: datetime,
+                       calendar: ShiftCalendar) -> float:
+        timeline = self._timeline(db, planning_id)
+        with self._lock:
+            return timeline.paused_minutes(start_dt, end_dt, calendar)
+
+    def intervals(self, db: Session, planning_id: int, since: datetime) -> List[dict]:
+        timeline = self._timeline(db, planning_id)
+        with self._lock:
+            return timeline.intervals(since)
+
+    def record_event(self, planning_id: int, event_type: str, created_at: datetime):
+        if event_type not in ("pause", "resume"):
+            return
+        with self._lock:
+            self._generation[planning_id] = self._generation.get(planning_id, 0) + 1
+            timeline = self._timelines.get(planning_id)
+            if timeline is not None:
+                timeline.append(event_type, created_at)
+
+    def warm(self, db: Session) -> int:
+        """Loads every planning's timeline in one query. Returns the number of plannings."""
+        timelines: Dict[int, PauseTimeline] = {}
+        events = db.query(
+            models.ProductionEvent.planning_id, models.ProductionEvent.event_type, models.ProductionEvent.created_at
+        ).filter(
+            models.ProductionEvent.event_type.in_(["pause", "resume"])
+        ).order_by(models.ProductionEvent.planning_id, models.ProductionEvent.created_at).all()
+        for planning_id, event_type, created_at in events:
+            timelines.setdefault(planning_id, PauseTimeline()).append(event_type, created_at)
+        with self._lock:
+            now = time.monotonic()
+            self._timelines = timelines
+            self._loaded_at = {planning_id: now for planning_id in timelines}
+        return len(timelines)
+
+
+pause_log = PauseLogCache()
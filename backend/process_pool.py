@@ -0,0 +1,27 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+# Shared by the CPU-bound planning endpoints (scenarios, simulation)
+PLANNING_WORKERS = int(os.getenv("PLANNING_WORKERS", os.getenv("SCENARIO_WORKERS", "0"))) or (os.cpu_count() or 1)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Lazily starts the worker processes on first use."""
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PLANNING_WORKERS)
+        return _pool
+
+
+def shutdown_process_pool():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -0,0 +1,204 @@
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import desc, func
+from sqlalchemy.orm import Session
+
+import models
+from carts import list_planning_carts
+
+# Safety net for writes made outside this process (e.g. a second uvicorn worker)
+STATE_TTL_SECONDS = float(os.getenv("PRODUCTION_STATE_TTL_SECONDS", "30"))
+
+
+@dataclass
+class ActiveProductionState:
+    """
+    Estado materializado do planejamento ativo (a produção rodando na célula).
+    Lido pelo Monitor, Checklist, produção ativa e BI sem voltar ao banco.
+    """
+    planning_id: int
+    version_name: Optional[str]
+    pulse_duration: int
+    batch_size: int
+    created_at: datetime
+    pso_id: Optional[int]
+    pso_version: Optional[str]
+    product_reference: Optional[str]
+    product_description: Optional[str]
+    production_order_id: Optional[int]
+    po_reference: Optional[str]
+    po_quantity: int
+    session_start: datetime
+    last_checkout_time: Optional[datetime]
+    carts_produced: int
+    total_batches: int
+    tp_per_batch: float  # Sum of final_time of every allocated operation
+    pending_carts: List[dict] = field(default_factory=list)
+    is_paused: bool = False
+    workstations: List[dict] = field(default_factory=list)
+
+    @property
+    def current_cycle_start(self) -> datetime:
+        if self.last_checkout_time and self.last_checkout_time > self.session_start:
+            return self.last_checkout_time
+        return self.session_start
+
+    @property
+    def standard_minutes(self) -> float:
+        return self.tp_per_batch * self.carts_produced
+
+
+def planning_tp_minutes(db: Session, planning_id: int) -> float:
+    """Sum of final_time of every allocated operation (fallback when tp_minutes is not stored)."""
+    return db.query(
+        func.coalesce(func.sum(models.Operation.final_time), 0.0)
+    ).select_from(models.OperationAllocation).join(
+        models.Operation, models.Operation.id == models.OperationAllocation.operation_id
+    ).join(
+        models.WorkstationAllocation, models.WorkstationAllocation.id == models.OperationAllocation.allocation_id
+    ).filter(models.WorkstationAllocation.planning_id == planning_id).scalar() or 0.0
+
+
+def load_active_state(db: Session) -> Optional[ActiveProductionState]:
+    """Builds the state of the active planning from the database (None if idle)."""
+    planning = db.query(models.ProductionPlanning).filter(
+        models.ProductionPlanning.is_active == True
+    ).order_by(desc(models.ProductionPlanning.id)).first()
+
+    if not planning:
+        return None
+
+    po = db.query(models.ProductionOrder).filter(
+        models.ProductionOrder.id == planning.production_order_id
+    ).first()
+
+    pso = None
+    if planning.pso_id:
+        pso = db.query(models.PSO).filter(models.PSO.id == planning.pso_id).first()
+
+    # Session start: latest START event (or planning creation as fallback)
+    latest_start_event = db.query(models.ProductionEvent).filter(
+        models.ProductionEvent.planning_id == planning.id,
+        models.ProductionEvent.event_type == 'start'
+    ).order_by(desc(models.ProductionEvent.created_at)).first()
+    session_start = latest_start_event.created_at if latest_start_event else planning.created_at
+
+    carts_produced, last_checkout_time = db.query(
+        func.count(models.BatchTracking.id),
+        func.max(models.BatchTracking.checkout_time)
+    ).filter(models.BatchTracking.planning_id == planning.id).one()
+
+    carts = list_planning_carts(db, planning)
+
+    tp_per_batch = planning.tp_minutes
+    if tp_per_batch is None:
+        tp_per_batch = planning_tp_minutes(db, planning.id)
+
+    latest_event = db.query(models.ProductionEvent).filter(
+        models.ProductionEvent.planning_id == planning.id
+    ).order_by(desc(models.ProductionEvent.created_at)).first()
+
+    workstations = []
+    for seat in planning.allocations:
+        active_ops_count = len(seat.op_allocations)
+        workstations.append({
+            "seamstress_name": seat.seamstress.name if seat.seamstress else f"Costureira {seat.seamstress_id}",
+            "position": seat.seamstress_id,
+            "load_count": active_ops_count,
+            "status": "Produzindo" if active_ops_count > 0 else "Ociosa"
+        })
+    workstations.sort(key=lambda x: x["position"])
+
+    return ActiveProductionState(
+        planning_id=planning.id,
+        version_name=planning.version_name,
+        pulse_duration=planning.pulse_duration,
+        batch_size=planning.batch_size or 0,
+        created_at=planning.created_at,
+        pso_id=planning.pso_id,
+        pso_version=pso.version_name if pso else None,
+        product_reference=pso.product.reference if pso and pso.product else None,
+        product_description=pso.product.description if pso and pso.product else None,
+        production_order_id=po.id if po else None,
+        po_reference=po.product_reference if po else None,
+        po_quantity=(po.quantity or 0) if po else 0,
+        session_start=session_start,
+        last_checkout_time=last_checkout_time,
+        carts_produced=carts_produced or 0,
+        total_batches=len(carts),
+        tp_per_batch=float(tp_per_batch or 0.0),
+        pending_carts=[c for c in carts if c["status"] == "Aguardando"],
+        is_paused=bool(latest_event and latest_event.event_type == 'pause'),
+        workstations=workstations
+    )
+
+
+class ProductionStateCache:
+    """
+    Cache em processo do planejamento ativo.
+
+    Loaded lazily on the first read after an invalidation. Checkouts and
+    pause/resume events are applied incrementally; anything that can change
+    which planning is active (start, stop, publish, delete) invalidates it.
+    Lists are replaced, never mutated, so readers never see a partial update.
+    """
+
+    def __init__(self, ttl_seconds: float = STATE_TTL_SECONDS):
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.RLock()
+        self._state: Optional[ActiveProductionState] = None
+        self._loaded_at: Optional[float] = None
+        # Bumped by every write: a load that raced with one is not cached
+        self._generation = 0
+
+    def get(self, db: Session) -> Optional[ActiveProductionState]:
+        # The lock is never held across the database load: async endpoints
+        # (database.run_read) share one thread, so a held lock would block the loop
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at <= self._ttl_seconds:
+                return self._state
+            generation = self._generation
+        state = load_active_state(db)
+        with self._lock:
+            if self._generation == generation:
+                self._state = state
+                self._loaded_at = time.monotonic()
+        return state
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+            self._loaded_at = None
+            self._generation += 1
+
+    def record_checkout(self, planning_id: Optional[int], sequence: int, checkout_time: datetime):
+        with self._lock:
+            self._generation += 1
+            state = self._state
+            if state is None or state.planning_id != planning_id:
+                return
+            state.carts_produced += 1
+            if not state.last_checkout_time or checkout_time > state.last_checkout_time:
+                state.last_checkout_time = checkout_time
+            state.pending_carts = [c for c in state.pending_carts if c["sequence"] != sequence]
+
+    def record_event(self, planning_id: int, event_type: str, created_at: datetime):
+        with self._lock:
+            state = self._state
+            if event_type not in ("pause", "resume"):
+                # start/stop open or close a session: reload from scratch
+                self.invalidate()
+                return
+            self._generation += 1
+            if state is None or state.planning_id != planning_id:
+                return
+            # The intervals themselves live in pause_log
+            state.is_paused = event_type == "pause"
+
+
+production_state = ProductionStateCache()
@@ -0,0 +1,78 @@
+"""
+Gravação em lote de uma versão de PSO (importação do PDF e "salvar versão").
+
+One transaction and a fixed set of statements, whatever the number of
+operations:
+    1. product upsert: INSERT ... ON CONFLICT (reference) ... RETURNING id,
+       which also keeps the product row locked until the commit
+    2. next version name (import only), counted under that lock, so two
+       concurrent imports of the same product cannot both get "V3"
+    3. INSERT of the PSO with its totals already computed
+    4. one multi-row INSERT of the operations
+The caller commits.
+"""
+import json
+from types import SimpleNamespace
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+import models
+from database import upsert_insert
+from engine import summarize_operations
+
+# Rows per INSERT statement, well below the bind parameter limits
+OPERATIONS_PER_INSERT = 1000
+
+
+def upsert_product(db: Session, reference: str, description: Optional[str]) -> int:
+    """Id of the product `reference`, created if missing (existing descriptions are kept)."""
+    stmt = upsert_insert(db, models.Product)
+    if stmt is None:
+        product = db.query(models.Product).filter(models.Product.reference == reference).with_for_update().first()
+        if product is None:
+            product = models.Product(reference=reference, description=description)
+            db.add(product)
+            db.flush()
+        return product.id
+
+    stmt = stmt.values(reference=reference, description=description)
+    # No-op update instead of DO NOTHING: RETURNING then gives the id of an existing row too
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.Product.reference], set_={"reference": stmt.excluded.reference}
+    ).returning(models.Product.id)
+    return db.execute(stmt).scalar_one()
+
+
+def next_version_name(db: Session, product_id: int) -> str:
+    """V<n+1>; call after upsert_product in the same transaction (the row lock serializes it)."""
+    count = db.query(func.count(models.PSO.id)).filter(models.PSO.product_id == product_id).scalar()
+    return f"V{count + 1}"
+
+
+def insert_pso_version(db: Session, product_id: int, version_name: str, efficiency_factor: float,
+                       operations: List[dict]) -> Tuple[int, dict]:
+    """
+    Inserts the PSO and its operations (dicts with the Operation columns,
+    without pso_id). Returns (pso_id, summary of the operations).
+    """
+    summary = summarize_operations([SimpleNamespace(**op) for op in operations])
+    pso_id = db.execute(
+        insert(models.PSO).values(
+            product_id=product_id,
+            version_name=version_name,
+            status="Ativa",
+            default_efficiency_factor=efficiency_factor,
+            active_tp_minutes=summary["active_tp_minutes"],
+            inactive_tp_minutes=summary["inactive_tp_minutes"],
+            active_operation_count=summary["active_operation_count"],
+            inactive_operation_count=summary["inactive_operation_count"],
+            machine_minutes=json.dumps(summary["machine_minutes"])
+        ).returning(models.PSO.id)
+    ).scalar_one()
+
+    rows = [{**op, "pso_id": pso_id} for op in operations]
+    for start in range(0, len(rows), OPERATIONS_PER_INSERT):
+        db.execute(insert(models.Operation).values(rows[start:start + OPERATIONS_PER_INSERT]))
+    return pso_id, summary
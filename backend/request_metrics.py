@@ -0,0 +1,235 @@
+"""
+Métricas por endpoint: SQL, tempo de banco, tempo Python e tamanho da resposta.
+
+RequestMetricsMiddleware opens a collector per request (a ContextVar, so it
+follows the request into the threadpool and into AsyncSession.run_sync) and
+the cursor hooks on every Engine count the statements and their time into it.
+At the end of the response the totals are added to the endpoint's counters,
+served by /api/_metrics in Prometheus text format.
+
+With DEBUG_QUERIES_HEADER=true, a request from an admin (same check as
+require_admin) carrying X-Debug-Queries: 1 also gets X-Query-Count,
+X-DB-Time-Ms and X-Debug-Queries (JSON list of the statements, without
+parameters) in the response. Anyone else's header is ignored. Statements run
+after the response headers (streaming responses) are counted but not listed.
+"""
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from auth import require_admin
+
+REQUEST_METRICS_ENABLED = os.getenv("REQUEST_METRICS", "true").lower() in ("1", "true", "yes")
+# Opt-in, and admins only even then: the header exposes the SQL of any endpoint
+DEBUG_QUERIES_HEADER = os.getenv("DEBUG_QUERIES_HEADER", "false").lower() in ("1", "true", "yes")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEBUG_STATEMENT_CHARS = 500
+
+
+class QueryCollector:
+    """SQL executado durante um request."""
+
+    def __init__(self, keep_statements: bool):
+        self.count = 0
+        self.db_seconds = 0.0
+        self.statements: Optional[List[dict]] = [] if keep_statements else None
+
+    def add(self, statement: str, seconds: float):
+        self.count += 1
+        self.db_seconds += seconds
+        if self.statements is not None:
+            self.statements.append({
+                "sql": " ".join(statement.split())[:DEBUG_STATEMENT_CHARS],
+                "ms": round(seconds * 1000, 3)
+            })
+
+
+_collector: ContextVar[Optional[QueryCollector]] = ContextVar("request_query_collector", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _collector.get() is not None:
+        conn.info.setdefault("request_metrics_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    collector = _collector.get()
+    started = conn.info.get("request_metrics_started")
+    if collector is not None and started:
+        collector.add(statement, time.perf_counter() - started.pop())
+
+
+class EndpointStats:
+    __slots__ = ("requests", "statements", "db_seconds", "python_seconds", "response_bytes",
+                 "max_statements", "buckets", "seconds")
+
+    def __init__(self):
+        self.requests: Dict[int, int] = {}
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.python_seconds = 0.0
+        self.response_bytes = 0
+        self.max_statements = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.seconds = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[tuple, EndpointStats] = {}
+
+    def observe(self, method: str, endpoint: str, status: int, seconds: float, collector: QueryCollector,
+                response_bytes: int):
+        with self._lock:
+            stats = self._stats.get((method, endpoint))
+            if stats is None:
+                stats = self._stats[(method, endpoint)] = EndpointStats()
+            stats.requests[status] = stats.requests.get(status, 0) + 1
+            stats.statements += collector.count
+            stats.db_seconds += collector.db_seconds
+            stats.python_seconds += max(seconds - collector.db_seconds, 0.0)
+            stats.response_bytes += response_bytes
+            stats.max_statements = max(stats.max_statements, collector.count)
+            stats.seconds += seconds
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[i] += 1
+
+    def render(self) -> str:
+        """Texto no formato de exposição do Prometheus (0.0.4)."""
+        with self._lock:
+            items = sorted(self._stats.items())
+            lines = []
+
+            def family(name, kind, help_text, samples):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(samples)
+
+            def labels(method, endpoint, **extra):
+                pairs = {"method": method, "endpoint": endpoint, **extra}
+                escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                           for k, v in pairs.items())
+                return "{" + ",".join(escaped) + "}"
+
+            family("sgp_http_requests_total", "counter", "Requests by endpoint and status code.", [
+                f"sgp_http_requests_total{labels(m, e, status=status)} {n}"
+                for (m, e), s in items for status, n in sorted(s.requests.items())
+            ])
+            histogram = []
+            for (m, e), s in items:
+                total = sum(s.requests.values())
+                for bound, n in zip(LATENCY_BUCKETS, s.buckets):
+                    histogram.append(f"sgp_http_request_duration_seconds_bucket{labels(m, e, le=bound)} {n}")
+                histogram.append(f"sgp_http_request_duration_seconds_bucket{labels(m, e, le='+Inf')} {total}")
+                histogram.append(f"sgp_http_request_duration_seconds_sum{labels(m, e)} {s.seconds:.6f}")
+                histogram.append(f"sgp_http_request_duration_seconds_count{labels(m, e)} {total}")
+            family("sgp_http_request_duration_seconds", "histogram", "Request latency (until the last body chunk).",
+                   histogram)
+            family("sgp_http_sql_statements_total", "counter", "SQL statements executed by the endpoint.", [
+                f"sgp_http_sql_statements_total{labels(m, e)} {s.statements}" for (m, e), s in items
+            ])
+            family("sgp_http_sql_statements_max", "gauge", "Most SQL statements seen in one request (N+1 check).", [
+                f"sgp_http_sql_statements_max{labels(m, e)} {s.max_statements}" for (m, e), s in items
+            ])
+            family("sgp_http_db_seconds_total", "counter", "Time spent executing SQL.", [
+                f"sgp_http_db_seconds_total{labels(m, e)} {s.db_seconds:.6f}" for (m, e), s in items
+            ])
+            family("sgp_http_python_seconds_total", "counter", "Request time outside SQL.", [
+                f"sgp_http_python_seconds_total{labels(m, e)} {s.python_seconds:.6f}" for (m, e), s in items
+            ])
+            family("sgp_http_response_bytes_total", "counter", "Response body bytes.", [
+                f"sgp_http_response_bytes_total{labels(m, e)} {s.response_bytes}" for (m, e), s in items
+            ])
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = MetricsRegistry()
+
+
+def _debug_requested(scope) -> bool:
+    """X-Debug-Queries set by a caller whose bearer token passes require_admin."""
+    headers = dict(scope.get("headers", []))
+    if headers.get(b"x-debug-queries", b"") in (b"", b"0", b"false"):
+        return False
+    scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        require_admin(HTTPAuthorizationCredentials(scheme=scheme, credentials=token.strip()))
+    except HTTPException:
+        return False
+    return True
+
+
+class RequestMetricsMiddleware:
+    """
+    Middleware ASGI puro (não bufferiza a resposta, então o SSE do Monitor
+    continua em streaming). O endpoint é o path template da rota
+    ("/api/planning/{planning_id}"), não a URL, para não explodir as séries.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = request_metrics):
+        self.app = app
+        self.registry = registry
+        self._templates: Dict[object, str] = {}
+
+    def _endpoint_label(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self._templates:
+            router_app = scope.get("app")
+            for route in getattr(router_app, "routes", []):
+                if getattr(route, "endpoint", None) is endpoint or getattr(route, "app", None) is endpoint:
+                    self._templates[endpoint] = route.path
+                    break
+            else:
+                self._templates[endpoint] = getattr(endpoint, "__name__", "unmatched")
+        return self._templates[endpoint]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not REQUEST_METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        debug = DEBUG_QUERIES_HEADER and _debug_requested(scope)
+        collector = QueryCollector(keep_statements=debug)
+        token = _collector.set(collector)
+        started = time.perf_counter()
+        status = 500
+        response_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if debug:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-query-count", str(collector.count).encode()))
+                    headers.append((b"x-db-time-ms", f"{collector.db_seconds * 1000:.3f}".encode()))
+                    headers.append((b"x-debug-queries", json.dumps(collector.statements).encode()))
+                    message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _collector.reset(token)
+            self.registry.observe(
+                scope["method"], self._endpoint_label(scope), status,
+                time.perf_counter() - started, collector, response_bytes
+            )
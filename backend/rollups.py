@@ -0,0 +1,284 @@
+"""
+Rollups de produção (BI / Page 07).
+
+One row per (planning, seamstress, hour) with the totals of the carts
+checked out in that hour. Rows with seamstress_id NULL are the cell totals;
+the other rows split the same cycles per seamstress. Maintained on every
+checkout and stop, and regenerated from history with:
+
+    python rollups.py --rebuild
+
+or, by an admin, with POST /api/analytics/rollups/rebuild (background thread).
+"""
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import case, func, or_
+from sqlalchemy.orm import Session
+
+import models
+from database import upsert_insert
+
+# (db, planning_id, start, end) -> working minutes without breaks and pauses
+WorkingMinutesFn = Callable[[Session, int, datetime, datetime], float]
+
+
+def hour_bucket(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def cycle_start(db: Session, planning: models.ProductionPlanning, end_time: datetime,
+                include_end: bool = False) -> datetime:
+    """
+    Start of the cycle that ends at end_time: the later of the previous
+    checkout and the latest START event (planning creation as fallback).
+    include_end counts a checkout at end_time itself (a STOP right after the last cart).
+    """
+    checkout = models.BatchTracking.checkout_time
+    previous_checkout = db.query(func.max(checkout)).filter(
+        models.BatchTracking.planning_id == planning.id,
+        checkout <= end_time if include_end else checkout < end_time
+    ).scalar()
+    latest_start = db.query(func.max(models.ProductionEvent.created_at)).filter(
+        models.ProductionEvent.planning_id == planning.id,
+        models.ProductionEvent.event_type == "start",
+        models.ProductionEvent.created_at <= end_time
+    ).scalar()
+    candidates = [t for t in (previous_checkout, latest_start) if t]
+    return max(candidates) if candidates else planning.created_at
+
+
+def seamstress_minutes_per_piece(db: Session, planning: models.ProductionPlanning) -> Dict[int, float]:
+    """
+    Standard minutes per piece of each seamstress; fractioned operations
+    count only the share executed at that station.
+    """
+    batch_size = planning.batch_size or 0
+    if batch_size <= 0:
+        return {}
+    rows = db.query(
+        models.WorkstationAllocation.seamstress_id,
+        func.coalesce(func.sum(models.Operation.final_time * models.OperationAllocation.executed_quantity), 0.0)
+    ).join(
+        models.OperationAllocation, models.OperationAllocation.allocation_id == models.WorkstationAllocation.id
+    ).join(
+        models.Operation, models.Operation.id == models.OperationAllocation.operation_id
+    ).filter(
+        models.WorkstationAllocation.planning_id == planning.id
+    ).group_by(models.WorkstationAllocation.seamstress_id).all()
+    return {seamstress_id: float(total) / batch_size for seamstress_id, total in rows}
+
+
+def _add(db: Session, planning: models.ProductionPlanning, seamstress_id: Optional[int], bucket: datetime,
+         pieces: int, carts: int, delayed: int, standard_minutes: float, worked_minutes: float,
+         checkout_time: Optional[datetime]):
+    """
+    Adds the cycle to the (planning, seamstress, hour) row with one
+    INSERT ... ON CONFLICT DO UPDATE: two concurrent first writes of an hour
+    both land in the same row.
+    """
+    stmt = upsert_insert(db, models.ProductionRollup)
+    if stmt is None:
+        _add_locked(db, planning, seamstress_id, bucket, pieces, carts, delayed, standard_minutes,
+                    worked_minutes, checkout_time)
+        return
+
+    rollup = models.ProductionRollup
+    stmt = stmt.values(
+        planning_id=planning.id,
+        pso_id=planning.pso_id,
+        seamstress_id=seamstress_id,
+        hour_start=bucket,
+        pieces=pieces, carts=carts, delayed_carts=delayed,
+        standard_minutes=standard_minutes, worked_minutes=worked_minutes,
+        last_checkout_at=checkout_time
+    )
+    excluded = stmt.excluded
+    if seamstress_id is None:
+        target = {"index_elements": [rollup.planning_id, rollup.hour_start],
+                  "index_where": rollup.seamstress_id.is_(None)}
+    else:
+        target = {"index_elements": [rollup.planning_id, rollup.seamstress_id, rollup.hour_start],
+                  "index_where": rollup.seamstress_id.is_not(None)}
+    db.execute(stmt.on_conflict_do_update(**target, set_={
+        "pieces": rollup.pieces + excluded.pieces,
+        "carts": rollup.carts + excluded.carts,
+        "delayed_carts": rollup.delayed_carts + excluded.delayed_carts,
+        "standard_minutes": rollup.standard_minutes + excluded.standard_minutes,
+        "worked_minutes": rollup.worked_minutes + excluded.worked_minutes,
+        "last_checkout_at": case(
+            (or_(rollup.last_checkout_at.is_(None), excluded.last_checkout_at > rollup.last_checkout_at),
+             func.coalesce(excluded.last_checkout_at, rollup.last_checkout_at)),
+            else_=rollup.last_checkout_at
+        )
+    }))
+
+
+def _add_locked(db: Session, planning: models.ProductionPlanning, seamstress_id: Optional[int], bucket: datetime,
+                pieces: int, carts: int, delayed: int, standard_minutes: float, worked_minutes: float,
+                checkout_time: Optional[datetime]):
+    """Other databases: read the row FOR UPDATE and add to it (the unique indexes catch a racing insert)."""
+    row = db.query(models.ProductionRollup).filter(
+        models.ProductionRollup.planning_id == planning.id,
+        models.ProductionRollup.seamstress_id == seamstress_id if seamstress_id is not None
+        else models.ProductionRollup.seamstress_id.is_(None),
+        models.ProductionRollup.hour_start == bucket
+    ).with_for_update().first()
+    if row is None:
+        row = models.ProductionRollup(
+            planning_id=planning.id,
+            pso_id=planning.pso_id,
+            seamstress_id=seamstress_id,
+            hour_start=bucket,
+            pieces=0, carts=0, delayed_carts=0, standard_minutes=0.0, worked_minutes=0.0
+        )
+        db.add(row)
+    row.pieces += pieces
+    row.carts += carts
+    row.delayed_carts += delayed
+    row.standard_minutes += standard_minutes
+    row.worked_minutes += worked_minutes
+    if checkout_time and (row.last_checkout_at is None or checkout_time > row.last_checkout_at):
+        row.last_checkout_at = checkout_time
+    # Session has autoflush off: the next cycle of this hour must find this row
+    db.flush()
+
+
+def record_cycle(db: Session, planning: models.ProductionPlanning, end_time: datetime, worked_minutes: float,
+                 pieces: int = 0, is_delayed: bool = False, per_piece: Optional[Dict[int, float]] = None):
+    """
+    Adds one cycle to the rollups of end_time's hour: a checked-out cart
+    (pieces > 0) or the tail of a session closed by STOP (pieces = 0).
+    The caller commits.
+    """
+    bucket = hour_bucket(end_time)
+    carts = 1 if pieces else 0
+    delayed = 1 if pieces and is_delayed else 0
+    checkout_time = end_time if pieces else None
+
+    # Cell totals use the planning TP, same figure as the Monitor
+    tp = planning.tp_minutes or 0.0
+    _add(db, planning, None, bucket, pieces, carts, delayed, tp * pieces, worked_minutes, checkout_time)
+
+    if per_piece is None:
+        per_piece = seamstress_minutes_per_piece(db, planning)
+    for seamstress_id, minutes in per_piece.items():
+        _add(db, planning, seamstress_id, bucket, pieces, carts, delayed, minutes * pieces, worked_minutes, checkout_time)
+
+
+def rebuild_rollups(db: Session, working_minutes: WorkingMinutesFn) -> int:
+    """
+    Regenerates every rollup from BatchTracking and the STOP events.
+    Returns the number of cycles replayed. The caller commits.
+    """
+    db.query(models.ProductionRollup).delete()
+    db.flush()
+
+    cycles = 0
+    stopped = db.query(models.ProductionEvent.planning_id).filter(models.ProductionEvent.event_type == "stop")
+    plannings = db.query(models.ProductionPlanning).filter(
+        models.ProductionPlanning.id.in_(db.query(models.BatchTracking.planning_id).distinct())
+        | models.ProductionPlanning.id.in_(stopped)
+    ).all()
+    for planning in plannings:
+        per_piece = seamstress_minutes_per_piece(db, planning)
+        checkouts = db.query(
+            models.BatchTracking.checkout_time,
+            models.BatchTracking.is_delayed,
+            models.CartLote.quantity_pieces
+        ).outerjoin(
+            models.CartLote, models.CartLote.id == models.BatchTracking.batch_id
+        ).filter(models.BatchTracking.planning_id == planning.id).all()
+        stops = db.query(models.ProductionEvent.created_at).filter(
+            models.ProductionEvent.planning_id == planning.id,
+            models.ProductionEvent.event_type == "stop"
+        ).all()
+
+        events = [(t, delayed, qty or 0) for t, delayed, qty in checkouts if t]
+        events += [(t, False, 0) for (t,) in stops if t]
+        last_stop = None
+        for end_time, is_delayed, pieces in sorted(events, key=lambda e: e[0]):
+            start = cycle_start(db, planning, end_time, include_end=not pieces)
+            if not pieces:
+                # A second STOP without a START in between closes nothing
+                if last_stop and last_stop >= start:
+                    continue
+                last_stop = end_time
+            worked = working_minutes(db, planning.id, start, end_time) if end_time > start else 0.0
+            if not pieces and worked <= 0:
+                continue
+            record_cycle(db, planning, end_time, worked, pieces, bool(is_delayed), per_piece)
+            cycles += 1
+    return cycles
+
+
+
+class RollupRebuild:
+    """
+    Reconstrução pedida pela API: roda numa thread própria, com sessão
+    própria, como o `python rollups.py --rebuild`. Uma por vez.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._status: dict = {"running": False}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, session_factory, working_minutes: WorkingMinutesFn, requested_by: str) -> dict:
+        """Raises RuntimeError if a rebuild is already running."""
+        with self._lock:
+            if self.running:
+                raise RuntimeError("A rollup rebuild is already running")
+            self._status = {"running": True, "requested_by": requested_by, "started_at": datetime.utcnow()}
+            self._thread = threading.Thread(
+                target=self._run, args=(session_factory, working_minutes), name="rollup-rebuild", daemon=True
+            )
+            self._thread.start()
+        return self.status()
+
+    def status(self) -> dict:
+        return {**self._status, "running": self.running}
+
+    def _run(self, session_factory, working_minutes):
+        session = session_factory()
+        try:
+            cycles = rebuild_rollups(session, working_minutes)
+            session.commit()
+            self._status = {**self._status, "cycles": cycles, "error": None}
+            print(f"✅ Rebuilt rollups from {cycles} cycle(s)")
+        except Exception as e:
+            session.rollback()
+            self._status = {**self._status, "error": str(e)}
+            print(f"⚠️ Error rebuilding rollups: {e}")
+        finally:
+            session.close()
+            self._status = {**self._status, "finished_at": datetime.utcnow()}
+
+
+rollup_rebuild = RollupRebuild()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Production analytics rollups")
+    parser.add_argument("--rebuild", action="store_true", help="Regenerate every rollup from history")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        from database import SessionLocal
+        from main import calculate_working_minutes_with_pauses
+
+        session = SessionLocal()
+        try:
+            replayed = rebuild_rollups(session, calculate_working_minutes_with_pauses)
+            session.commit()
+            print(f"Rebuilt rollups from {replayed} cycle(s)")
+        finally:
+            session.close()
+    else:
+        parser.print_help()
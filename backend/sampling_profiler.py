@@ -0,0 +1,206 @@
+"""
+Profiler por amostragem para o worker em produção (sem reiniciar o uvicorn).
+
+A background thread reads sys._current_frames() every interval for N seconds
+and counts the stacks of every thread of this process: the event loop and the
+threadpool workers (sync endpoints, run_read fallback). Cost is one stack walk
+per thread per sample, nothing is traced in between.
+
+Samples where a thread is just waiting (event loop in select, idle pool
+worker) are counted apart and left out of the output. A sample whose stack
+goes through an endpoint function is attributed to that route, which gives the
+per-route hotspots (self and inclusive time below the endpoint).
+
+The stacks are written as collapsed stacks (flamegraph.pl, speedscope import)
+or as a speedscope JSON file. With several uvicorn workers, each one profiles
+only itself.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+PROFILER_OUTPUT_DIR = os.getenv(
+    "PROFILER_OUTPUT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+)
+PROFILER_MAX_SECONDS = 300
+HOTSPOTS_PER_ROUTE = 10
+NO_ROUTE = "(no route)"
+
+# Leaf frames of a thread that is blocked waiting for work
+IDLE_LEAVES = {
+    ("threading.py", "wait"), ("selectors.py", "select"), ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"), ("socket.py", "accept"),
+}
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    for root in sys.path:
+        if root and filename.startswith(root + os.sep):
+            filename = filename[len(root) + 1:]
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Uma captura por vez; o resultado da última fica em last_result."""
+
+    def __init__(self, output_dir: str = PROFILER_OUTPUT_DIR):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._status: dict = {"running": False}
+        self.last_result: Optional[dict] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval_ms: float = 10.0, output_format: str = "collapsed",
+              route_codes: Optional[Dict[object, str]] = None) -> dict:
+        """Starts a capture in the background. Raises RuntimeError if one is running."""
+        if output_format not in ("collapsed", "speedscope"):
+            raise ValueError("output_format must be 'collapsed' or 'speedscope'")
+        seconds = min(max(seconds, 1.0), PROFILER_MAX_SECONDS)
+        interval = max(interval_ms, 1.0) / 1000
+        with self._lock:
+            if self.running:
+                raise RuntimeError("A profile is already being captured")
+            self._stop.clear()
+            started = datetime.utcnow()
+            self._status = {
+                "running": True, "started_at": started, "seconds": seconds,
+                "interval_ms": interval * 1000, "format": output_format
+            }
+            self._thread = threading.Thread(
+                target=self._run, args=(seconds, interval, output_format, dict(route_codes or {}), started),
+                name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+        return dict(self._status)
+
+    def stop(self):
+        """Ends the running capture early; its file is still written."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=30)
+
+    def status(self) -> dict:
+        return {**self._status, "running": self.running, "last_result": self.last_result}
+
+    def _run(self, seconds, interval, output_format, route_codes, started):
+        own_ident = threading.get_ident()
+        stacks: Counter = Counter()          # (thread, frame labels root..leaf) -> samples
+        routes: Dict[tuple, str] = {}        # same key -> route
+        idle = 0
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline and not self._stop.wait(interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                samples += 1
+                leaf = frame.f_code
+                if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_LEAVES:
+                    idle += 1
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse()
+                key = (names.get(ident, str(ident)), tuple(codes))
+                stacks[key] += 1
+                if key not in routes:
+                    routes[key] = next((route_codes[c] for c in reversed(codes) if c in route_codes), NO_ROUTE)
+        try:
+            self.last_result = self._write(stacks, routes, route_codes, samples, idle, output_format, started)
+        except OSError as e:
+            print(f"⚠️ Could not write the profile: {e}")
+            self.last_result = {"error": str(e), "samples": samples}
+        self._status = {**self._status, "running": False, "finished_at": datetime.utcnow()}
+
+    def _write(self, stacks, routes, route_codes, samples, idle, output_format, started) -> dict:
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = started.strftime("%Y%m%d-%H%M%S")
+        labels: Dict[object, str] = {}
+
+        def label(code):
+            if code not in labels:
+                labels[code] = _frame_label(code)
+            return labels[code]
+
+        if output_format == "collapsed":
+            path = os.path.join(self.output_dir, f"profile-{stamp}.collapsed")
+            with open(path, "w") as f:
+                for (thread, codes), n in stacks.most_common():
+                    names = [thread.replace(";", ":")] + [label(c).replace(";", ":") for c in codes]
+                    f.write(f"{';'.join(names)} {n}\n")
+        else:
+            path = os.path.join(self.output_dir, f"profile-{stamp}.speedscope.json")
+            frame_index: Dict[str, int] = {}
+            frames: List[dict] = []
+            profiles = defaultdict(lambda: {"samples": [], "weights": []})
+            for (thread, codes), n in stacks.most_common():
+                indexes = []
+                for c in codes:
+                    name = label(c)
+                    if name not in frame_index:
+                        frame_index[name] = len(frames)
+                        frames.append({"name": c.co_name, "file": c.co_filename, "line": c.co_firstlineno})
+                    indexes.append(frame_index[name])
+                profiles[thread]["samples"].append(indexes)
+                profiles[thread]["weights"].append(n)
+            with open(path, "w") as f:
+                json.dump({
+                    "$schema": "https://www.speedscope.app/file-format-schema.json",
+                    "name": f"SGP API {stamp}",
+                    "shared": {"frames": frames},
+                    "profiles": [
+                        {"type": "sampled", "name": thread, "unit": "none", "startValue": 0,
+                         "endValue": sum(p["weights"]), **p}
+                        for thread, p in profiles.items()
+                    ]
+                }, f)
+
+        return {
+            "file": path, "format": output_format, "samples": samples, "idle_samples": idle,
+            "routes": self._hotspots(stacks, routes, route_codes, label)
+        }
+
+    @staticmethod
+    def _hotspots(stacks, routes, route_codes, label) -> List[dict]:
+        """Por rota: amostras, funções com mais tempo próprio e mais tempo inclusivo abaixo do endpoint."""
+        per_route = defaultdict(lambda: {"samples": 0, "self": Counter(), "inclusive": Counter()})
+        for key, n in stacks.items():
+            codes = key[1]
+            route = routes[key]
+            entry = per_route[route]
+            entry["samples"] += n
+            entry["self"][label(codes[-1])] += n
+            below = codes
+            if route != NO_ROUTE:
+                start = max(i for i, c in enumerate(codes) if c in route_codes)
+                below = codes[start:]
+            for name in {label(c) for c in below}:
+                entry["inclusive"][name] += n
+        return [
+            {
+                "route": route, "samples": entry["samples"],
+                "self": [{"function": f, "samples": n} for f, n in entry["self"].most_common(HOTSPOTS_PER_ROUTE)],
+                "inclusive": [{"function": f, "samples": n}
+                              for f, n in entry["inclusive"].most_common(HOTSPOTS_PER_ROUTE)]
+            }
+            for route, entry in sorted(per_route.items(), key=lambda item: -item[1]["samples"])
+        ]
+
+
+sampling_profiler = SamplingProfiler()
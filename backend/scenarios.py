@@ -0,0 +1,147 @@
+import hashlib
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+
+from engine import balance_line, calculate_tl
+from process_pool import PLANNING_WORKERS, get_process_pool
+from shift_calendar import ShiftCalendar
+
+SCENARIO_CACHE_SIZE = int(os.getenv("SCENARIO_CACHE_SIZE", "64"))
+# Below this many balance runs the pool start-up costs more than it saves
+SCENARIO_POOL_MIN_TASKS = int(os.getenv("SCENARIO_POOL_MIN_TASKS", "16"))
+
+
+def _evaluate_task(ops: List[dict], efficiency_factor: float, operators: int, batch_size: int,
+                   pulses: List[int], shift: dict) -> List[dict]:
+    """
+    Balances the line once for (operators, batch_size) and derives every pulse
+    of the grid from it: the balance itself does not depend on the pulse.
+    """
+    balance = balance_line(
+        ops, list(range(operators)), max(pulses), efficiency_factor=efficiency_factor,
+        batch_size=batch_size, mode="heuristic"
+    )
+    metrics = balance["metrics"] if balance["feasible"] else None
+    bottleneck = metrics["bottleneck_minutes"] if metrics else None
+
+    points = []
+    for pulse in pulses:
+        point = {
+            "operators": operators,
+            "batch_size": batch_size,
+            "pulse_duration": pulse,
+            "feasible": metrics is not None,
+            "bottleneck_minutes": bottleneck,
+            "balance_efficiency": metrics["balance_efficiency"] if metrics else None
+        }
+        if metrics:
+            # A cart leaves every pulse, unless the bottleneck station holds it longer
+            cycle = max(float(pulse), bottleneck)
+            carts_per_shift = math.floor(shift["minutes"] / cycle) if shift["minutes"] else 0
+            carts_needed = math.ceil(shift["total_quantity"] / batch_size)
+            minutes_needed = carts_needed * cycle
+            point.update({
+                "fits_pulse": bottleneck <= pulse,
+                "cycle_minutes": round(cycle, 4),
+                "throughput_per_hour": round(batch_size / cycle * 60, 2),
+                "carts_per_shift": carts_per_shift,
+                "pieces_per_shift": carts_per_shift * batch_size,
+                "carts_needed": carts_needed,
+                "working_minutes_needed": round(minutes_needed, 2),
+                "shifts_needed": round(minutes_needed / shift["minutes"], 2) if shift["minutes"] else None
+            })
+        points.append(point)
+    return points
+
+
+def _evaluate_chunk(ops: List[dict], efficiency_factor: float, tasks: List[tuple], shift: dict) -> List[dict]:
+    points = []
+    for operators, batch_size, pulses in tasks:
+        points.extend(_evaluate_task(ops, efficiency_factor, operators, batch_size, pulses, shift))
+    return points
+
+
+class ScenarioRunner:
+    """
+    Simulação what-if (TL x pulso x costureiras) de uma PSO.
+
+    Each distinct (operators, batch_size) pair is one balance run; the runs
+    are split in chunks over a process pool. Finished sweeps are kept in an
+    LRU keyed by the PSO version, its operation times and the grid; the
+    finish time depends on the start instant, so it is added after the cache.
+    """
+
+    def __init__(self, workers: int = PLANNING_WORKERS, cache_size: int = SCENARIO_CACHE_SIZE):
+        self._workers = max(1, workers)
+        self._cache_size = cache_size
+        self._cache: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(pso_key: dict, ops: List[dict], request: dict) -> str:
+        payload = json.dumps({"pso": pso_key, "ops": ops, "request": request}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def run(self, pso_key: dict, ops: List[dict], efficiency_factor: float, operator_counts: List[int],
+            pulse_durations: List[int], batch_sizes: Optional[List[int]], total_quantity: int,
+            calendar: ShiftCalendar, start_at: datetime) -> dict:
+        request = {
+            "operators": operator_counts, "pulses": pulse_durations, "batch_sizes": batch_sizes,
+            "total_quantity": total_quantity, "shift": calendar.config
+        }
+        key = self.cache_key(pso_key, ops, request)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+        if cached is not None:
+            return {"points": self._with_finish(cached, start_at, calendar), "cached": True}
+
+        shift = {
+            "minutes": calendar.day_minutes,
+            "total_quantity": total_quantity
+        }
+        total_tp = sum(op["final_time"] or 0.0 for op in ops) / (efficiency_factor or 1.0)
+
+        # Group the grid by balance run: {(operators, batch_size): [pulses]}
+        runs = OrderedDict()
+        for operators in operator_counts:
+            for pulse in pulse_durations:
+                sizes = batch_sizes or [max(1, calculate_tl(operators, pulse, total_tp))]
+                for batch_size in sizes:
+                    runs.setdefault((operators, batch_size), []).append(pulse)
+        tasks = [(operators, batch_size, pulses) for (operators, batch_size), pulses in runs.items()]
+
+        if len(tasks) < SCENARIO_POOL_MIN_TASKS or self._workers == 1:
+            points = _evaluate_chunk(ops, efficiency_factor, tasks, shift)
+        else:
+            n_chunks = min(len(tasks), self._workers * 4)
+            chunks = [tasks[i::n_chunks] for i in range(n_chunks)]
+            pool = get_process_pool()
+            futures = [pool.submit(_evaluate_chunk, ops, efficiency_factor, chunk, shift) for chunk in chunks]
+            points = [point for future in futures for point in future.result()]
+
+        points.sort(key=lambda p: (p["operators"], p["pulse_duration"], p["batch_size"]))
+        with self._lock:
+            self._cache[key] = points
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return {"points": self._with_finish(points, start_at, calendar), "cached": False}
+
+    @staticmethod
+    def _with_finish(points: List[dict], start_at: datetime, calendar: ShiftCalendar) -> List[dict]:
+        result = []
+        for point in points:
+            point = dict(point)
+            if point["feasible"]:
+                point["finish_at"] = calendar.add_working_minutes(start_at, point["working_minutes_needed"])
+            result.append(point)
+        return result
+
+
+scenario_runner = ScenarioRunner()
@@ -0,0 +1,222 @@
+"""
+Calendário de turno compilado.
+
+The SHIFT_CONFIG is compiled once into the productive windows of a day
+(start_time..end_time minus the breaks) with their cumulative minutes, plus
+the weekly workdays and the holidays. Any instant then maps to its working
+minute offset since 0001-01-01 in O(log n) (bisect over the windows and the
+holidays), so working minutes between two instants are offset(b) - offset(a),
+whatever the number of days, weekends or holidays in between.
+
+Times are compared as stored (naive datetimes against the "HH:MM" of the
+config), like the rest of the backend.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+import models
+
+DEFAULT_SHIFT_CONFIG = {
+    "start_time": "07:00",
+    "end_time": "17:00",
+    "breaks": [
+        {"start": "12:00", "end": "13:00"}
+    ]
+}
+# Monday=0 .. Sunday=6 (date.weekday); every day is a workday unless configured
+ALL_WEEKDAYS = [0, 1, 2, 3, 4, 5, 6]
+
+# Safety net for a config saved by another process (e.g. a second uvicorn worker)
+SHIFT_CALENDAR_TTL_SECONDS = float(os.getenv("SHIFT_CALENDAR_TTL_SECONDS", "60"))
+
+
+def _parse_hhmm(value: str) -> int:
+    parsed = datetime.strptime(value, "%H:%M")
+    return parsed.hour * 60 + parsed.minute
+
+
+def shift_windows(shift_config: dict) -> List[tuple]:
+    """
+    Janelas produtivas do turno em minutos desde 00:00: [(início, fim)],
+    ou seja, start_time..end_time menos os intervalos (almoço, café).
+    """
+    start = _parse_hhmm(shift_config.get("start_time", "07:00"))
+    end = _parse_hhmm(shift_config.get("end_time", "17:00"))
+    windows = [(start, end)] if end > start else []
+
+    for brk in shift_config.get("breaks", []):
+        try:
+            b_start, b_end = _parse_hhmm(brk["start"]), _parse_hhmm(brk["end"])
+        except (KeyError, ValueError):
+            continue
+        cut = []
+        for w_start, w_end in windows:
+            if b_end <= w_start or b_start >= w_end:
+                cut.append((w_start, w_end))
+                continue
+            if b_start > w_start:
+                cut.append((w_start, b_start))
+            if b_end < w_end:
+                cut.append((b_end, w_end))
+        windows = cut
+    return windows
+
+
+def _minute_of_day(dt: datetime) -> float:
+    return dt.hour * 60 + dt.minute + dt.second / 60 + dt.microsecond / 60_000_000
+
+
+class ShiftCalendar:
+    """
+    SHIFT_CONFIG compilado. Optional keys on top of start/end/breaks:
+    workdays (weekday numbers, Monday=0) and holidays (["YYYY-MM-DD"]).
+    Raises ValueError on a malformed workday or holiday.
+    """
+
+    def __init__(self, shift_config: dict):
+        self.config = shift_config
+        self.windows = shift_windows(shift_config)
+        self._starts = [start for start, _ in self.windows]
+        # Working minutes of the day before each window / up to its end
+        self._before = []
+        self._through = []
+        total = 0.0
+        for start, end in self.windows:
+            self._before.append(total)
+            total += end - start
+            self._through.append(total)
+        self.day_minutes = total
+
+        workdays = shift_config.get("workdays")
+        workdays = ALL_WEEKDAYS if workdays is None else workdays
+        if any(not isinstance(d, int) or d < 0 or d > 6 for d in workdays):
+            raise ValueError("workdays must be weekday numbers between 0 (Monday) and 6 (Sunday)")
+        self.workdays = sorted(set(workdays))
+        is_workday = [d in self.workdays for d in range(7)]
+        # Workdays among the first k weekdays of a week (date(1, 1, 1) is a Monday)
+        self._week_prefix = [0]
+        for flag in is_workday:
+            self._week_prefix.append(self._week_prefix[-1] + flag)
+        self._is_workday = is_workday
+
+        holidays = {date.fromisoformat(h).toordinal() for h in shift_config.get("holidays", []) or []}
+        self.holidays = sorted(date.fromordinal(o).isoformat() for o in holidays)
+        # Only holidays falling on a workday remove time
+        self._holidays = sorted(o for o in holidays if is_workday[(o - 1) % 7])
+
+    def is_working_day(self, day: date) -> bool:
+        ordinal = day.toordinal()
+        if not self._is_workday[(ordinal - 1) % 7]:
+            return False
+        i = bisect_left(self._holidays, ordinal)
+        return i == len(self._holidays) or self._holidays[i] != ordinal
+
+    def _days_before(self, ordinal: int) -> int:
+        """Working days strictly before the given date ordinal."""
+        weeks, rest = divmod(ordinal - 1, 7)
+        return weeks * self._week_prefix[7] + self._week_prefix[rest] - bisect_left(self._holidays, ordinal)
+
+    def _within_day(self, minute: float) -> float:
+        i = bisect_right(self._starts, minute) - 1
+        if i < 0:
+            return 0.0
+        start, end = self.windows[i]
+        return self._before[i] + min(minute, end) - start
+
+    def offset(self, dt: datetime) -> float:
+        """Working minutes from 0001-01-01 00:00 up to dt."""
+        day = dt.date()
+        minutes = self._days_before(day.toordinal()) * self.day_minutes
+        if self.is_working_day(day):
+            minutes += self._within_day(_minute_of_day(dt))
+        return minutes
+
+    def working_minutes(self, start_dt: datetime, end_dt: datetime) -> float:
+        """Working minutes in [start_dt, end_dt]: only shift windows of working days count."""
+        if end_dt <= start_dt:
+            return 0.0
+        return max(self.offset(end_dt) - self.offset(start_dt), 0.0)
+
+    def add_working_minutes(self, start_dt: datetime, minutes: float) -> Optional[datetime]:
+        """
+        Instante em que `minutes` de trabalho a partir de start_dt se completam
+        (inverso de offset). None se o calendário não tem tempo produtivo.
+        """
+        if self.day_minutes <= 0 or not self.workdays:
+            return None
+        if minutes <= 0:
+            return start_dt
+        target = self.offset(start_dt) + minutes
+        days, rest = divmod(target, self.day_minutes)
+        days = int(days)
+        if rest == 0 and days > 0:
+            # Exactly a day's worth: the end of the previous working day
+            days, rest = days - 1, self.day_minutes
+
+        # First date with `days` working days before it that is itself a working day
+        lo = start_dt.toordinal()
+        per_week = self._week_prefix[7]
+        hi = lo + 7 * ((days - self._days_before(lo)) // per_week + 2) + len(self._holidays)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._days_before(mid + 1) > days:
+                hi = mid
+            else:
+                lo = mid + 1
+
+        i = min(bisect_left(self._through, rest), len(self.windows) - 1)
+        minute = self.windows[i][0] + rest - self._before[i]
+        return datetime.combine(date.fromordinal(lo), datetime.min.time()) + timedelta(minutes=minute)
+
+    def to_dict(self) -> dict:
+        """Forma compacta para o front (Monitor): janelas, dias úteis e feriados."""
+        return {
+            "windows": [list(w) for w in self.windows],
+            "workdays": self.workdays,
+            "holidays": self.holidays
+        }
+
+
+class ShiftCalendarCache:
+    """
+    Calendário compilado em memória. invalidate() on every save of
+    /api/config/shift; the TTL covers saves made by other processes.
+    """
+
+    def __init__(self, ttl_seconds: float = SHIFT_CALENDAR_TTL_SECONDS):
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._calendar: Optional[ShiftCalendar] = None
+        self._loaded_at = 0.0
+
+    def get(self, db: Session) -> ShiftCalendar:
+        with self._lock:
+            if self._calendar is not None and time.monotonic() - self._loaded_at < self._ttl:
+                return self._calendar
+
+        entry = db.query(models.SystemConfig).filter(models.SystemConfig.key == "SHIFT_CONFIG").first()
+        config = json.loads(entry.value) if entry else DEFAULT_SHIFT_CONFIG
+        try:
+            calendar = ShiftCalendar(config)
+        except ValueError as e:
+            print(f"[SHIFT] Invalid SHIFT_CONFIG ({e}), using default calendar")
+            calendar = ShiftCalendar(DEFAULT_SHIFT_CONFIG)
+
+        with self._lock:
+            self._calendar = calendar
+            self._loaded_at = time.monotonic()
+        return calendar
+
+    def invalidate(self):
+        with self._lock:
+            self._calendar = None
+
+
+shift_calendar_cache = ShiftCalendarCache()
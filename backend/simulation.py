@@ -0,0 +1,184 @@
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+
+from process_pool import PLANNING_WORKERS, get_process_pool
+from shift_calendar import ShiftCalendar
+
+# Replications per task: fixed so a seed gives the same result with any number of workers
+REPLICATIONS_PER_CHUNK = 250
+MIN_EFFICIENCY = 0.2
+# Float noise of checkout differences, well below what the pulse rule can see
+CYCLE_TOLERANCE_MINUTES = 1e-6
+
+
+@dataclass
+class CartFlowModel:
+    """
+    Planejamento a simular: postos na ordem do fluxo e a sequência de carrinhos.
+
+    station_minutes holds the standard minutes each station spends on a full
+    cart (sum of final_time x executed_quantity of its OperationAllocations).
+    """
+    station_ids: List[int]
+    station_minutes: List[float]
+    batch_size: int
+    cart_quantities: List[int]
+    pulse_duration: int
+    efficiency_mean: float = 1.0
+    efficiency_sd: float = 0.1
+
+
+def simulate_replications(model: CartFlowModel, replications: int, seed_sequence) -> dict:
+    """
+    Runs `replications` independent shifts of the cart flow, vectorized over
+    replications and stations.
+
+    The cell is a pipeline paced by the metronome: cart c is released at
+    c x pulse, and it enters station s once station s has finished cart c-1
+    and station s-1 has passed on its first piece. Inside the cart the pieces
+    flow one by one, so station s finishes at max(start[s] + W[s],
+    finish[s-1] + w[s]), where W is its time for the whole cart and w its
+    time per piece. A balanced line settles at one cart per
+    max(pulse, max W). Every station's efficiency is drawn per cart. Times
+    are in working minutes (breaks and time off shift removed), counted from
+    the start of the planning.
+    """
+    rng = np.random.default_rng(seed_sequence)
+    full_cart = np.asarray(model.station_minutes, dtype=np.float64)
+    n_stations = full_cart.size
+    quantities = np.asarray(model.cart_quantities, dtype=np.float64)
+
+    checkout = np.empty((replications, quantities.size))
+    busy = np.zeros((replications, n_stations))
+    finish = np.zeros((replications, n_stations))
+
+    for c, qty in enumerate(quantities):
+        efficiency = rng.normal(model.efficiency_mean, model.efficiency_sd, size=(replications, n_stations))
+        work = full_cart * (qty / model.batch_size) / np.maximum(efficiency, MIN_EFFICIENCY)
+        per_piece = np.cumsum(work / qty, axis=1)
+        before = per_piece - work / qty
+        # Station free (finish of cart c-1), or the first piece handed over from upstream
+        ready = finish.copy()
+        ready[:, 0] = np.maximum(ready[:, 0], c * model.pulse_duration)
+        start = np.maximum.accumulate(ready - before, axis=1) + before
+        # finish[s] - per_piece[s] is a running max over stations (one-piece-flow recursion)
+        finish = np.maximum.accumulate(start + work - per_piece, axis=1) + per_piece
+        checkout[:, c] = finish[:, -1]
+        busy += work
+
+    return {"checkout": checkout, "busy": busy}
+
+
+def _line_fill_minutes(model: CartFlowModel) -> float:
+    """
+    Time the first cart spends filling the line at the mean efficiency: its
+    checkout minus the bottleneck time. Not a delay, so it is left out of
+    the first cart's cycle.
+    """
+    qty = model.cart_quantities[0]
+    work = np.asarray(model.station_minutes, dtype=np.float64) * (qty / model.batch_size) / \
+        max(model.efficiency_mean, MIN_EFFICIENCY)
+    per_piece = np.cumsum(work / qty)
+    # simulate_replications with an empty line: station s starts when the first piece reaches it
+    first_checkout = (np.maximum.accumulate(work - work / qty) + per_piece)[-1]
+    return float(first_checkout - work.max())
+
+
+def _simulate_chunk(model: CartFlowModel, replications: int, seed_sequence) -> dict:
+    return simulate_replications(model, replications, seed_sequence)
+
+
+def run_monte_carlo(
+    model: CartFlowModel,
+    replications: int = 500,
+    seed: Optional[int] = None,
+    start_at: Optional[datetime] = None,
+    calendar: Optional[ShiftCalendar] = None,
+    use_pool: bool = True
+) -> dict:
+    """
+    Previsão de um planejamento antes de publicar (Monte Carlo da simulação).
+
+    Args:
+        model: Postos, carrinhos e eficiência do planejamento.
+        replications: Número de turnos simulados.
+        seed: Semente; o mesmo seed reproduz o resultado (com ou sem pool).
+        start_at: Início previsto; converte minutos trabalhados em horário.
+        calendar: Calendário de turno (dias úteis, intervalos e feriados).
+        use_pool: Distribui os lotes de replicações no pool de processos.
+
+    Returns:
+        dict: carts (checkout previsto e probabilidade de atraso por carrinho),
+        stations, bottleneck e summary.
+    """
+    started = time.perf_counter()
+    sizes = [REPLICATIONS_PER_CHUNK] * (replications // REPLICATIONS_PER_CHUNK)
+    if replications % REPLICATIONS_PER_CHUNK:
+        sizes.append(replications % REPLICATIONS_PER_CHUNK)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if use_pool and len(sizes) > 1 and PLANNING_WORKERS > 1:
+        pool = get_process_pool()
+        futures = [pool.submit(_simulate_chunk, model, n, s) for n, s in zip(sizes, seeds)]
+        parts = [future.result() for future in futures]
+    else:
+        parts = [simulate_replications(model, n, s) for n, s in zip(sizes, seeds)]
+
+    checkout = np.concatenate([p["checkout"] for p in parts])
+    busy = np.concatenate([p["busy"] for p in parts])
+
+    # Same rule as checkout_batch: delayed when the cart took longer than one pulse
+    cycle = np.diff(checkout, axis=1, prepend=_line_fill_minutes(model))
+    delayed = cycle > model.pulse_duration + CYCLE_TOLERANCE_MINUTES
+    makespan = checkout[:, -1]
+    utilization = (busy / makespan[:, np.newaxis]).mean(axis=0)
+    mean_checkout = checkout.mean(axis=0)
+    p10, p90 = np.percentile(checkout, [10, 90], axis=0)
+
+    def to_datetime(minutes):
+        if start_at is None or calendar is None:
+            return None
+        return calendar.add_working_minutes(start_at, float(minutes))
+
+    carts = []
+    for c, qty in enumerate(model.cart_quantities):
+        carts.append({
+            "sequence": c + 1,
+            "quantity": int(qty),
+            "expected_checkout_minutes": round(float(mean_checkout[c]), 2),
+            "checkout_p10_minutes": round(float(p10[c]), 2),
+            "checkout_p90_minutes": round(float(p90[c]), 2),
+            "expected_checkout_at": to_datetime(mean_checkout[c]),
+            "expected_cycle_minutes": round(float(cycle[:, c].mean()), 2),
+            "delay_probability": round(float(delayed[:, c].mean()), 4)
+        })
+
+    stations = [
+        {
+            "workstation_id": ws_id,
+            "load_minutes": round(float(load), 4),
+            "utilization": round(float(u) * 100, 1)
+        }
+        for ws_id, load, u in zip(model.station_ids, model.station_minutes, utilization)
+    ]
+    bottleneck = max(stations, key=lambda s: s["utilization"])
+
+    return {
+        "carts": carts,
+        "stations": stations,
+        "bottleneck": bottleneck,
+        "summary": {
+            "replications": int(checkout.shape[0]),
+            "seed": seed,
+            "expected_makespan_minutes": round(float(makespan.mean()), 2),
+            "makespan_p90_minutes": round(float(np.percentile(makespan, 90)), 2),
+            "expected_finish_at": to_datetime(makespan.mean()),
+            "expected_delayed_carts": round(float(delayed.sum(axis=1).mean()), 2),
+            "probability_any_delay": round(float(delayed.any(axis=1).mean()), 4),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+    }
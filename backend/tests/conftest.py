@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# database.py reads the URL on import: the tests get a scratch SQLite database
+_scratch = tempfile.mkdtemp(prefix="sgp_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'tests.db')}"
+os.environ["DB_ASYNC"] = "false"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
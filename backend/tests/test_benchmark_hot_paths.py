@@ -0,0 +1,187 @@
+"""
+Benchmarks dos caminhos quentes de cálculo (engine, tempo trabalhado e BI).
+
+Times the functions every planning, checkout, Monitor poll and BI screen
+goes through, on fixed datasets:
+    engine.calculate_tl
+    engine.summarize_operations / evaluate_allocations   10, 100, 1000 operations
+    carts.split_cart_quantities (sync_planning)          10, 100, 1000 carts
+    calculate_working_minutes                            1, 30, 365 days
+    calculate_working_minutes_with_pauses                1, 30, 365 days of events
+    get_analytics_rollups (efficiency per day)           1, 30, 365 days of rollups
+
+The time and analytics functions are main's, on the scratch SQLite database
+of conftest.py (pause timelines and shift calendar warm, as in production).
+
+The baseline is stored in .benchmarks/ (per machine, one folder each). Run
+from backend/:
+    python -m pytest tests/test_benchmark_hot_paths.py --benchmark-save=baseline
+    python -m pytest tests/test_benchmark_hot_paths.py --benchmark-compare --benchmark-compare-fail=median:15%
+The second run fails when a case is more than 15% slower than the latest
+saved run (--benchmark-compare=0001 picks a given one).
+"""
+import random
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+SIZES = [10, 100, 1000]
+EVENT_LOG_DAYS = [1, 30, 365]
+# Fixed "now" (a Monday after the shift): the same windows on every run
+NOW = datetime(2025, 6, 30, 18, 0)
+MACHINES = ["RETA", "OVERLOCK", "COBERTURA", "GALONEIRA", "MANUAL"]
+ROLLUP_SEAMSTRESSES = 12
+ROLLUP_PLANNING_ID = 100
+
+
+def _rng(*key) -> random.Random:
+    # One generator per dataset: a case's data does not depend on which cases run
+    return random.Random(":".join(map(str, (42,) + key)))
+
+
+@pytest.fixture(scope="module")
+def db():
+    import logging
+    logging.disable(logging.INFO)
+    from database import SessionLocal
+    import main  # noqa: F401  (creates the tables)
+
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture(scope="module")
+def event_logs(db):
+    """One planning per log length, ~4 pauses per working day. Returns {days: planning_id}."""
+    import models
+    from main import get_shift_calendar
+    from sqlalchemy import insert
+
+    calendar = get_shift_calendar(db)
+    plannings = {}
+    for planning_id, days in enumerate(EVENT_LOG_DAYS, start=1):
+        rng = _rng("events", days)
+        start = NOW - timedelta(days=days)
+        db.add(models.ProductionOrder(id=planning_id, product_reference=f"BENCH-{days}", quantity=1000,
+                                      status="Concluída", created_at=start))
+        db.add(models.ProductionPlanning(id=planning_id, production_order_id=planning_id, version_name=f"bench-{days}d",
+                                         pulse_duration=60, batch_size=40, total_quantity=1000,
+                                         is_active=False, created_at=start))
+        events = [{"planning_id": planning_id, "event_type": "start", "created_at": start}]
+        cursor = start
+        while True:
+            pause_at = calendar.add_working_minutes(cursor, rng.uniform(60, 180))
+            if pause_at is None or pause_at >= NOW:
+                break
+            cursor = calendar.add_working_minutes(pause_at, rng.uniform(2, 25))
+            events.append({"planning_id": planning_id, "event_type": "pause", "created_at": pause_at})
+            events.append({"planning_id": planning_id, "event_type": "resume", "created_at": cursor})
+        db.flush()
+        db.execute(insert(models.ProductionEvent), events)
+        plannings[days] = planning_id
+    db.commit()
+    return plannings
+
+
+@pytest.fixture(scope="module")
+def rollup_history(db):
+    """Hourly rollups (cell + 12 seamstresses, 07h-17h) for each of the last 365 days."""
+    import models
+    from rollups import hour_bucket
+    from sqlalchemy import insert
+
+    rng = _rng("rollups")
+    rows = []
+    today = hour_bucket(datetime.utcnow()).replace(hour=0)
+    for day in range(max(EVENT_LOG_DAYS)):
+        for hour in range(7, 17):
+            hour_start = today - timedelta(days=day) + timedelta(hours=hour)
+            for seamstress_id in [None] + list(range(1, ROLLUP_SEAMSTRESSES + 1)):
+                carts = rng.randint(0, 2)
+                rows.append({
+                    "planning_id": ROLLUP_PLANNING_ID, "pso_id": 1, "seamstress_id": seamstress_id,
+                    "hour_start": hour_start, "pieces": carts * 40, "carts": carts,
+                    "delayed_carts": rng.randint(0, carts), "standard_minutes": carts * rng.uniform(40, 60),
+                    "worked_minutes": carts * rng.uniform(50, 70), "last_checkout_at": hour_start
+                })
+    db.execute(insert(models.ProductionRollup), rows)
+    db.commit()
+    return len(rows)
+
+
+@pytest.mark.benchmark(group="engine")
+def test_calculate_tl(benchmark):
+    from engine import calculate_tl
+    benchmark(calculate_tl, 12, 60, 7.35)
+
+
+@pytest.mark.benchmark(group="engine")
+@pytest.mark.parametrize("n", SIZES)
+def test_summarize_operations(benchmark, n):
+    from engine import summarize_operations
+    rng = _rng("ops", n)
+    ops = [
+        SimpleNamespace(final_time=round(rng.uniform(0.05, 1.5), 3), is_active=rng.random() > 0.05,
+                        macro_machine=rng.choice(MACHINES))
+        for _ in range(n)
+    ]
+    benchmark(summarize_operations, ops)
+
+
+@pytest.mark.benchmark(group="engine")
+@pytest.mark.parametrize("n", SIZES)
+def test_evaluate_allocations(benchmark, n):
+    from engine import evaluate_allocations
+    rng = _rng("balance", n)
+    # One contiguous balance, as the Cockpit evaluates it after every drag
+    times = np.array([rng.uniform(0.05, 1.5) for _ in range(n)])
+    assignment = np.minimum(np.arange(n) * 12 // n, 11)
+    benchmark(evaluate_allocations, times, assignment, 12, 40, 60, efficiency_factor=0.85)
+
+
+@pytest.mark.benchmark(group="carts")
+@pytest.mark.parametrize("n", SIZES)
+def test_split_cart_quantities(benchmark, n):
+    from carts import split_cart_quantities
+    quantities = benchmark(split_cart_quantities, 37 * n - 5, 37)
+    assert len(quantities) == n
+
+
+@pytest.mark.benchmark(group="working-time")
+@pytest.mark.parametrize("days", EVENT_LOG_DAYS)
+def test_calculate_working_minutes(benchmark, db, days):
+    from main import calculate_working_minutes
+    benchmark(calculate_working_minutes, db, NOW - timedelta(days=days), NOW)
+
+
+@pytest.mark.benchmark(group="working-time")
+@pytest.mark.parametrize("days", EVENT_LOG_DAYS)
+def test_calculate_working_minutes_with_pauses(benchmark, db, event_logs, days):
+    from main import calculate_working_minutes_with_pauses
+    start = NOW - timedelta(days=days)
+    # Warm the pause timeline and its prefix sums, as the Monitor polling does
+    calculate_working_minutes_with_pauses(db, event_logs[days], start, NOW)
+    benchmark(calculate_working_minutes_with_pauses, db, event_logs[days], start, NOW)
+
+
+@pytest.mark.benchmark(group="working-time")
+@pytest.mark.parametrize("days", EVENT_LOG_DAYS)
+def test_calculate_working_minutes_with_pauses_one_cycle(benchmark, db, event_logs, days):
+    from main import calculate_working_minutes_with_pauses
+    # A window inside the log (a cycle of a long-running planning)
+    start = NOW - timedelta(days=days) / 2
+    calculate_working_minutes_with_pauses(db, event_logs[days], start, start + timedelta(hours=1))
+    benchmark(calculate_working_minutes_with_pauses, db, event_logs[days], start, start + timedelta(hours=1))
+
+
+@pytest.mark.benchmark(group="analytics")
+@pytest.mark.parametrize("by_seamstress", [False, True], ids=["cell", "by_seamstress"])
+@pytest.mark.parametrize("days", EVENT_LOG_DAYS)
+def test_analytics_rollup_efficiency(benchmark, db, rollup_history, days, by_seamstress):
+    from main import get_analytics_rollups
+    result = benchmark(get_analytics_rollups, days=days, granularity="day", pso_id=None,
+                       by_seamstress=by_seamstress, db=db)
+    assert result["series"] and all(0 <= row["efficiency"] for row in result["series"])
@@ -0,0 +1,47 @@
+from simulation import CartFlowModel, run_monte_carlo
+
+
+def simulate(station_minutes, efficiency_sd=0.0, batch_size=40, carts=30, pulse=60):
+    model = CartFlowModel(
+        station_ids=list(range(len(station_minutes))),
+        station_minutes=station_minutes,
+        batch_size=batch_size,
+        cart_quantities=[batch_size] * carts,
+        pulse_duration=pulse,
+        efficiency_sd=efficiency_sd
+    )
+    return run_monte_carlo(model, replications=300, seed=7, use_pool=False)
+
+
+def test_deterministic_plan_below_pulse_has_no_delays():
+    # 12 stations between 20 and 59.9 of 60 minutes, no efficiency spread
+    result = simulate([30.0, 54.0, 41.0, 59.9, 20.0, 50.0] * 2)
+
+    assert result["summary"]["probability_any_delay"] == 0.0
+    assert result["summary"]["expected_delayed_carts"] == 0.0
+    assert all(cart["delay_probability"] == 0.0 for cart in result["carts"])
+    # The metronome releases one cart per pulse; the first cycle is the bottleneck (line fill excluded)
+    assert [cart["expected_cycle_minutes"] for cart in result["carts"]] == [59.9] + [60.0] * 29
+
+
+def test_bottleneck_above_pulse_sets_the_cycle():
+    result = simulate([54.0] * 11 + [70.0])
+
+    assert all(cart["expected_cycle_minutes"] == 70.0 for cart in result["carts"])
+    assert result["summary"]["expected_delayed_carts"] == 30.0
+    assert result["bottleneck"]["workstation_id"] == 11
+
+
+def test_makespan_is_fill_plus_one_pulse_per_cart():
+    # Balanced line: one cart per pulse once the line is full, not one cart per line traversal
+    result = simulate([54.0] * 12, batch_size=20)
+    fill = 11 * 54.0 / 20
+
+    assert abs(result["summary"]["expected_makespan_minutes"] - (fill + 54.0 + 29 * 60)) < 0.01
+
+
+def test_same_seed_same_prediction():
+    first = simulate([54.0] * 12, efficiency_sd=0.1)
+    second = simulate([54.0] * 12, efficiency_sd=0.1)
+
+    assert first["carts"] == second["carts"]